@@ -26,6 +26,7 @@ from lasagne.updates import adam
 
 from modelzoo import adenet_v2_2, adenet_v2, adenet_2stream
 from utils.plotting_utils import print_network
+from utils.evaluation import evaluate_sequences
 
 
 def load_decoder(path, shapes, nonlinearities):
@@ -57,28 +58,7 @@ def evaluate_model2(X_val, y_val, mask_val, X_diff_val, window_size, eval_fn):
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, X_diff_val, window_size)
-    num_classes = output.shape[-1]
-    confusion_matrix = np.zeros((num_classes, num_classes), dtype='int')
-    ix = np.zeros((X_val.shape[0],), dtype='int')
-    seq_lens = np.sum(mask_val, axis=-1)
-
-    # for each example, we only consider argmax of the seq len
-    votes = np.zeros((num_classes,), dtype='int')
-    for i, eg in enumerate(output):
-        predictions = np.argmax(eg[:seq_lens[i]], axis=-1)
-        for cls in range(num_classes):
-            count = (predictions == cls).sum(axis=-1)
-            votes[cls] = count
-        ix[i] = np.argmax(votes)
-
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_sequences(output, y_val, mask_val)
 
 
 def presplit_dataprocessing(data_matrix, vidlens, config, stream_name, **kwargs):
@@ -22,6 +22,7 @@ from utils.datagen import *
 from utils.io import *
 from utils.draw_net import *
 from utils.regularization import early_stop, early_stop2
+from utils.evaluation import evaluate_sequences, evaluate_predictions
 from custom.objectives import temporal_softmax_loss
 from custom.nonlinearities import select_nonlinearity
 from modelzoo import adenet_v2, adenet_v2_3
@@ -163,18 +164,7 @@ def evaluate_model(X_val, y_val, mask_val, dct_val, window_size, eval_fn):
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, dct_val, window_size)
-    no_gps = output.shape[1]
-    confusion_matrix = np.zeros((no_gps, no_gps), dtype='int')
-
-    ix = np.argmax(output, axis=1)
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_predictions(output, y_val)
 
 
 def evaluate_model2(X_val, y_val, mask_val, X_diff_val, window_size, eval_fn):
@@ -189,28 +179,7 @@ def evaluate_model2(X_val, y_val, mask_val, X_diff_val, window_size, eval_fn):
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, X_diff_val, window_size)
-    num_classes = output.shape[-1]
-    confusion_matrix = np.zeros((num_classes, num_classes), dtype='int')
-    ix = np.zeros((X_val.shape[0],), dtype='int')
-    seq_lens = np.sum(mask_val, axis=-1)
-
-    # for each example, we only consider argmax of the seq len
-    votes = np.zeros((num_classes,), dtype='int')
-    for i, eg in enumerate(output):
-        predictions = np.argmax(eg[:seq_lens[i]], axis=-1)
-        for cls in range(num_classes):
-            count = (predictions == cls).sum(axis=-1)
-            votes[cls] = count
-        ix[i] = np.argmax(votes)
-
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_sequences(output, y_val, mask_val)
 
 
 def map_confusion(X_val, y_val, mask_val, dct_val, window_size, eval_fn):
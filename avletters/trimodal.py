@@ -21,6 +21,7 @@ from utils.data_structures import circular_list
 from utils.datagen import *
 from utils.io import *
 from utils.draw_net import *
+from utils.evaluation import evaluate_predictions
 from custom.layers import DeltaLayer
 from modelzoo import adenet_v1, deltanet, adenet_v2, adenet_v3, adenet_v4, adenet_v5, adenet_v6
 
@@ -151,18 +152,7 @@ def evaluate_model(X_val, y_val, mask_val, dct_val, diff_val, window_size, eval_
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, dct_val, diff_val, window_size)
-    no_gps = output.shape[1]
-    confusion_matrix = np.zeros((no_gps, no_gps), dtype='int')
-
-    ix = np.argmax(output, axis=1)
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_predictions(output, y_val)
 
 
 def parse_options():
@@ -19,6 +19,7 @@ from utils.data_structures import circular_list
 from utils.datagen import *
 from utils.io import *
 from utils.draw_net import draw_to_file
+from utils.evaluation import evaluate_predictions
 from custom.custom import DeltaLayer
 from modelzoo import adenet_v1, deltanet, adenet_v2, adenet_v3, adenet_v4, baseline_end2end
 
@@ -196,18 +197,7 @@ def evaluate_model(X_val, y_val, mask_val, eval_fn):
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val)
-    no_gps = output.shape[1]
-    confusion_matrix = np.zeros((no_gps, no_gps), dtype='int')
-
-    ix = np.argmax(output, axis=1)
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_predictions(output, y_val)
 
 
 def construct_lstm(input_size, lstm_size, output_size, train_data_gen, val_data_gen):
@@ -0,0 +1,105 @@
+from __future__ import print_function
+import sys
+sys.path.insert(0, '../')
+import time
+import argparse
+
+import numpy as np
+
+from utils.datagen import gen_lstm_batch_random, gen_lstm_batch_bucketed
+from utils.io import load_mat_file
+
+
+def compile_lstm(feature_len, lstm_size):
+    """
+    compile the forward pass of a single lstm layer to time batches against
+    :param feature_len: input feature length
+    :param lstm_size: number of lstm units
+    :return: theano function taking (X, mask)
+    """
+    import theano
+    import theano.tensor as T
+    from lasagne.layers import InputLayer, LSTMLayer, get_output
+
+    inputs = T.tensor3('inputs', dtype='float32')
+    mask = T.matrix('mask', dtype='uint8')
+    l_in = InputLayer((None, None, feature_len), inputs)
+    l_mask = InputLayer((None, None), mask)
+    l_lstm = LSTMLayer(l_in, lstm_size, mask_input=l_mask)
+    return theano.function([inputs, mask], get_output(l_lstm), allow_input_downcast=True)
+
+
+def run_epoch(datagen, batches_per_epoch, forward=None):
+    """
+    draw one epoch of batches from a generator
+    :return: epoch time, padded timesteps, total timesteps
+    """
+    padded = 0
+    total = 0
+    time_start = time.time()
+    for _ in range(batches_per_epoch):
+        X, y, m, idxs = next(datagen)
+        if forward is not None:
+            forward(X, m)
+        padded += m.size - np.sum(m)
+        total += m.size
+    return time.time() - time_start, padded, total
+
+
+def parse_options():
+    options = dict()
+    options['batchsize'] = 30
+    options['num_buckets'] = 5
+    options['epochs'] = 5
+    options['lstm_size'] = 0
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', help='[FILE] .mat data file to take the video lengths and features from, '
+                                       'random data is used if not specified')
+    parser.add_argument('--batchsize', help='number of videos per batch. Default: 30')
+    parser.add_argument('--num_buckets', help='number of length buckets. Default: 5')
+    parser.add_argument('--epochs', help='number of epochs to time. Default: 5')
+    parser.add_argument('--lstm_size', help='time the forward pass of an lstm of this size. Default: 0 (disabled)')
+    args = parser.parse_args()
+    if args.data:
+        options['data'] = args.data
+    for k in ['batchsize', 'num_buckets', 'epochs', 'lstm_size']:
+        if getattr(args, k):
+            options[k] = int(getattr(args, k))
+    return options
+
+
+def main():
+    options = parse_options()
+    if 'data' in options:
+        data = load_mat_file(options['data'])
+        X = data['dataMatrix'].astype('float32')
+        y = data['targetsVec'].reshape((-1,))
+        seqlens = data['videoLengthVec'].reshape((-1,)).astype(int)
+    else:
+        seqlens = np.random.randint(10, 90, size=800)
+        X = np.random.randn(np.sum(seqlens), 100).astype('float32')
+        y = np.repeat(np.random.randint(0, 10, size=len(seqlens)), seqlens)
+
+    batchsize = options['batchsize']
+    batches_per_epoch = int(np.ceil(len(seqlens) / float(batchsize)))
+    forward = compile_lstm(X.shape[1], options['lstm_size']) if options['lstm_size'] > 0 else None
+    print('{} videos, {} frames, {} batches per epoch'.format(len(seqlens), len(X), batches_per_epoch))
+
+    generators = [('random', gen_lstm_batch_random(X, y, seqlens, batchsize=batchsize)),
+                  ('bucketed', gen_lstm_batch_bucketed(X, y, seqlens, batchsize=batchsize,
+                                                       num_buckets=options['num_buckets']))]
+    for name, datagen in generators:
+        epoch_time = 0.
+        padded = 0
+        total = 0
+        for _ in range(options['epochs']):
+            t, p, n = run_epoch(datagen, batches_per_epoch, forward)
+            epoch_time += t
+            padded += p
+            total += n
+        print('{:>8}: padding ratio {:.3f}, epoch time {:.3f}s'.format(
+            name, padded / float(total), epoch_time / options['epochs']))
+
+
+if __name__ == '__main__':
+    main()
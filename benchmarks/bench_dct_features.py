@@ -0,0 +1,65 @@
+from __future__ import print_function
+import sys
+sys.path.insert(0, '../')
+import time
+import argparse
+
+import numpy as np
+from scipy import fftpack
+
+from utils.preprocessing import compute_dct_features, zigzag
+
+
+def per_frame_dct_features(X, image_shape, no_coeff):
+    """
+    reference implementation: 1D dct over the flattened frames followed by a zigzag traversal per frame
+    """
+    X_dct = fftpack.dct(X, norm='ortho')
+    return np.array([zigzag(x.reshape(image_shape))[1:no_coeff + 1] for x in X_dct])
+
+
+def time_fn(fn, repeats):
+    time_start = time.time()
+    for _ in range(repeats):
+        res = fn()
+    return (time.time() - time_start) / repeats, res
+
+
+def parse_options():
+    options = dict()
+    options['frames'] = 20000
+    options['height'] = 30
+    options['width'] = 40
+    options['no_coeff'] = 30
+    options['repeats'] = 3
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', help='number of frames. Default: 20000')
+    parser.add_argument('--height', help='image height. Default: 30')
+    parser.add_argument('--width', help='image width. Default: 40')
+    parser.add_argument('--no_coeff', help='number of dct coefficients. Default: 30')
+    parser.add_argument('--repeats', help='number of timed runs. Default: 3')
+    args = parser.parse_args()
+    for k in options.keys():
+        if getattr(args, k):
+            options[k] = int(getattr(args, k))
+    return options
+
+
+def main():
+    options = parse_options()
+    shape = (options['height'], options['width'])
+    no_coeff = options['no_coeff']
+    X = np.random.rand(options['frames'], shape[0] * shape[1]).astype('float32')
+    print('benchmarking zigzag dct features on {} frames of {}...'.format(len(X), shape))
+
+    per_frame_time, expected = time_fn(lambda: per_frame_dct_features(X, shape, no_coeff), options['repeats'])
+    gather_time, res = time_fn(lambda: compute_dct_features(X, shape, no_coeff, dct_2d=False), options['repeats'])
+    dct_2d_time, _ = time_fn(lambda: compute_dct_features(X, shape, no_coeff), options['repeats'])
+    print('  per frame zigzag: {:.3f}s'.format(per_frame_time))
+    print('   gather (1D dct): {:.3f}s'.format(gather_time))
+    print('   gather (2D dct): {:.3f}s'.format(dct_2d_time))
+    print('max difference to per frame zigzag: {}'.format(np.max(np.abs(expected - res))))
+
+
+if __name__ == '__main__':
+    main()
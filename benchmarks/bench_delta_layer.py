@@ -0,0 +1,86 @@
+from __future__ import print_function
+import sys
+sys.path.insert(0, '../')
+import time
+import argparse
+
+import numpy as np
+import theano
+import theano.tensor as T
+from lasagne.layers import InputLayer, get_output
+
+from custom.layers import DeltaLayer
+
+
+def build_functions(use_scan, input_shape):
+    """
+    compile forward and backward functions of a DeltaLayer
+    :param use_scan: use the nested scan implementation
+    :param input_shape: (batch size, time steps, features)
+    :return: compile time, forward function, backward function
+    """
+    window = T.iscalar('theta')
+    inputs = T.tensor3('inputs', dtype='float32')
+    l_in = InputLayer((None, None, input_shape[-1]), inputs)
+    l_delta = DeltaLayer(l_in, window, use_scan=use_scan)
+    output = get_output(l_delta)
+    grad = T.grad(output.sum(), inputs)
+
+    time_start = time.time()
+    forward = theano.function([inputs, window], output)
+    backward = theano.function([inputs, window], grad)
+    return time.time() - time_start, forward, backward
+
+
+def time_fn(fn, args, repeats):
+    fn(*args)  # warm up
+    time_start = time.time()
+    for _ in range(repeats):
+        res = fn(*args)
+    return (time.time() - time_start) / repeats, res
+
+
+def parse_options():
+    options = dict()
+    options['batchsize'] = 30
+    options['timesteps'] = 40
+    options['features'] = 50
+    options['window'] = 2
+    options['repeats'] = 10
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batchsize', help='number of sequences per batch. Default: 30')
+    parser.add_argument('--timesteps', help='number of time steps per sequence. Default: 40')
+    parser.add_argument('--features', help='number of features per time step. Default: 50')
+    parser.add_argument('--window', help='delta window size. Default: 2')
+    parser.add_argument('--repeats', help='number of timed runs. Default: 10')
+    args = parser.parse_args()
+    for k in options.keys():
+        if getattr(args, k):
+            options[k] = int(getattr(args, k))
+    return options
+
+
+def main():
+    theano.config.floatX = 'float32'
+    sys.setrecursionlimit(10000)
+    options = parse_options()
+    shape = (options['batchsize'], options['timesteps'], options['features'])
+    X = np.random.randn(*shape).astype('float32')
+    args = (X, options['window'])
+    print('benchmarking DeltaLayer on input {} with window {}...'.format(shape, options['window']))
+
+    results = {}
+    for name, use_scan in [('scan', True), ('batch', False)]:
+        compile_time, forward, backward = build_functions(use_scan, shape)
+        forward_time, output = time_fn(forward, args, options['repeats'])
+        backward_time, grad = time_fn(backward, args, options['repeats'])
+        results[name] = (output, grad)
+        print('{:>6}: compile {:.2f}s, forward {:.2f}ms, backward {:.2f}ms'.format(
+            name, compile_time, forward_time * 1000, backward_time * 1000))
+
+    print('max output difference: {}'.format(np.max(np.abs(results['scan'][0] - results['batch'][0]))))
+    print('max gradient difference: {}'.format(np.max(np.abs(results['scan'][1] - results['batch'][1]))))
+
+
+if __name__ == '__main__':
+    main()
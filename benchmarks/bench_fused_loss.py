@@ -0,0 +1,90 @@
+from __future__ import print_function
+import sys
+sys.path.insert(0, '../')
+import time
+import argparse
+
+import numpy as np
+import theano
+import theano.tensor as T
+import lasagne as las
+from lasagne.layers import InputLayer, LSTMLayer, DenseLayer, ReshapeLayer
+from lasagne.updates import adam
+
+from custom.objectives import temporal_softmax_loss, temporal_logsoftmax_loss
+
+
+def build_train_fn(fused, feature_len, lstm_size, output_classes):
+    """
+    compile the train step of an lstm classifier ending in a dense output layer
+    :param fused: output logits and train with temporal_logsoftmax_loss
+    :return: compile time, train function taking (X, y, mask)
+    """
+    inputs = T.tensor3('inputs', dtype='float32')
+    mask = T.matrix('mask', dtype='uint8')
+    targets = T.imatrix('targets')
+    l_in = InputLayer((None, None, feature_len), inputs)
+    l_mask = InputLayer((None, None), mask)
+    l_lstm = LSTMLayer(l_in, lstm_size, mask_input=l_mask)
+    l_reshape = ReshapeLayer(l_lstm, (-1, lstm_size))
+    l_dense = DenseLayer(l_reshape, num_units=output_classes,
+                         nonlinearity=las.nonlinearities.linear if fused else las.nonlinearities.softmax)
+    network = ReshapeLayer(l_dense, (-1, inputs.shape[1], output_classes))
+
+    predictions = las.layers.get_output(network)
+    if fused:
+        cost = temporal_logsoftmax_loss(predictions, targets, mask)
+    else:
+        cost = temporal_softmax_loss(predictions, targets, mask)
+    updates = adam(cost, las.layers.get_all_params(network, trainable=True))
+
+    time_start = time.time()
+    train = theano.function([inputs, targets, mask], cost, updates=updates, allow_input_downcast=True)
+    return time.time() - time_start, train
+
+
+def parse_options():
+    options = dict()
+    options['batchsize'] = 30
+    options['timesteps'] = 40
+    options['features'] = 50
+    options['lstm_size'] = 100
+    options['output_classes'] = 26
+    options['repeats'] = 20
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batchsize', help='number of sequences per batch. Default: 30')
+    parser.add_argument('--timesteps', help='number of time steps per sequence. Default: 40')
+    parser.add_argument('--features', help='number of features per time step. Default: 50')
+    parser.add_argument('--lstm_size', help='number of lstm units. Default: 100')
+    parser.add_argument('--output_classes', help='number of output classes. Default: 26')
+    parser.add_argument('--repeats', help='number of timed train steps. Default: 20')
+    args = parser.parse_args()
+    for k in options.keys():
+        if getattr(args, k):
+            options[k] = int(getattr(args, k))
+    return options
+
+
+def main():
+    theano.config.floatX = 'float32'
+    options = parse_options()
+    shape = (options['batchsize'], options['timesteps'], options['features'])
+    X = np.random.randn(*shape).astype('float32')
+    y = np.random.randint(0, options['output_classes'], size=shape[:2]).astype('int32')
+    seqlens = np.random.randint(1, shape[1] + 1, size=shape[0])
+    m = (np.arange(shape[1]) < seqlens[:, None]).astype('uint8')
+    print('benchmarking train step on input {} with {} classes...'.format(shape, options['output_classes']))
+
+    for name, fused in [('softmax', False), ('fused', True)]:
+        compile_time, train = build_train_fn(fused, options['features'], options['lstm_size'],
+                                             options['output_classes'])
+        train(X, y, m)  # warm up
+        time_start = time.time()
+        for _ in range(options['repeats']):
+            train(X, y, m)
+        step_time = (time.time() - time_start) / options['repeats']
+        print('{:>8}: compile {:.2f}s, train step {:.2f}ms'.format(name, compile_time, step_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+from __future__ import print_function
+import sys
+sys.path.insert(0, '../landmarking')
+import time
+import argparse
+
+import menpo.io as mio
+
+from landmarker_omp import ImageFitter, landmarks_to_row, NO_LANDMARKS
+
+
+def fit_video(frames, fitter):
+    """
+    fit all frames of a video
+    :return: fitting time, boolean list of frames that were fitted
+    """
+    fitter.reset()
+    fitted = []
+    time_start = time.time()
+    for i in range(len(frames)):
+        row = landmarks_to_row(fitter.fit_image(frames[i]))
+        fitted.append(row != [-1] * NO_LANDMARKS * 2)
+    return time.time() - time_start, fitted
+
+
+def parse_options():
+    options = dict()
+    options['model'] = '../config/shape_predictor_68_face_landmarks.dat'
+    options['track'] = 10
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', help='location of landmark model file. '
+                                        'Default: ../config/shape_predictor_68_face_landmarks.dat')
+    parser.add_argument('--track', help='run face detection every TRACK frames in tracking mode. Default: 10')
+    parser.add_argument('video', help='sample video')
+    args = parser.parse_args()
+    options['video'] = args.video
+    if args.model:
+        options['model'] = args.model
+    if args.track:
+        options['track'] = int(args.track)
+    return options
+
+
+def main():
+    options = parse_options()
+    frames = mio.import_video(options['video'], normalise=False)
+    print('benchmarking landmarking of {} ({} frames)...'.format(options['video'], len(frames)))
+    detect_time, detect_fitted = fit_video(frames, ImageFitter(options['model']))
+    track_time, track_fitted = fit_video(frames, ImageFitter(options['model'], options['track']))
+    recovered = sum(1 for d, t in zip(detect_fitted, track_fitted) if t and not d)
+    print('  detect every frame: {:.2f}s, {:.2f} frames/sec, {} frames without landmarks'.format(
+        detect_time, len(frames) / detect_time, detect_fitted.count(False)))
+    print('track, detect every {}: {:.2f}s, {:.2f} frames/sec, {} frames without landmarks'.format(
+        options['track'], track_time, len(frames) / track_time, track_fitted.count(False)))
+    print('speedup {:.2f}x, {} frames recovered'.format(detect_time / track_time, recovered))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,9 @@
+"""
+trains the cuave raw + difference image model with a validation split. Not run through
+runners/nstream.py: both streams come from the single [data] images file (the difference images
+are computed after the split), the encoders are 4 layer dbns loaded with load_dbn, and the split
+files, image size (30x50), input dimension, lstm size and classes are hard-coded here
+"""
 from __future__ import print_function
 import sys
 sys.path.insert(0, '../')
@@ -26,6 +32,7 @@ from lasagne.nonlinearities import rectify, linear
 
 from modelzoo import adenet_v2_2
 from utils.plotting_utils import print_network
+from utils.evaluation import evaluate_sequences, evaluate_predictions
 
 
 def load_dbn(path='models/oulu_ae.mat'):
@@ -68,18 +75,7 @@ def evaluate_model(X_val, y_val, mask_val, X_diff_val, window_size, eval_fn):
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, X_diff_val, window_size)
-    no_gps = output.shape[1]
-    confusion_matrix = np.zeros((no_gps, no_gps), dtype='int')
-
-    ix = np.argmax(output, axis=1)
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_predictions(output, y_val)
 
 
 def evaluate_model2(X_val, y_val, mask_val, X_diff_val, window_size, eval_fn):
@@ -94,28 +90,7 @@ def evaluate_model2(X_val, y_val, mask_val, X_diff_val, window_size, eval_fn):
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, X_diff_val, window_size)
-    num_classes = output.shape[-1]
-    confusion_matrix = np.zeros((num_classes, num_classes), dtype='int')
-    ix = np.zeros((X_val.shape[0],), dtype='int')
-    seq_lens = np.sum(mask_val, axis=-1)
-
-    # for each example, we only consider argmax of the seq len
-    votes = np.zeros((num_classes,), dtype='int')
-    for i, eg in enumerate(output):
-        predictions = np.argmax(eg[:seq_lens[i]], axis=-1)
-        for cls in range(num_classes):
-            count = (predictions == cls).sum(axis=-1)
-            votes[cls] = count
-        ix[i] = np.argmax(votes)
-
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_sequences(output, y_val, mask_val)
 
 
 def parse_options():
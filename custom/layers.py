@@ -107,15 +107,28 @@ class DeltaLayer(Layer):
     Layer to add delta coefficients to input sequence,
     Appends 1st and 2nd order delta and acceleration coefficients to input sequence
     """
-    def __init__(self, incoming, window, **kwargs):
+    def __init__(self, incoming, window, mask=None, use_scan=False, **kwargs):
+        """
+        Constructs a Delta layer
+        :param incoming: incoming layer
+        :param window: delta window size theano variable
+        :param mask: optional mask input layer, replicates the last valid frame of each sequence
+            instead of the padding
+        :param use_scan: compute the coefficients with the original nested scan implementation
+        :param kwargs: arguments to pass down
+        """
         super(DeltaLayer, self).__init__(incoming, **kwargs)
         self.window = window
+        self.mask = mask
+        self.use_scan = use_scan
 
     def get_output_for(self, input, **kwargs):
-
-        # compute delta coefficients for multiple sequences
-        res, _ = theano.scan(utils.signal.append_delta_coeff, sequences=input, non_sequences=self.window)
-        return res
+        if self.use_scan:
+            # compute delta coefficients for multiple sequences
+            res, _ = theano.scan(utils.signal.append_delta_coeff, sequences=input, non_sequences=self.window)
+            return res
+        mask = self.mask.input_var if self.mask is not None else None
+        return utils.signal.batch_append_delta_coeff(input, self.window, mask)
 
     def get_output_shape_for(self, input_shape):
         return input_shape[0], input_shape[1], input_shape[-1] * 3
@@ -128,24 +141,33 @@ class MajorityVotingLayer(Layer):
     Casts a vote for each prediction and returns the combined votes as
     a single consolidated output
     """
-    def __init__(self, incoming, num_classes, **kwargs):
+    def __init__(self, incoming, num_classes, mask=None, soft=False, **kwargs):
         """
         Constructs a Majority voting layer
         :param incoming: incoming layer
         :param num_classes: number of classification classes
+        :param mask: optional mask input layer, padded time steps do not vote
+        :param soft: average the predicted probabilities instead of counting the argmax votes
         :param kwargs: arguments to pass down
         """
         super(MajorityVotingLayer, self).__init__(incoming, **kwargs)
         self.num_classes = num_classes
+        self.mask = mask
+        self.soft = soft
 
     def get_output_for(self, input, **kwargs):
         s = input.shape
-        votes = T.zeros((s[0], s[-1]), dtype=input.dtype)
-        a = T.argmax(input, axis=-1)
-        # for each class, count number of occurrences across all time steps
-        for idx in range(self.num_classes):
-            count = T.sum(T.eq(a, idx), axis=-1)
-            votes = T.set_subtensor(votes[:, idx], count)
+        if self.mask is not None:
+            weights = T.cast(self.mask.input_var, input.dtype)
+        else:
+            weights = T.ones((s[0], s[1]), dtype=input.dtype)
+        if self.soft:
+            votes = T.sum(input * weights.dimshuffle(0, 1, 'x'), axis=1)
+            return votes / T.maximum(T.sum(weights, axis=1), 1).dimshuffle(0, 'x')
+        # one hot encode the argmax of each time step and count the votes of all classes at once
+        a = T.argmax(input, axis=-1).flatten()
+        one_hot = T.extra_ops.to_one_hot(a, self.num_classes, dtype=input.dtype)
+        votes = T.sum(one_hot.reshape((s[0], s[1], self.num_classes)) * weights.dimshuffle(0, 1, 'x'), axis=1)
         return T.nnet.softmax(votes)
 
     def get_output_shape_for(self, input_shape):
@@ -37,3 +37,41 @@ def temporal_softmax_loss(x, y, mask):
     loss = -tt.sum(mask_flat * tt.log(probs[tt.arange(N * T), y_flat])) / total_frames
 
     return loss
+
+
+def temporal_logsoftmax_loss(x, y, mask):
+    """
+    Fused version of temporal_softmax_loss taking the pre-softmax logits of the
+    network, see the output_logits option of the modelzoo models. The log-softmax
+    is computed directly from the logits, so the log of the target probabilities
+    does not underflow and no probabilities are formed for the other classes.
+    Inputs:
+    - x: Input logits, of shape (N, T, V)
+    - y: Ground-truth indices, of shape (N, T)
+    - mask: Boolean array of shape (N, T)
+    Returns:
+    - loss: Scalar giving the cross-entropy averaged over the unmasked timesteps
+    """
+
+    N, T, V = x.shape
+
+    x_flat = x.reshape((N * T, V))
+    y_flat = y.reshape((N * T,))
+    mask_flat = mask.reshape((N * T,))
+    total_frames = tt.sum(mask_flat)
+
+    x_max = tt.max(x_flat, axis=1)
+    log_norm = x_max + tt.log(tt.sum(tt.exp(x_flat - x_max.dimshuffle(0, 'x')), axis=1))
+    log_probs = x_flat[tt.arange(N * T), y_flat] - log_norm
+    loss = -tt.sum(mask_flat * log_probs) / total_frames
+
+    return loss
+
+
+def temporal_softmax(x):
+    """
+    softmax over the last axis of the logits of shape (N, T, V), used at inference
+    on the output of models built with output_logits
+    """
+    N, T, V = x.shape
+    return tt.nnet.softmax(x.reshape((N * T, V))).reshape((N, T, V))
@@ -2,9 +2,12 @@ import warnings
 import os
 import errno
 import csv
+import time
 import argparse
 
+import numpy as np
 import menpo.io as mio
+from menpo.shape import bounding_box
 from menpo.visualize import print_progress
 from menpodetect.dlib import load_dlib_frontal_face_detector
 from menpofit.dlib import DlibWrapper
@@ -43,21 +46,83 @@ def is_video(file, ext=EXT):
 
 
 class ImageFitter(object):
-    def __init__(self, model):
+    def __init__(self, model, redetect_every=0, max_scale_change=0.3):
+        """
+        :param model: dlib shape predictor model file
+        :param redetect_every: tracking mode, initialise each fit from the shape fitted in the previous frame
+                               and only run the face detector every redetect_every frames. 0 detects every frame
+        :param max_scale_change: in tracking mode, re-run detection if the fitted shape changes size by more
+                                 than this fraction between frames
+        """
         self.detector = load_dlib_frontal_face_detector()
         self.fitter = DlibWrapper(model)
-
-    def fit_image(self, image):
+        self.redetect_every = redetect_every
+        self.max_scale_change = max_scale_change
+        self.reset()
+
+    def reset(self):
+        """
+        forget the tracked shape, call before fitting frames that do not follow the previous one
+        """
+        self.last_shape = None
+        self.box_offsets = None
+        self.frames_tracked = 0
+
+    def _box_from_shape(self, shape):
+        # map the bounds of a fitted shape to a detector-like box using the offsets measured at the last detection
+        shape_min, shape_max = shape.bounds()
+        size = shape_max - shape_min
+        return bounding_box(shape_min + self.box_offsets[0] * size, shape_max + self.box_offsets[1] * size)
+
+    def _shape_size(self, shape):
+        shape_min, shape_max = shape.bounds()
+        return np.linalg.norm(shape_max - shape_min)
+
+    def _detect(self, image):
         # Face detection
         bboxes = self.detector(image, image_diagonal=1000)
+        return bboxes[0] if len(bboxes) > 0 else None
+
+    def fit_image(self, image):
+        tracking = self.redetect_every > 0 and self.last_shape is not None
+        bbox = None
+        detected = False
+        if not tracking or self.frames_tracked >= self.redetect_every:
+            bbox = self._detect(image)
+            detected = bbox is not None
+        if bbox is None and tracking:
+            # reuse the previous shape when detection is skipped or finds no face
+            bbox = self._box_from_shape(self.last_shape)
 
         # Check if at least one face was detected, otherwise throw a warning
-        if len(bboxes) > 0:
+        if bbox is not None:
             # Use the first bounding box (the most probable to represent a face) to initialise
-            fitting_result = self.fitter.fit_from_bb(image, bboxes[0])
+            fitting_result = self.fitter.fit_from_bb(image, bbox)
+            shape = fitting_result.final_shape
+
+            if tracking and not detected:
+                scale_change = abs(self._shape_size(shape) / self._shape_size(self.last_shape) - 1)
+                if scale_change > self.max_scale_change:
+                    # the tracked fit drifted, fall back to detection
+                    redetected_bbox = self._detect(image)
+                    if redetected_bbox is not None:
+                        bbox = redetected_bbox
+                        detected = True
+                        shape = self.fitter.fit_from_bb(image, bbox).final_shape
+
+            if self.redetect_every > 0:
+                if detected:
+                    bbox_min, bbox_max = bbox.bounds()
+                    shape_min, shape_max = shape.bounds()
+                    size = shape_max - shape_min
+                    self.box_offsets = ((bbox_min - shape_min) / size, (bbox_max - shape_max) / size)
+                    self.frames_tracked = 0
+                else:
+                    self.frames_tracked += 1
+                self.last_shape = shape
 
             # Assign shape on the image
-            image.landmarks['final_shape'] = fitting_result.final_shape
+            image.landmarks['final_shape'] = shape
         else:
             # Throw warning if no face was detected
             warnings.warn('No face detected')
@@ -79,63 +144,189 @@ def fill_row(outwriter, frame_no, row):
     outwriter.writerow([frame_no] + row)
 
 
-def process_video_worker(video_queue, face_model, input_dir, output_dir):
-    image_fitter = ImageFitter(face_model)
+def landmarks_to_row(frame):
+    """
+    :param frame: fitted menpo image
+    :return: flattened landmark points, -1s if no face was fitted
+    """
+    if 'final_shape' not in frame.landmarks:
+        # dlib does not fitting from previous initial shape so
+        # leave entire row as -1s
+        return [-1] * NO_LANDMARKS*2
+    lmg = frame.landmarks['final_shape']
+    return lmg['all'].points.reshape((NO_LANDMARKS*2,)).tolist()  # reshape to 136 points
+
+
+def landmark_file_path(video, input_dir, output_dir):
+    relative_path = video[len(input_dir) + 1:]
+    return os.path.join(output_dir, os.path.splitext(relative_path)[0] + '.csv')
+
+
+def is_landmark_file_complete(dest, no_frames):
+    """
+    checks whether a landmark csv contains exactly one complete row per frame
+    :param dest: landmark csv file
+    :param no_frames: number of frames in the video
+    :return: True if the file exists and is complete
+    """
+    if not os.path.isfile(dest):
+        return False
+    with open(dest) as f:
+        rows = list(csv.reader(f))
+    return len(rows) == no_frames and \
+        all(len(row) == NO_LANDMARKS*2 + 1 and int(row[0]) == i for i, row in enumerate(rows))
+
+
+def write_landmark_file(dest, rows):
+    """
+    writes the landmark rows to a temporary file first, so that an interrupted run never leaves
+    a truncated csv behind that would be mistaken for a finished one
+    :param dest: landmark csv file
+    :param rows: list of landmark rows ordered by frame
+    """
+    if os.path.dirname(dest):
+        create_dir(os.path.dirname(dest))
+    tmp_dest = dest + '.tmp'
+    with open(tmp_dest, 'w') as outputfile:
+        outwriter = csv.writer(outputfile)
+        for i, row in enumerate(rows):
+            fill_row(outwriter, i, row)
+    os.rename(tmp_dest, dest)
+
+
+def import_video(file):
+    try:
+        return mio.import_video(file, normalise=False)
+    except IOError:
+        warnings.warn('IO error reading video file {}, '.format(file) +
+                      'the file may be corrupted or the video format is unsupported, skipping...')
+    except ValueError as e:
+        warnings.warn('Value Error reading video file {}, '.format(file) +
+                      e.message)
+    return None
+
+
+def process_video_worker(video_queue, face_model, input_dir, output_dir, redetect_every=0):
+    image_fitter = ImageFitter(face_model, redetect_every)
     while True:
         video = video_queue.get()
         if video is None:
             print('[{}] Done...'.format(os.getpid()))
             video_queue.task_done()
             break
-        relative_path = video[len(input_dir) + 1:]
-        landmarkfile = os.path.join(output_dir, os.path.splitext(relative_path)[0] + '.csv')
+        landmarkfile = landmark_file_path(video, input_dir, output_dir)
         process_video(video, landmarkfile, image_fitter)
         video_queue.task_done()
 
 
 def process_video(file, dest, fitter):
     if is_video(file):
-        try:
-            frames = mio.import_video(file, normalise=False)
-        except IOError:
-            warnings.warn('IO error reading video file {}, '.format(file) +
-                          'the file may be corrupted or the video format is unsupported, skipping...')
-        except ValueError as e:
-            warnings.warn('Value Error reading video file {}, '.format(file) +
-                          e.message)
+        frames = import_video(file)
+        if frames is None:
+            return
+        if is_landmark_file_complete(dest, len(frames)):
+            print('[{}] {} is complete, skipping...'.format(os.getpid(), dest))
             return
-        # check if directory is non empty
-        if os.path.dirname(dest):
-            create_dir(os.path.dirname(dest))
         print('[{}] {} contains {} frames'.format(os.getpid(), file, len(frames)))
         print('[{}] writing landmarks to {}...'.format(os.getpid(), dest))
-        frames = frames.map(fitter.fit_image)
-        with open(dest, 'w') as outputfile:
-            outwriter = csv.writer(outputfile)
+        fitter.reset()
+        rows = []
+        for i in print_progress(range(len(frames))):
             try:
-                for i, frame in enumerate(print_progress(frames)):
-                    if 'final_shape' not in frame.landmarks:
-                        warnings.warn('no faces detected in the frame {}, '.format(i) +
-                                      'initializing landmarks to -1s...')
-                        # dlib does not fitting from previous initial shape so
-                        # leave entire row as -1s
-                        # initial_shape = frames[i - 1].landmarks['final_shape'].lms
-                        # fitting_result = fit_image.fitter.fit_from_shape(frame, initial_shape)
-                        # frame.landmarks['final_shape'] = fitting_result.final_shape
-                        landmarks = [-1] * NO_LANDMARKS*2
-                    else:
-                        lmg = frame.landmarks['final_shape']
-                        landmarks = lmg['all'].points.reshape((NO_LANDMARKS*2,)).tolist()  # reshape to 136 points
-                    fill_row(outwriter, i, landmarks)
+                frame = fitter.fit_image(frames[i])
+                if 'final_shape' not in frame.landmarks:
+                    warnings.warn('no faces detected in the frame {}, '.format(i) +
+                                  'initializing landmarks to -1s...')
+                rows.append(landmarks_to_row(frame))
             except Exception as _:
                 warnings.warn('Runtime Error at frame {}'.format(i))
                 print('initializing landmarks to -1s...')
-                fill_row(outwriter, i, [-1] * NO_LANDMARKS*2)
+                rows.append([-1] * NO_LANDMARKS*2)
+        write_landmark_file(dest, rows)
+
+
+def init_chunk_worker(face_model, redetect_every=0):
+    global chunk_fitter
+    chunk_fitter = ImageFitter(face_model, redetect_every)
+
+
+def fit_chunk(task):
+    """
+    fits the frames [start, stop) of a video, run by the pool initialised with init_chunk_worker
+    :param task: (video file, start frame, stop frame)
+    :return: (video file, start frame, landmark rows, worker pid, fitting time)
+    """
+    video, start, stop = task
+    time_start = time.time()
+    frames = mio.import_video(video, normalise=False)
+    chunk_fitter.reset()
+    rows = []
+    for i in range(start, stop):
+        try:
+            rows.append(landmarks_to_row(chunk_fitter.fit_image(frames[i])))
+        except Exception as _:
+            warnings.warn('Runtime Error at frame {} of {}, initializing landmarks to -1s...'.format(i, video))
+            rows.append([-1] * NO_LANDMARKS*2)
+    return video, start, rows, os.getpid(), time.time() - time_start
+
+
+def create_chunk_tasks(videofiles, input_dir, output_dir, chunk_size):
+    """
+    splits the videos without a complete landmark file into chunks of at most chunk_size frames
+    :return: list of (video, start, stop) tasks, dict of video -> (landmark file, number of frames)
+    """
+    tasks = []
+    videos = {}
+    for video in videofiles:
+        frames = import_video(video)
+        if frames is None:
+            continue
+        no_frames = len(frames)
+        dest = landmark_file_path(video, input_dir, output_dir)
+        if is_landmark_file_complete(dest, no_frames):
+            print('{} is complete, skipping...'.format(dest))
+            continue
+        videos[video] = (dest, no_frames)
+        tasks += [(video, start, min(start + chunk_size, no_frames)) for start in range(0, no_frames, chunk_size)]
+    return tasks, videos
+
+
+def process_videos_chunked(videofiles, face_model, input_dir, output_dir, no_workers, chunk_size, redetect_every=0):
+    """
+    fits all videos with a process pool working on frame chunks, so that long videos are shared
+    between workers. Chunks are merged in frame order and a video's landmark file is written as
+    soon as all of its chunks are fitted, already complete landmark files are skipped
+    """
+    tasks, videos = create_chunk_tasks(videofiles, input_dir, output_dir, chunk_size)
+    print('Fitting {} video(s) in {} chunk(s) of up to {} frames...'.format(len(videos), len(tasks), chunk_size))
+    pending = dict((video, {}) for video in videos)
+    worker_frames = {}
+    worker_time = {}
+    pool = mp.Pool(no_workers, initializer=init_chunk_worker, initargs=(face_model, redetect_every))
+    try:
+        for video, start, rows, pid, elapsed in pool.imap_unordered(fit_chunk, tasks):
+            worker_frames[pid] = worker_frames.get(pid, 0) + len(rows)
+            worker_time[pid] = worker_time.get(pid, 0.) + elapsed
+            chunks = pending[video]
+            chunks[start] = rows
+            dest, no_frames = videos[video]
+            if sum(len(r) for r in chunks.values()) == no_frames:
+                write_landmark_file(dest, [row for s in sorted(chunks) for row in chunks[s]])
+                del pending[video]
+                print('[{}] wrote landmarks to {}'.format(pid, dest))
+    finally:
+        pool.close()
+        pool.join()
+    for pid in sorted(worker_frames):
+        print('[{}] {} frames, {:.2f} frames/sec'.format(pid, worker_frames[pid],
+                                                         worker_frames[pid] / max(worker_time[pid], 1e-6)))
 
 
 def parse_options():
     options = dict()
     parser = argparse.ArgumentParser()
+    options['chunk_size'] = 100
+    options['track'] = 0
     options['model'] = '../config/shape_predictor_68_face_landmarks.dat'
     parser.add_argument('--input_dir', help='directory to search for videos, supported formats [.mov, .mpg, .mp4]')
     parser.add_argument('--output_dir', help='output directory to store the landmarks')
@@ -145,6 +336,10 @@ def parse_options():
     parser.add_argument('--output', help='output landmark file name, if not specified '
                                          'creates landmark file in current directory')
     parser.add_argument('--workers', help='number of workers to spawn. Default: number of CPUs available')
+    parser.add_argument('--chunk_size', help='number of frames fitted per task, long videos are split between '
+                                             'workers. 0 assigns whole videos to workers. Default: 100')
+    parser.add_argument('--track', help='initialise each fit from the previous frame and only run face detection '
+                                        'every TRACK frames. Default: 0 (detect on every frame)')
     args = parser.parse_args()
     if args.input_dir:
         options['input_dir'] = args.input_dir
@@ -158,6 +353,10 @@ def parse_options():
         options['output'] = args.output
     if args.workers:
         options['workers'] = int(args.workers)
+    if args.chunk_size:
+        options['chunk_size'] = int(args.chunk_size)
+    if args.track:
+        options['track'] = int(args.track)
     return options
 
 
@@ -181,7 +380,7 @@ if __name__ == '__main__':
         video_file_basename = os.path.basename(video_file)
         print('Generating Landmarks from {}'.format(video_file))
         output = options['output'] if 'output' in options else os.path.splitext(video_file_basename)[0] + '.csv'
-        process_video(video_file, output)
+        process_video(video_file, output, ImageFitter(options['model'], options['track']))
         exit()
 
     print('Generating Landmarks from {}'.format(options['input_dir']))
@@ -192,16 +391,21 @@ if __name__ == '__main__':
         no_workers = options['workers']
     else:
         no_workers = mp.cpu_count()
-    queue = mp.JoinableQueue()
-    queue = add_tasks(queue, videofiles)
-    queue = add_poison_pills(queue, no_workers)
     input_dir = os.path.abspath(options['input_dir'])
     output_dir = os.path.abspath(options['output_dir'])
-    workers = []
     print('Using {} workers...'.format(no_workers))
-    for i in range(no_workers):
-        workers.append(mp.Process(target=process_video_worker, args=(queue, options['model'], input_dir, output_dir)))
-    for p in workers:
-        p.start()
-    queue.join()
+    if options['chunk_size'] > 0:
+        process_videos_chunked(videofiles, options['model'], input_dir, output_dir, no_workers, options['chunk_size'],
+                               options['track'])
+    else:
+        queue = mp.JoinableQueue()
+        queue = add_tasks(queue, videofiles)
+        queue = add_poison_pills(queue, no_workers)
+        workers = []
+        for i in range(no_workers):
+            workers.append(mp.Process(target=process_video_worker,
+                                      args=(queue, options['model'], input_dir, output_dir, options['track'])))
+        for p in workers:
+            p.start()
+        queue.join()
     print('All Done!')
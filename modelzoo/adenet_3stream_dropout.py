@@ -15,7 +15,7 @@ def create_model(s1_ae, s2_ae, s3_ae, s1_shape, s1_var,
                  mask_shape, mask_var,
                  lstm_size=250, win=T.iscalar('theta)'),
                  output_classes=26, fusiontype='concat', w_init_fn=las.init.Orthogonal(),
-                 use_peepholes=True):
+                 use_peepholes=True, output_logits=False):
 
     s1_bn_weights, s1_bn_biases, s1_bn_shapes, s1_bn_nonlinearities = s1_ae
     s2_weights, s2_biases, s2_shapes, s2_nonlinearities = s2_ae
@@ -130,7 +130,8 @@ def create_model(s1_ae, s2_ae, s3_ae, s1_shape, s1_var,
     # so we'll use a the number of classes.
     l_softmax = DenseLayer(
         l_reshape3, num_units=output_classes,
-        nonlinearity=las.nonlinearities.softmax, name='softmax')
+        nonlinearity=las.nonlinearities.linear if output_logits else las.nonlinearities.softmax,
+        name='softmax')
 
     l_out = ReshapeLayer(l_softmax, (-1, symbolic_seqlen_s1, output_classes), name='output')
 
@@ -40,7 +40,7 @@ def create_blstm(l_incoming, l_mask, hidden_units, cell_parameters, gate_paramet
 def create_model(ae, s2_ae, input_shape, input_var, mask_shape, mask_var,
                  s2_shape, s2_var, lstm_size=250, win=T.iscalar('theta)'),
                  output_classes=26, fusiontype='concat', w_init_fn=las.init.Orthogonal(),
-                 use_peepholes=True):
+                 use_peepholes=True, output_logits=False):
 
     bn_weights, bn_biases, bn_shapes, bn_nonlinearities = ae
     s2_weights, s2_biases, s2_shapes, s2_nonlinearities = s2_ae
@@ -125,7 +125,8 @@ def create_model(ae, s2_ae, input_shape, input_var, mask_shape, mask_var,
     # so we'll use a the number of classes.
     l_softmax = DenseLayer(
         l_reshape3, num_units=output_classes,
-        nonlinearity=las.nonlinearities.softmax, name='softmax')
+        nonlinearity=las.nonlinearities.linear if output_logits else las.nonlinearities.softmax,
+        name='softmax')
 
     l_out = ReshapeLayer(l_softmax, (-1, symbolic_seqlen_s1, output_classes), name='output')
 
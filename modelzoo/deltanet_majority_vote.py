@@ -13,7 +13,7 @@ from utils.io import load_model_params
 
 def create_model(dbn, input_shape, input_var, mask_shape, mask_var,
                  lstm_size=250, win=T.iscalar('theta)'),
-                 output_classes=26, w_init_fn=GlorotUniform, use_peepholes=False, use_blstm=True):
+                 output_classes=26, w_init_fn=GlorotUniform, use_peepholes=False, use_blstm=True, output_logits=False):
 
     weights, biases, shapes, nonlinearities = dbn
 
@@ -59,7 +59,9 @@ def create_model(dbn, input_shape, input_var, mask_shape, mask_var,
     # We want the network to predict a classification for the sequence,
     # so we'll use a the number of classes.
     l_softmax = DenseLayer(
-        l_reshape3, num_units=output_classes, nonlinearity=las.nonlinearities.softmax, name='softmax')
+        l_reshape3, num_units=output_classes,
+        nonlinearity=las.nonlinearities.linear if output_logits else las.nonlinearities.softmax,
+        name='softmax')
 
     l_out = ReshapeLayer(l_softmax, (-1, symbolic_seqlen, output_classes), name='output')
 
@@ -68,7 +70,8 @@ def create_model(dbn, input_shape, input_var, mask_shape, mask_var,
 
 def load_saved_model(model_path, stream_params, input_shape, input_var, mask_shape, mask_var,
                      lstm_size=250, win=T.iscalar('theta)'),
-                     output_classes=26, w_init_fn=GlorotUniform(), use_peepholes=False, use_blstm=True):
+                     output_classes=26, w_init_fn=GlorotUniform(), use_peepholes=False, use_blstm=True,
+                     output_logits=False):
     """
     loads a saved model
     :param model_path: path to model parameters
@@ -83,6 +86,8 @@ def load_saved_model(model_path, stream_params, input_shape, input_var, mask_sha
     :param output_classes: number of output classes
     :param w_init_fn: weight initialization function used for initializing model
     :param use_peepholes: use peepholes for lstm layers
+    :param use_blstm: use a bidirectional lstm layer
+    :param output_logits: output the pre-softmax logits, for use with temporal_logsoftmax_loss
     :return: saved model
     """
 
@@ -127,7 +132,9 @@ def load_saved_model(model_path, stream_params, input_shape, input_var, mask_sha
     # We want the network to predict a classification for the sequence,
     # so we'll use a the number of classes.
     l_softmax = DenseLayer(
-        l_reshape3, num_units=output_classes, nonlinearity=las.nonlinearities.softmax, name='softmax')
+        l_reshape3, num_units=output_classes,
+        nonlinearity=las.nonlinearities.linear if output_logits else las.nonlinearities.softmax,
+        name='softmax')
 
     l_out = ReshapeLayer(l_softmax, (-1, symbolic_seqlen, output_classes), name='output')
     load_model_params(l_out, model_path)
@@ -33,6 +33,7 @@ from lasagne.objectives import squared_error
 
 from modelzoo import adenet_v3
 from utils.plotting_utils import print_network
+from utils.evaluation import evaluate_predictions
 
 
 def load_dbn(path='models/oulu_ae.mat'):
@@ -236,18 +237,7 @@ def evaluate_model(X_val, y_val, mask_val, dct_val, X_diff_val, window_size, eva
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, dct_val, X_diff_val, window_size)
-    no_gps = output.shape[1]
-    confusion_matrix = np.zeros((no_gps, no_gps), dtype='int')
-
-    ix = np.argmax(output, axis=1)
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_predictions(output, y_val)
 
 
 def get_phrase(idx):
@@ -1,11 +1,15 @@
 from __future__ import print_function
+import os
 import sys
 sys.path.insert(0, '../')
 import argparse
+import multiprocessing as mp
 import utils.ffmpeg
 from utils.preprocessing import *
 from utils.io import *
-from utils.plotting_utils import *
+
+
+VIDEO_EXT = ['.mp4', '.mov', '.mpg']
 
 
 def parse_htk_labels(filename):
@@ -57,39 +61,80 @@ def digit_to_int(digit):
     return digit_map[digit]
 
 
+def segment_frames(pts_times, htk_labels):
+    """
+    assigns video frames to the labelled utterances, a frame belongs to an utterance
+    if start < pts_time <= end
+    :param pts_times: frame timestamps in seconds, in presentation order
+    :param htk_labels: list of (start, end, label) in 100ns units, as returned by parse_htk_labels
+    :return: frame indexes of all utterances, sequence lengths, frame labels
+    """
+    pts_times = np.trunc(np.asarray(pts_times, dtype='float64') * 10000000)  # to 100ns, same as to_100ns
+    if len(htk_labels) == 0:
+        return np.zeros((0,), dtype=int), np.zeros((0,), dtype=int), np.zeros((0,), dtype=int)
+    starts = np.array([int(start) for start, _, _ in htk_labels], dtype='int64')
+    ends = np.array([int(end) for _, end, _ in htk_labels], dtype='int64')
+    numbers = np.array([digit_to_int(label) for _, _, label in htk_labels])
+
+    first = np.searchsorted(pts_times, starts, side='right')
+    last = np.searchsorted(pts_times, ends, side='right')
+    seq_lens = np.maximum(last - first, 0)
+    # offset of each frame from the first frame of its utterance
+    offsets = np.arange(np.sum(seq_lens)) - np.repeat(np.cumsum(seq_lens) - seq_lens, seq_lens)
+    idxes = np.repeat(first, seq_lens) + offsets
+    labels = np.repeat(numbers, seq_lens)
+    return idxes, seq_lens, labels
+
+
 def segment_video(video_file, label_file):
-    _, video_frames = utils.ffmpeg.ffprobe_video(video_file)
+    """
+    segments a video into its labelled utterances
+    :param video_file: video file
+    :param label_file: htk label file of the video
+    :return: dictionary containing frameIndexVec, videoLengthVec and targetsVec
+    """
+    pts_times = utils.ffmpeg.ffprobe_frame_times(video_file)
     htk_labels = parse_htk_labels(label_file)
-    print('number of video frames: {}'.format(len(video_frames)))
+    print('number of video frames: {}'.format(len(pts_times)))
     print('number of labels: {}'.format(len(htk_labels)))
-    current_frame = 0
-    idxes = []
-    seq_lens = []
-    labels = []
-    for start, end, label in htk_labels:
-        start = int(start)
-        end = int(end)
-        number = digit_to_int(label)
-        # print(start, end, number)
-        seq_len = 0
-        while True:
-            f = video_frames[current_frame]
-            pts_time = to_100ns(f.pkt_pts_time)
-            # check if frame is withing utterance window
-            if pts_time > start and pts_time <= end:
-                idxes.append(current_frame)
-                labels.append(number)
-                seq_len += 1
-                current_frame += 1
-                # TODO: extract/select mouth ROI of frame
-            else:
-                if pts_time > end:
-                    break
-                current_frame += 1  # keep moving to the start of the next sequence
-        seq_lens.append(seq_len)
-    print(len(idxes))
-    print(len(labels))
-    print(seq_lens)
+    idxes, seq_lens, labels = segment_frames(pts_times, htk_labels)
+    return {'frameIndexVec': idxes.reshape((-1, 1)),
+            'videoLengthVec': seq_lens.reshape((-1, 1)),
+            'targetsVec': labels.reshape((-1, 1))}
+
+
+def _segment_video_task(task):
+    return segment_video(*task)
+
+
+def segment_videos(video_dir, label_dir, label_ext='.txt', workers=None):
+    """
+    segments all videos of a directory in a process pool. The label file of a video has the
+    same path relative to label_dir, with label_ext as extension
+    :param video_dir: directory containing the videos
+    :param label_dir: directory containing the htk label files
+    :param label_ext: label file extension
+    :param workers: number of processes, number of CPUs if None
+    :return: dictionary containing frameIndexVec, videoLengthVec, targetsVec and
+             videoIdVec (index of the video in videoFiles of each sequence), videoFiles
+    """
+    videos = sorted(os.path.join(root, f) for root, _, files in os.walk(video_dir) for f in files
+                    if os.path.splitext(f)[1] in VIDEO_EXT)
+    tasks = [(video, os.path.join(label_dir, os.path.splitext(os.path.relpath(video, video_dir))[0] + label_ext))
+             for video in videos]
+    pool = mp.Pool(workers)
+    try:
+        segments = pool.map(_segment_video_task, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    data = {}
+    for k in ['frameIndexVec', 'videoLengthVec', 'targetsVec']:
+        data[k] = np.concatenate([s[k] for s in segments])
+    data['videoIdVec'] = np.concatenate([np.full((len(s['videoLengthVec']), 1), i, dtype=int)
+                                         for i, s in enumerate(segments)])
+    data['videoFiles'] = np.array(videos, dtype=object)
+    return data
 
 
 def test_mergesamples():
@@ -126,7 +171,12 @@ def parse_options():
     parser.add_argument('--concat_deltas', help='concat 1st and 2nd deltas, default delta window: 2')
     parser.add_argument('--embed_temporal_info', help='embed temporal info to features [window],[step]. ie: 3,1')
     parser.add_argument('--output', help='write output to .mat file')
-    parser.add_argument('input', nargs='+', help='input cuave .mat file to preprocess')
+    parser.add_argument('--segment', help='[VIDEO_DIR] segment the videos into the utterances of their htk '
+                                          'labels and write frameIndexVec, videoLengthVec, targetsVec to output')
+    parser.add_argument('--labels', help='[LABEL_DIR] htk label directory, mirroring the video directory layout')
+    parser.add_argument('--label_ext', help='htk label file extension. Default: .txt')
+    parser.add_argument('--workers', help='number of processes used for segmentation. Default: number of CPUs')
+    parser.add_argument('input', nargs='*', help='input cuave .mat file to preprocess')
     args = parser.parse_args()
     if args.remove_mean:
         options['remove_mean'] = args.remove_mean
@@ -142,6 +192,13 @@ def parse_options():
         options['output'] = args.output
     if args.input:
         options['input'] = args.input[0]
+    if args.segment:
+        options['segment'] = args.segment
+        options['labels'] = args.labels if args.labels else args.segment
+    if args.label_ext:
+        options['label_ext'] = args.label_ext
+    if args.workers:
+        options['workers'] = int(args.workers)
     if args.concat_deltas:
         options['concat_deltas'] = int(args.concat_deltas)
     return options
@@ -149,6 +206,14 @@ def parse_options():
 
 def main():
     options = parse_options()
+    if 'segment' in options:
+        data = segment_videos(options['segment'], options['labels'], options.get('label_ext', '.txt'),
+                              options.get('workers'))
+        print('{} sequences, {} frames'.format(len(data['videoLengthVec']), len(data['targetsVec'])))
+        if options['output']:
+            save_mat(data, options['output'])
+        return
+
     data = load_mat_file(options['input'])
     data_matrix = data['dataMatrix'].astype('float32')
     vid_len_vec = data['videoLengthVec'].astype('int').reshape((-1,))
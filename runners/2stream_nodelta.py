@@ -26,6 +26,7 @@ from lasagne.updates import adam
 
 from modelzoo import adenet_v2_nodelta
 from utils.plotting_utils import print_network
+from utils.evaluation import evaluate_sequences
 
 
 def load_decoder(path, shapes, nonlinearities):
@@ -56,28 +57,7 @@ def evaluate_model2(X_val, y_val, mask_val, X_diff_val, eval_fn):
     :return: classification rate, confusion matrix
     """
     output = eval_fn(X_val, mask_val, X_diff_val)
-    num_classes = output.shape[-1]
-    confusion_matrix = np.zeros((num_classes, num_classes), dtype='int')
-    ix = np.zeros((X_val.shape[0],), dtype='int')
-    seq_lens = np.sum(mask_val, axis=-1)
-
-    # for each example, we only consider argmax of the seq len
-    votes = np.zeros((num_classes,), dtype='int')
-    for i, eg in enumerate(output):
-        predictions = np.argmax(eg[:seq_lens[i]], axis=-1)
-        for cls in range(num_classes):
-            count = (predictions == cls).sum(axis=-1)
-            votes[cls] = count
-        ix[i] = np.argmax(votes)
-
-    c = ix == y_val
-    classification_rate = np.sum(c == True) / float(len(c))
-
-    # construct the confusion matrix
-    for i, target in enumerate(y_val):
-        confusion_matrix[target, ix[i]] += 1
-
-    return classification_rate, confusion_matrix
+    return evaluate_sequences(output, y_val, mask_val)
 
 
 def presplit_dataprocessing(data_matrix, vidlens, config, stream_name, **kwargs):
@@ -98,6 +78,11 @@ def presplit_dataprocessing(data_matrix, vidlens, config, stream_name, **kwargs)
 
 
 def postsplit_datapreprocessing(train_X, val_X, test_X, config, stream_name):
+    whitening = zca_from_config(config, stream_name, train_X)
+    if whitening is not None:
+        train_X = whitening.transform(train_X)
+        val_X = whitening.transform(val_X)
+        test_X = whitening.transform(test_X)
     featurewisenormalize = config.getboolean(stream_name, 'featurewisenormalize')
     if featurewisenormalize:
         train_X, mean, std = featurewise_normalize_sequence(train_X)
@@ -196,8 +181,8 @@ def main():
     val_subject_ids = read_data_split_file(config.get('training', 'val_subjects_file'))
     test_subject_ids = read_data_split_file(config.get('training', 'test_subjects_file'))
 
-    s1_data_matrix = s1_data['dataMatrix'].astype('float32')
-    s2_data_matrix = s2_data['dataMatrix'].astype('float32')
+    s1_data_matrix = s1_data['dataMatrix'].astype('float32', copy=False)
+    s2_data_matrix = s2_data['dataMatrix'].astype('float32', copy=False)
     targets_vec = s1_data['targetsVec'].reshape((-1,))
     subjects_vec = s1_data['subjectsVec'].reshape((-1,))
     vidlen_vec = s1_data['videoLengthVec'].reshape((-1,))
@@ -208,17 +193,15 @@ def main():
     s1_data_matrix = presplit_dataprocessing(s1_data_matrix, vidlen_vec, config, 'stream1', imagesize=s1_imagesize)
     s2_data_matrix = presplit_dataprocessing(s2_data_matrix, vidlen_vec, config, 'stream2', imagesize=s2_imagesize)
 
-    s1_train_X, s1_train_y, s1_train_vidlens, s1_train_subjects, \
-    s1_val_X, s1_val_y, s1_val_vidlens, s1_val_subjects, \
-    s1_test_X, s1_test_y, s1_test_vidlens, s1_test_subjects = split_seq_data(s1_data_matrix, targets_vec, subjects_vec,
-                                                                             vidlen_vec, train_subject_ids,
-                                                                             val_subject_ids, test_subject_ids)
-
-    s2_train_X, s2_train_y, s2_train_vidlens, s2_train_subjects, \
-    s2_val_X, s2_val_y, s2_val_vidlens, s2_val_subjects, \
-    s2_test_X, s2_test_y, s2_test_vidlens, s2_test_subjects = split_seq_data(s2_data_matrix, targets_vec, subjects_vec,
-                                                                             vidlen_vec, train_subject_ids,
-                                                                             val_subject_ids, test_subject_ids)
+    data_matrices = [s1_data_matrix, s2_data_matrix]
+    train_X, s1_train_y, s1_train_vidlens, s1_train_subjects, \
+    val_X, s1_val_y, s1_val_vidlens, s1_val_subjects, \
+    test_X, s1_test_y, s1_test_vidlens, s1_test_subjects = split_multistream_seq_data(data_matrices, targets_vec, subjects_vec,
+                                                                                      vidlen_vec, train_subject_ids,
+                                                                                      val_subject_ids, test_subject_ids)
+    s1_train_X, s2_train_X = train_X
+    s1_val_X, s2_val_X = val_X
+    s1_test_X, s2_test_X = test_X
 
     s1_train_X, s1_val_X, s1_test_X = postsplit_datapreprocessing(s1_train_X, s1_val_X, s1_test_X, config, 'stream1')
     s2_train_X, s2_val_X, s2_test_X = postsplit_datapreprocessing(s2_train_X, s2_val_X, s2_test_X, config, 'stream2')
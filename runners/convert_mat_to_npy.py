@@ -0,0 +1,32 @@
+from __future__ import print_function
+import sys
+sys.path.insert(0, '../')
+import argparse
+from utils.io import convert_mat_to_npy_store
+
+
+def parse_options():
+    options = dict()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fields', help='comma separated fields to convert. Default: all numeric fields')
+    parser.add_argument('input', help='input .mat file')
+    parser.add_argument('output', help='output store directory, use it as the data path in the config files')
+
+    args = parser.parse_args()
+    options['input'] = args.input
+    options['output'] = args.output
+    if args.fields:
+        options['fields'] = args.fields.split(',')
+    return options
+
+
+def main():
+    options = parse_options()
+    print('converting {} to {}...'.format(options['input'], options['output']))
+    index = convert_mat_to_npy_store(options['input'], options['output'], options.get('fields'))
+    for field, info in sorted(index['fields'].items()):
+        print('{}: shape {}, dtype {}'.format(field, tuple(info['shape']), info['dtype']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,494 @@
+"""
+training engine for the end to end lstm classifiers of 1 to 4 streams. The streams are the
+config sections listed in the [training] streams option (default: all sections stream1, stream2, ...),
+stream1 provides the targets, subjects and video lengths of all streams
+"""
+from __future__ import print_function
+import sys
+
+sys.path.insert(0, '../')
+import re
+import time
+import inspect
+import ConfigParser
+import os
+import argparse
+
+from utils.preprocessing import *
+from utils.data_structures import circular_list
+from utils.datagen import *
+from utils.io import *
+from utils.cache import PreprocessingCache
+from utils.function_cache import CompiledFunctionCache, describe_graph
+from utils.regularization import early_stop2
+from utils.evaluation import evaluate_sequences
+from custom.objectives import temporal_softmax_loss, temporal_logsoftmax_loss, temporal_softmax
+from custom.nonlinearities import select_nonlinearity
+
+import theano.tensor as T
+import theano
+
+import lasagne as las
+import numpy as np
+from lasagne.updates import adam
+
+from modelzoo import deltanet_majority_vote, adenet_v2_2, adenet_2stream, adenet_3stream, adenet_3stream_dropout, \
+    adenet_4stream
+
+
+def load_decoder(path, shapes, nonlinearities):
+    nn = sio.loadmat(path)
+    weights = []
+    biases = []
+    shapes = [int(s) for s in shapes.split(',')]
+    nonlinearities = [select_nonlinearity(nonlinearity) for nonlinearity in nonlinearities.split(',')]
+    for i in range(len(shapes)):
+        weights.append(nn['w{}'.format(i + 1)].astype('float32'))
+        biases.append(nn['b{}'.format(i + 1)][0].astype('float32'))
+    return weights, biases, shapes, nonlinearities
+
+
+def configure_theano():
+    theano.config.floatX = 'float32'
+    sys.setrecursionlimit(10000)
+
+
+def get_streams(config):
+    """
+    :param config: config parser
+    :return: stream section names, from the [training] streams option or all stream sections in order
+    """
+    if config.has_option('training', 'streams'):
+        return [s.strip() for s in config.get('training', 'streams').split(',')]
+    streams = [s for s in config.sections() if re.match(r'^stream\d+$', s)]
+    return sorted(streams, key=lambda s: int(s[len('stream'):]))
+
+
+def evaluate_model(Xs, y, mask, window_size, eval_fn):
+    """
+    Evaluate a lstm model
+    :param Xs: inputs of each stream
+    :param y: targets
+    :param mask: input masks for variable sequences
+    :param window_size: size of window for computing delta coefficients
+    :param eval_fn: evaluation function
+    :return: classification rate, confusion matrix
+    """
+    output = eval_fn(*(list(Xs) + [mask, window_size]))
+    return evaluate_sequences(output, y, mask)
+
+
+def presplit_dataprocessing(data_matrix, vidlens, config, stream_name, **kwargs):
+    reorderdata = config.getboolean(stream_name, 'reorderdata')
+    diffimage = config.getboolean(stream_name, 'diffimage')
+    meanremove = config.getboolean(stream_name, 'meanremove')
+    samplewisenormalize = config.getboolean(stream_name, 'samplewisenormalize')
+    if reorderdata:
+        imagesize = kwargs['imagesize']
+        data_matrix = reorder_data(data_matrix, imagesize)
+    if meanremove:
+        data_matrix = sequencewise_mean_image_subtraction(data_matrix, vidlens)
+    if diffimage:
+        data_matrix = compute_diff_images(data_matrix, vidlens)
+    if samplewisenormalize:
+        data_matrix = normalize_input(data_matrix)
+    return data_matrix
+
+
+def postsplit_datapreprocessing(train_X, val_X, test_X, config, stream_name):
+    whitening = zca_from_config(config, stream_name, train_X)
+    if whitening is not None:
+        train_X = whitening.transform(train_X)
+        val_X = whitening.transform(val_X)
+        test_X = whitening.transform(test_X)
+    featurewisenormalize = config.getboolean(stream_name, 'featurewisenormalize')
+    if featurewisenormalize:
+        train_X, mean, std = featurewise_normalize_sequence(train_X)
+        val_X = (val_X - mean) / std
+        test_X = (test_X - mean) / std
+    return train_X, val_X, test_X
+
+
+def preprocess_data(config, streams, train_subject_ids, val_subject_ids, test_subject_ids):
+    """
+    loads, preprocesses and splits the data of all streams
+    :return: train_X, train_y, train_vidlens, train_subjects, val_X, ..., test_X, ... where the
+        X are lists with one data matrix per stream
+    """
+    matlab_target_offset = config.getboolean('lstm_classifier', 'matlab_target_offset')
+    data = [load_mat_file(config.get(s, 'data')) for s in streams]
+    data_matrices = [d['dataMatrix'].astype('float32', copy=False) for d in data]
+
+    targets_vec = data[0]['targetsVec'].reshape((-1,))
+    subjects_vec = data[0]['subjectsVec'].reshape((-1,))
+    vidlen_vec = data[0]['videoLengthVec'].reshape((-1,))
+
+    # align before the sequencewise preprocessing, so every stream uses the aligned sequence lengths
+    force_align_data = config.getboolean(streams[0], 'force_align_data') \
+        if config.has_option(streams[0], 'force_align_data') else False
+    if force_align_data and len(streams) > 1:
+        orig_streams = [(data_matrices[0], targets_vec, vidlen_vec)] + \
+                       [(X, d['targetsVec'].reshape((-1,)), d['videoLengthVec'].reshape((-1,)))
+                        for X, d in zip(data_matrices[1:], data[1:])]
+        new_streams = multistream_force_align(orig_streams)
+        _, targets_vec, vidlen_vec = new_streams[0]
+        data_matrices = [X for X, _, _ in new_streams]
+
+    if matlab_target_offset:
+        targets_vec -= 1
+
+    for i, s in enumerate(streams):
+        imagesize = tuple([int(d) for d in config.get(s, 'imagesize').split(',')])
+        data_matrices[i] = presplit_dataprocessing(data_matrices[i], vidlen_vec, config, s, imagesize=imagesize)
+
+    train_X, train_y, train_vidlens, train_subjects, \
+    val_X, val_y, val_vidlens, val_subjects, \
+    test_X, test_y, test_vidlens, test_subjects = split_multistream_seq_data(data_matrices, targets_vec, subjects_vec,
+                                                                             vidlen_vec, train_subject_ids,
+                                                                             val_subject_ids, test_subject_ids)
+
+    for i, s in enumerate(streams):
+        train_X[i], val_X[i], test_X[i] = postsplit_datapreprocessing(train_X[i], val_X[i], test_X[i], config, s)
+
+    return train_X, train_y, train_vidlens, train_subjects, \
+           val_X, val_y, val_vidlens, val_subjects, \
+           test_X, test_y, test_vidlens, test_subjects
+
+
+def create_model(config, streams, decoders, lstms, input_vars, mask, window, w_init_fn, output_logits=False):
+    """
+    builds the modelzoo model for the number of streams
+    :param config: config parser
+    :param streams: stream section names
+    :param decoders: pretrained encoder of each stream
+    :param lstms: pretrained lstm of each stream, or None
+    :param input_vars: input theano variable of each stream
+    :param mask: mask theano variable
+    :param window: delta window size theano variable
+    :param w_init_fn: weight initialization function
+    :param output_logits: output the pre-softmax logits
+    :return: output layer
+    """
+    shapes = [(None, None, config.getint(s, 'input_dimensions')) for s in streams]
+    lstm_size = config.getint('lstm_classifier', 'lstm_size')
+    output_classes = config.getint('lstm_classifier', 'output_classes')
+    use_peepholes = config.getboolean('lstm_classifier', 'use_peepholes')
+    fusiontype = config.get('lstm_classifier', 'fusiontype') if len(streams) > 1 else None
+    use_dropout = config.getboolean('lstm_classifier', 'use_dropout') \
+        if config.has_option('lstm_classifier', 'use_dropout') else False
+    pretrained = all(lstm is not None for lstm in lstms)
+    stream_args = [a for shape, var in zip(shapes, input_vars) for a in (shape, var)]
+    kwargs = dict(w_init_fn=w_init_fn, use_peepholes=use_peepholes, output_logits=output_logits)
+
+    if use_dropout and len(streams) != 3:
+        raise ValueError('use_dropout is only supported for 3 streams')
+    if len(streams) == 1:
+        return deltanet_majority_vote.create_model(decoders[0], shapes[0], input_vars[0], (None, None), mask,
+                                                   lstm_size, window, output_classes, **kwargs)
+    if len(streams) == 2 and pretrained:
+        network, l_fuse = adenet_2stream.create_pretrained_model(decoders[0], lstms[0], decoders[1], lstms[1],
+                                                                 *(stream_args + [(None, None), mask, lstm_size,
+                                                                                  window, output_classes,
+                                                                                  fusiontype]), **kwargs)
+    elif len(streams) == 2:
+        network, l_fuse = adenet_v2_2.create_model(decoders[0], decoders[1], shapes[0], input_vars[0],
+                                                   (None, None), mask, shapes[1], input_vars[1],
+                                                   lstm_size, window, output_classes, fusiontype, **kwargs)
+    elif len(streams) == 3 and pretrained:
+        network, l_fuse = adenet_3stream.create_pretrained_model(decoders[0], lstms[0], decoders[1], lstms[1],
+                                                                 decoders[2], lstms[2],
+                                                                 *(stream_args + [(None, None), mask, lstm_size,
+                                                                                  window, output_classes,
+                                                                                  fusiontype]), **kwargs)
+    elif len(streams) == 3:
+        model = adenet_3stream_dropout if use_dropout else adenet_3stream
+        network, l_fuse = model.create_model(*(decoders + stream_args + [(None, None), mask, lstm_size, window,
+                                                                         output_classes, fusiontype]), **kwargs)
+    elif len(streams) == 4:
+        network, l_fuse = adenet_4stream.create_model(*(decoders + stream_args + [(None, None), mask, lstm_size,
+                                                                                  window, output_classes,
+                                                                                  fusiontype]), **kwargs)
+    else:
+        raise ValueError('no model for {} streams'.format(len(streams)))
+    return network
+
+
+def parse_options(default_config='config/bimodal_meanrm_raw_diff.ini'):
+    options = dict()
+    options['config'] = default_config
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', help='[CONFIG_FILE] config file to use, default={}'.format(default_config))
+    parser.add_argument('--streams', help='[STREAMS] comma separated stream sections to use, '
+                                          'default=[training] streams or all stream sections')
+    parser.add_argument('--write_results', help='[FILE] write results to file')
+    parser.add_argument('--learning_rate', help='[LEARNING_RATE] learning rate')
+    parser.add_argument('--save_best', help='[FILE] save the best model')
+    parser.add_argument('--save_plot', help='[FILE_PREFIX] plot the train/validation '
+                                            'loss curve using user supplied prefix')
+    parser.add_argument('--preprocess_only', action='store_true', help='only preprocess the data, e.g. to fill '
+                                                                       'the preprocessing cache')
+    args = parser.parse_args()
+    if args.config:
+        options['config'] = args.config
+    if args.streams:
+        options['streams'] = [s.strip() for s in args.streams.split(',')]
+    if args.write_results:
+        options['write_results'] = args.write_results
+    if args.learning_rate:
+        options['learning_rate'] = float(args.learning_rate)
+    if args.save_best:
+        options['save_best'] = args.save_best
+    if args.save_plot:
+        options['save_plot'] = args.save_plot
+    if args.preprocess_only:
+        options['preprocess_only'] = True
+    return options
+
+
+def main(default_config='config/bimodal_meanrm_raw_diff.ini', streams=None):
+    """
+    :param default_config: config file used if --config is not given
+    :param streams: stream section names used if --streams is not given, default: get_streams(config)
+    """
+    # plotting is only imported by the runner, so the data and model functions import without matplotlib
+    import matplotlib
+    matplotlib.use('Agg')  # Change matplotlib backend, in case we have no X server running..
+    from utils.plotting_utils import print_network, plot_confusion_matrix, plot_validation_cost
+
+    configure_theano()
+    options = parse_options(default_config)
+    config_file = options['config']
+    config = ConfigParser.ConfigParser()
+    config.read(config_file)
+    streams = options['streams'] if 'streams' in options else streams if streams else get_streams(config)
+
+    print('CLI options: {}'.format(options.items()))
+
+    print('Reading Config File: {}...'.format(config_file))
+    for s in streams:
+        print(config.items(s))
+    print(config.items('lstm_classifier'))
+    print(config.items('training'))
+
+    print('preprocessing dataset...')
+
+    # lstm classifier
+    weight_init = options['weight_init'] if 'weight_init' in options else config.get('lstm_classifier', 'weight_init')
+    windowsize = config.getint('lstm_classifier', 'windowsize')
+    output_classnames = config.get('lstm_classifier', 'output_classnames').split(',')
+
+    # capture training parameters
+    validation_window = int(options['validation_window']) \
+        if 'validation_window' in options else config.getint('training', 'validation_window')
+    num_epoch = int(options['num_epoch']) if 'num_epoch' in options else config.getint('training', 'num_epoch')
+    learning_rate = options['learning_rate'] if 'learning_rate' in options \
+        else config.getfloat('training', 'learning_rate')
+    epochsize = config.getint('training', 'epochsize')
+    batchsize = config.getint('training', 'batchsize')
+    fused_loss = config.getboolean('training', 'fused_loss') if config.has_option('training', 'fused_loss') else False
+    bucketing = config.getboolean('training', 'bucketing') if config.has_option('training', 'bucketing') else False
+    num_buckets = config.getint('training', 'num_buckets') if config.has_option('training', 'num_buckets') else 5
+    prefetch_depth = config.getint('training', 'prefetch_depth') \
+        if config.has_option('training', 'prefetch_depth') else 0
+    prefetch_workers = config.getint('training', 'prefetch_workers') \
+        if config.has_option('training', 'prefetch_workers') else 1
+
+    weight_init_fn = las.init.GlorotUniform()
+    if weight_init == 'glorot':
+        weight_init_fn = las.init.GlorotUniform()
+    if weight_init == 'norm':
+        weight_init_fn = las.init.Normal(0.1)
+    if weight_init == 'uniform':
+        weight_init_fn = las.init.Uniform()
+    if weight_init == 'ortho':
+        weight_init_fn = las.init.Orthogonal()
+
+    train_subject_ids = read_data_split_file(config.get('training', 'train_subjects_file'))
+    val_subject_ids = read_data_split_file(config.get('training', 'val_subjects_file'))
+    test_subject_ids = read_data_split_file(config.get('training', 'test_subjects_file'))
+
+    if config.has_option('training', 'cache_dir'):
+        cache_size = config.getint('training', 'cache_size') if config.has_option('training', 'cache_size') else None
+        # memory mapped entries are shared by concurrent runs, e.g. the trials of a sweep
+        cache_mmap = config.getboolean('training', 'cache_mmap') if config.has_option('training', 'cache_mmap') \
+            else False
+        cache = PreprocessingCache(config.get('training', 'cache_dir'), cache_size, 'c' if cache_mmap else None)
+        cache_key = cache.key([config.get(s, 'data') for s in streams] +
+                              [config.get('training', s) for s in ['train_subjects_file', 'val_subjects_file',
+                                                                   'test_subjects_file']],
+                              os.path.basename(__file__), [config.items(s) for s in streams],
+                              config.get('lstm_classifier', 'matlab_target_offset'))
+        data = cache.load_or_compute(cache_key, preprocess_data, config, streams,
+                                     train_subject_ids, val_subject_ids, test_subject_ids)
+    else:
+        data = preprocess_data(config, streams, train_subject_ids, val_subject_ids, test_subject_ids)
+    train_X, train_y, train_vidlens, train_subjects, \
+    val_X, val_y, val_vidlens, val_subjects, \
+    test_X, test_y, test_vidlens, test_subjects = data
+    if 'preprocess_only' in options:
+        return
+
+    decoders = [load_decoder(config.get(s, 'model'), config.get(s, 'shape'), config.get(s, 'nonlinearities'))
+                for s in streams]
+    lstms = [sio.loadmat(config.get(s, 'lstm_model')) if config.has_option(s, 'lstm_model') else None
+             for s in streams]
+
+    window = T.iscalar('theta')
+    inputs = [T.tensor3('inputs{}'.format(i + 1), dtype='float32') for i in range(len(streams))]
+    mask = T.matrix('mask', dtype='uint8')
+    targets = T.imatrix('targets')
+
+    print('constructing end to end model...')
+    network = create_model(config, streams, decoders, lstms, inputs, mask, window, weight_init_fn,
+                           output_logits=fused_loss)
+
+    print_network(network)
+    print('compiling model...')
+    predictions = las.layers.get_output(network, deterministic=False)
+    all_params = las.layers.get_all_params(network, trainable=True)
+    if fused_loss:
+        # the network outputs logits, the log-softmax is fused into the loss
+        cost = temporal_logsoftmax_loss(predictions, targets, mask)
+    else:
+        cost = temporal_softmax_loss(predictions, targets, mask)
+    updates = adam(cost, all_params, learning_rate=learning_rate)
+
+    test_predictions = las.layers.get_output(network, deterministic=True)
+    if fused_loss:
+        test_cost = temporal_logsoftmax_loss(test_predictions, targets, mask)
+        test_predictions = temporal_softmax(test_predictions)
+    else:
+        test_cost = temporal_softmax_loss(test_predictions, targets, mask)
+
+    def compile_functions():
+        train = theano.function(inputs + [targets, mask, window], cost, updates=updates, allow_input_downcast=True)
+        compute_train_cost = theano.function(inputs + [targets, mask, window], cost, allow_input_downcast=True)
+        compute_test_cost = theano.function(inputs + [targets, mask, window], test_cost, allow_input_downcast=True)
+        val_fn = theano.function(inputs + [mask, window], test_predictions, allow_input_downcast=True)
+        return train, compute_train_cost, compute_test_cost, val_fn
+
+    if config.has_option('training', 'function_cache_dir'):
+        function_cache = CompiledFunctionCache(config.get('training', 'function_cache_dir'))
+        # the graphs cover the model, losses and updates, the source of compile_functions the function signatures
+        graphs = describe_graph([cost, test_cost, test_predictions] + list(updates.keys()) + list(updates.values()))
+        function_key = function_cache.key(network, graphs, inspect.getsource(compile_functions))
+        train, compute_train_cost, compute_test_cost, val_fn = function_cache.load_or_compile(function_key, network,
+                                                                                              compile_functions)
+    else:
+        train, compute_train_cost, compute_test_cost, val_fn = compile_functions()
+
+    print('begin training...')
+    cost_train = []
+    cost_val = []
+    class_rate = []
+    STRIP_SIZE = 3
+    val_window = circular_list(validation_window)
+    train_strip = np.zeros((STRIP_SIZE,))
+    best_val = float('inf')
+    best_cr = 0.0
+
+    # the generators only pick the sequences of each batch, the prefetcher gathers all streams at once
+    if bucketing:
+        datagen = gen_lstm_idx_batch_bucketed(train_y, train_vidlens, batchsize=batchsize, num_buckets=num_buckets)
+    else:
+        datagen = gen_lstm_idx_batch_random(train_y, train_vidlens, batchsize=batchsize)
+    integral_lens = compute_integral_len(train_vidlens)
+    datagen = BatchPrefetcher(datagen, train_X, train_vidlens, integral_lens,
+                              depth=prefetch_depth, workers=prefetch_workers)
+
+    # We'll use this "validation set" to periodically check progress, and the test set to check
+    # the final classification rate
+    idxs_val = np.arange(len(val_vidlens))
+    X_val = gather_seq_batches(val_X, idxs_val, val_vidlens, compute_integral_len(val_vidlens), np.max(val_vidlens))
+    mask_val = (np.arange(np.max(val_vidlens)) < val_vidlens.reshape((-1, 1))).astype('uint8')
+    idxs_test = np.arange(len(test_vidlens))
+    X_test = gather_seq_batches(test_X, idxs_test, test_vidlens, compute_integral_len(test_vidlens),
+                                np.max(test_vidlens))
+    mask_test = (np.arange(np.max(test_vidlens)) < test_vidlens.reshape((-1, 1))).astype('uint8')
+    y_test = test_y[compute_integral_len(test_vidlens)]
+
+    # reshape the targets for validation
+    y_val_evaluate = val_y[compute_integral_len(val_vidlens)]
+    y_val = y_val_evaluate.reshape((-1, 1)).repeat(mask_val.shape[-1], axis=-1)
+
+    for epoch in range(num_epoch):
+        time_start = time.time()
+        datagen.wait_time = 0.
+        compute_time = 0.
+        for i in range(epochsize):
+            Xs, y, m, batch_idxs = next(datagen)
+            # repeat targets based on max sequence len
+            y = y.reshape((-1, 1))
+            y = y.repeat(m.shape[-1], axis=-1)
+            print_str = 'Epoch {} batch {}/{}: {} examples using adam with learning rate = {}'.format(
+                epoch + 1, i + 1, epochsize, len(y), learning_rate)
+            print(print_str, end='')
+            sys.stdout.flush()
+            time_compute = time.time()
+            train(*(Xs + [y, m, windowsize]))
+            compute_time += time.time() - time_compute
+            print('\r', end='')
+        print('Epoch {} data wait = {:.1f}sec, compute = {:.1f}sec'.format(epoch + 1, datagen.wait_time,
+                                                                            compute_time))
+        cost = compute_train_cost(*(Xs + [y, m, windowsize]))
+        val_cost = compute_test_cost(*(X_val + [y_val, mask_val, windowsize]))
+        cost_train.append(cost)
+        cost_val.append(val_cost)
+        train_strip[epoch % STRIP_SIZE] = cost
+        val_window.push(val_cost)
+
+        gl = 100 * (cost_val[-1] / np.min(cost_val) - 1)
+        pk = 1000 * (np.sum(train_strip) / (STRIP_SIZE * np.min(train_strip)) - 1)
+        pq = gl / pk
+
+        cr, val_conf = evaluate_model(X_val, y_val_evaluate, mask_val, windowsize, val_fn)
+        class_rate.append(cr)
+
+        if val_cost < best_val:
+            best_val = val_cost
+            best_cr = cr
+            test_cr, test_conf = evaluate_model(X_test, y_test, mask_test, windowsize, val_fn)
+            print("Epoch {} train cost = {}, val cost = {}, "
+                  "GL loss = {:.3f}, GQ = {:.3f}, CR = {:.3f}, Test CR= {:.3f} ({:.1f}sec)"
+                  .format(epoch + 1, cost_train[-1], cost_val[-1], gl, pq, cr, test_cr, time.time() - time_start))
+            best_params = las.layers.get_all_param_values(network)
+        else:
+            print("Epoch {} train cost = {}, val cost = {}, "
+                  "GL loss = {:.3f}, GQ = {:.3f}, CR = {:.3f} ({:.1f}sec)"
+                  .format(epoch + 1, cost_train[-1], cost_val[-1], gl, pq, cr, time.time() - time_start))
+
+        if epoch >= validation_window and early_stop2(val_window, best_val, validation_window):
+            break
+
+    datagen.close()
+
+    print('Final Model')
+    print('CR: {}, val loss: {}, Test CR: {}'.format(best_cr, best_val, test_cr))
+
+    # plot confusion matrix
+    table_str = plot_confusion_matrix(test_conf, output_classnames, fmt='pipe')
+    print('confusion matrix: ')
+    print(table_str)
+
+    if 'save_plot' in options:
+        prefix = options['save_plot']
+        plot_validation_cost(cost_train, cost_val, savefilename='{}.validloss.png'.format(prefix))
+        with open('{}.confmat.txt'.format(prefix), mode='a') as f:
+            f.write(table_str)
+            f.write('\n\n')
+
+    if 'write_results' in options:
+        print('writing results to {}'.format(options['write_results']))
+        results_file = options['write_results']
+        with open(results_file, mode='a') as f:
+            f.write('{},{},{}\n'.format(test_cr, best_cr, best_val))
+
+    if 'save_best' in options:
+        print('saving best model...')
+        las.layers.set_all_param_values(network, best_params)
+        save_model_params(network, options['save_best'])
+        print('best model saved to {}'.format(options['save_best']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+runs a parallel hyperparameter sweep over the ini config of a runner, see utils/sweep.py for the spec format
+"""
+from __future__ import print_function
+import sys
+
+sys.path.insert(0, '../')
+import argparse
+import multiprocessing
+
+from utils.sweep import load_spec, run_sweep
+
+
+def parse_options():
+    options = dict()
+    options['out_dir'] = 'sweep'
+    options['threads'] = 1
+    options['min_epochs'] = 5
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spec', required=True, help='[SPEC_FILE] json sweep spec')
+    parser.add_argument('--out_dir', help='[DIR] trial configs, logs and results, default=sweep')
+    parser.add_argument('--workers', help='[WORKERS] trials run in parallel, default=cores / threads')
+    parser.add_argument('--threads', help='[THREADS] OMP_NUM_THREADS of each trial, default=1')
+    parser.add_argument('--min_epochs', help='[EPOCHS] epochs before a trial can be stopped early, '
+                                             '0 disables early stopping, default=5')
+    args = parser.parse_args()
+    options['spec'] = args.spec
+    if args.out_dir:
+        options['out_dir'] = args.out_dir
+    if args.threads:
+        options['threads'] = int(args.threads)
+    if args.min_epochs:
+        options['min_epochs'] = int(args.min_epochs)
+    options['workers'] = int(args.workers) if args.workers \
+        else max(1, multiprocessing.cpu_count() // options['threads'])
+    return options
+
+
+def main():
+    options = parse_options()
+    spec = load_spec(options['spec'])
+    run_sweep(spec, options['out_dir'], options['workers'], options['threads'], options['min_epochs'])
+
+
+if __name__ == '__main__':
+    main()
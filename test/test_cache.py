@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from utils.cache import PreprocessingCache
+
+
+class TestPreprocessingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_or_compute(self):
+        data_file = os.path.join(self.tmpdir, 'data.txt')
+        with open(data_file, 'w') as f:
+            f.write('1,2,3')
+        cache = PreprocessingCache(os.path.join(self.tmpdir, 'cache'))
+        key = cache.key([data_file], [('meanremove', 'true')])
+        assert key == cache.key([data_file], [('meanremove', 'true')])
+        assert key != cache.key([data_file], [('meanremove', 'false')])
+
+        calls = []
+
+        def preprocess(X):
+            calls.append(X)
+            return [X, X * 2], X.sum(axis=1), np.arange(3)
+
+        X = np.random.rand(3, 4).astype('float32')
+        expected = preprocess(X)
+        for _ in range(2):
+            res = cache.load_or_compute(key, preprocess, X)
+            assert np.array_equal(res[0][0], expected[0][0]) and np.array_equal(res[0][1], expected[0][1])
+            assert np.array_equal(res[1], expected[1]) and np.array_equal(res[2], expected[2])
+        assert len(calls) == 2  # computed once by load_or_compute
+
+        with open(data_file, 'w') as f:
+            f.write('1,2,4')
+        assert key != cache.key([data_file], [('meanremove', 'true')])
+
+    def test_lru_eviction(self):
+        cache = PreprocessingCache(os.path.join(self.tmpdir, 'cache'), max_size_mb=1)
+        X = np.zeros((75, 1024), dtype='float32')  # ~300KB per entry, 3 fit into the cache
+        for key in ['a', 'b', 'c']:
+            cache.save(key, [X])
+            os.utime(cache._path(key), (0, {'a': 1, 'b': 2, 'c': 3}[key]))
+        cache.load('a')  # a becomes the most recently used
+        cache.save('d', [X])
+        assert cache.load('b') is None
+        assert cache.load('a') is not None and cache.load('c') is not None and cache.load('d') is not None
+
+    def test_mmap(self):
+        cache = PreprocessingCache(os.path.join(self.tmpdir, 'cache'), max_size_mb=1, mmap_mode='c')
+        X = np.random.rand(75, 1024).astype('float32')
+        res = cache.load_or_compute('a', lambda: ([X, X * 2], X[:, 0]))
+        assert isinstance(res[0][0], np.memmap)
+        assert np.array_equal(res[0][1], X * 2) and np.array_equal(res[1], X[:, 0])
+        res[0][0][0] = 0  # copy on write, the cache entry is unchanged
+        assert np.array_equal(cache.load('a')[0][0], X)
+        # an entry stored concurrently by another run is kept
+        cache.save('a', [X * 3])
+        assert np.array_equal(cache.load('a')[0][0], X)
+        assert [f for f in os.listdir(cache.cache_dir) if f.endswith('.tmp')] == []
+
+        other = os.path.join(cache.cache_dir, 'notes.txt')  # files that are no cache entries are not evicted
+        with open(other, 'w') as f:
+            f.write('x' * 1024)
+        os.utime(other, (0, 0))
+        os.utime(cache._path('a'), (0, 1))
+        for key in ['b', 'c']:
+            cache.save(key, [X])
+        assert cache.load('a') is None and cache.load('b') is not None and cache.load('c') is not None
+        assert os.path.isfile(other)
+
+
+if __name__ == '__main__':
+    unittest.main()
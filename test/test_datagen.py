@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from utils.datagen import *
+
+
+class TestDatagenMethods(unittest.TestCase):
+    def test_bucketed_batches(self):
+        seqlens = np.random.randint(1, 50, size=90)
+        X = np.random.randn(np.sum(seqlens), 7).astype('float32')
+        y = np.repeat(np.arange(len(seqlens)) % 10, seqlens)
+        integral_lens = compute_integral_len(seqlens)
+
+        datagen = gen_lstm_batch_bucketed(X, y, seqlens, batchsize=10, num_buckets=3)
+        seen = []
+        for _ in range(9):  # 1 epoch, 3 buckets of 30 videos
+            X_batch, y_batch, mask, idxs = next(datagen)
+            lens = seqlens[idxs]
+            assert X_batch.shape == (len(idxs), np.max(lens), 7)
+            assert X_batch.flags['C_CONTIGUOUS']
+            assert np.array_equal(np.sum(mask, axis=-1), lens)
+            for i, idx in enumerate(idxs):
+                start = integral_lens[idx]
+                assert np.array_equal(X_batch[i, :lens[i]], X[start:start + lens[i]])
+                assert np.all(X_batch[i, lens[i]:] == 0)
+                assert y_batch[i] == y[start]
+            seen += list(idxs)
+        assert sorted(seen) == list(range(len(seqlens)))
+
+    def test_batch_prefetcher(self):
+        seqlens = np.random.randint(1, 20, size=40)
+        X = np.random.randn(np.sum(seqlens), 5).astype('float32')
+        y = np.zeros((len(X),), dtype='uint8')
+        integral_lens = compute_integral_len(seqlens)
+
+        for depth, workers in [(0, 1), (3, 2)]:
+            for datagen in [gen_lstm_idx_batch_random(y, seqlens, batchsize=8),
+                            gen_lstm_idx_batch_bucketed(y, seqlens, batchsize=8, num_buckets=3)]:
+                loader = BatchPrefetcher(datagen, [X, X * 2], seqlens, integral_lens, depth=depth, workers=workers)
+                for _ in range(10):
+                    (X_batch, X2_batch), y_batch, mask, idxs = next(loader)
+                    assert np.array_equal(X_batch, gen_seq_batch_from_idx(X, idxs, seqlens, integral_lens,
+                                                                          mask.shape[-1]))
+                    assert np.array_equal(np.sum(mask, axis=-1), seqlens[idxs])
+                    assert np.array_equal(X2_batch, X_batch * 2)
+                loader.close()
+
+    def test_gather_seq_batches(self):
+        seqlens = np.random.randint(1, 20, size=30)
+        integral_lens = compute_integral_len(seqlens)
+        streams = [np.random.randn(np.sum(seqlens), d).astype('float32') for d in [3, 5]]
+        idxs = np.random.permutation(30)[:8]
+        max_timesteps = np.max(seqlens[idxs]) + 2
+        batches = gather_seq_batches(streams, idxs, seqlens, integral_lens, max_timesteps)
+        for data, X_batch in zip(streams, batches):
+            assert X_batch.shape == (8, max_timesteps, data.shape[1])
+            for i, idx in enumerate(idxs):
+                start = integral_lens[idx]
+                assert np.array_equal(X_batch[i, :seqlens[idx]], data[start:start + seqlens[idx]])
+                assert np.all(X_batch[i, seqlens[idx]:] == 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import numpy as np
+from utils.evaluation import *
+
+
+class TestEvaluationMethods(unittest.TestCase):
+    def test_evaluate_sequences(self):
+        num_classes = 6
+        seq_lens = np.random.randint(0, 12, size=40)
+        output = np.random.rand(40, 12, num_classes)
+        mask = (np.arange(12) < seq_lens[:, None]).astype('uint8')
+        y = np.random.randint(0, num_classes, size=40)
+
+        ix = np.zeros((40,), dtype='int')
+        votes = np.zeros((num_classes,), dtype='int')
+        for i, eg in enumerate(output):
+            predictions = np.argmax(eg[:seq_lens[i]], axis=-1)
+            for cls in range(num_classes):
+                votes[cls] = (predictions == cls).sum(axis=-1)
+            ix[i] = np.argmax(votes)
+        expected_confusion = np.zeros((num_classes, num_classes), dtype='int')
+        for i, target in enumerate(y):
+            expected_confusion[target, ix[i]] += 1
+
+        assert np.array_equal(majority_vote(output, mask), ix)
+        rate, confusion = evaluate_sequences(output, y, mask)
+        assert rate == np.mean(ix == y)
+        assert np.array_equal(confusion, expected_confusion)
+
+    def test_evaluate_predictions(self):
+        output = np.random.rand(30, 4)
+        y = np.random.randint(0, 4, size=30)
+        rate, confusion = evaluate_predictions(output, y)
+        assert rate == np.mean(np.argmax(output, axis=1) == y)
+        assert confusion.sum() == 30 and np.trace(confusion) == np.sum(np.argmax(output, axis=1) == y)
+
+
+if __name__ == '__main__':
+    unittest.main()
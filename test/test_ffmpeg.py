@@ -0,0 +1,67 @@
+import os
+import stat
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from utils.ffmpeg import *
+
+FAKE_FFPROBE = '''#!{python}
+import sys
+assert '-show_entries' in sys.argv and sys.argv[-1] == 'video.mpg'
+print('frame|media_type=audio|pkt_pts_time=0.000000')
+for i in range(5):
+    print('frame|media_type=video|pkt_pts_time={{:.6f}}|pkt_dts=N/A|pkt_size={{}}|width=720|height=480|'
+          'pict_type={{}}'.format(i / 25., 100 + i, 'IPB'[i % 3]))
+print('frame|media_type=video|pkt_pts_time=N/A')
+'''
+
+
+class TestFFmpegMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        ffprobe = os.path.join(self.tmpdir, 'ffprobe')
+        with open(ffprobe, 'w') as f:
+            f.write(FAKE_FFPROBE.format(python=sys.executable))
+        os.chmod(ffprobe, os.stat(ffprobe).st_mode | stat.S_IEXEC)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.tmpdir + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.tmpdir)
+
+    def test_iter_ffprobe_frames(self):
+        frames = list(iter_ffprobe_frames('video.mpg'))
+        assert len(frames) == 7
+        assert frames[0] == {'media_type': 'audio', 'pkt_pts_time': '0.000000'}
+        assert frames[2]['pkt_pts_time'] == '0.040000'
+        # closing the generator early stops ffprobe without raising
+        frames = iter_ffprobe_frames('video.mpg')
+        assert next(frames)['media_type'] == 'audio'
+        frames.close()
+        # a failing ffprobe raises instead of yielding no frames
+        with self.assertRaises(IOError):
+            list(iter_ffprobe_frames('missing.mpg'))
+
+    def test_ffprobe_frame_times(self):
+        times = ffprobe_frame_times('video.mpg')
+        assert times.dtype == np.float64
+        assert np.allclose(times[:5], np.arange(5) / 25.)
+        assert np.isnan(times[5])
+
+    def test_ffprobe_video_table(self):
+        audio, video = ffprobe_video_table('video.mpg')
+        assert audio.dtype == AUDIO_FRAME_DTYPE and video.dtype == VIDEO_FRAME_DTYPE
+        assert len(audio) == 1 and len(video) == 6
+        assert np.allclose(video['pts_time'][:5], np.arange(5) / 25.)
+        assert np.isnan(video['pts_time'][5])
+        assert np.array_equal(video['size'][:5], np.arange(100, 105))
+        assert np.all(video['dts'] == -1)
+        assert video['width'][0] == 720 and video['height'][0] == 480
+        assert list(video['pict_type'][:3]) == [b'I', b'P', b'B']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import theano
+import theano.tensor as T
+import lasagne as las
+from lasagne.layers import InputLayer, DenseLayer, DropoutLayer
+from utils.function_cache import *
+
+
+def build_network(inputs, W):
+    l_in = InputLayer((None, 4), inputs)
+    return DenseLayer(l_in, num_units=3, W=W, nonlinearity=las.nonlinearities.softmax, name='softmax')
+
+
+def compile_train(network, inputs, targets):
+    cost = T.mean(las.objectives.categorical_crossentropy(las.layers.get_output(network), targets))
+    updates = las.updates.sgd(cost, las.layers.get_all_params(network, trainable=True), learning_rate=0.1)
+    return theano.function([inputs, targets], cost, updates=updates),
+
+
+class TestFunctionCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_load_or_compile(self):
+        inputs = T.matrix('inputs')
+        targets = T.ivector('targets')
+        X = np.random.rand(10, 4).astype(theano.config.floatX)
+        y = np.random.randint(0, 3, size=10).astype('int32')
+        W = np.random.rand(4, 3).astype(theano.config.floatX)
+
+        cache = CompiledFunctionCache(self.cache_dir)
+        network = build_network(inputs, W)
+        key = cache.key(network, 0.1)
+        train, = cache.load_or_compile(key, network, compile_train, network, inputs, targets)
+        expected = [train(X, y) for _ in range(3)]
+        expected_W = network.W.get_value()
+
+        # a new network with the same architecture and initial weights, the functions are loaded
+        network = build_network(inputs, W)
+        assert cache.key(network, 0.1) == key
+        assert cache.key(network, 0.01) != key
+        train, = cache.load_or_compile(key, network, None)
+        assert np.allclose([train(X, y) for _ in range(3)], expected)
+        assert np.allclose(network.W.get_value(), expected_W)
+
+    def test_key_options(self):
+        inputs = T.matrix('inputs')
+        cache = CompiledFunctionCache(self.cache_dir)
+        l_in = InputLayer((None, 4), inputs)
+        # options that change the graph but not the parameters change the key
+        assert cache.key(DropoutLayer(l_in, p=0.5)) == cache.key(DropoutLayer(l_in, p=0.5))
+        assert cache.key(DropoutLayer(l_in, p=0.5)) != cache.key(DropoutLayer(l_in, p=0.3))
+
+    def test_describe_graph(self):
+        inputs = T.matrix('inputs')
+        targets = T.ivector('targets')
+        W = np.random.rand(4, 3).astype(theano.config.floatX)
+
+        def graph(clip):
+            output = las.layers.get_output(build_network(inputs, W))
+            return T.mean(las.objectives.categorical_crossentropy(T.clip(output, clip, 1 - clip), targets))
+
+        # graphs changed beyond the layers, e.g. in the loss, change the description
+        assert describe_graph([graph(1e-7)]) == describe_graph([graph(1e-7)])
+        assert describe_graph([graph(1e-7)]) != describe_graph([graph(1e-6)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from utils.io import *
+
+
+class TestIOMethods(unittest.TestCase):
+    def test_npy_store(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            vidlens = np.array([[3], [5], [2]])
+            data = {'dataMatrix': np.random.rand(10, 4), 'targetsVec': np.array([[1]] * 3 + [[2]] * 5 + [[3]] * 2),
+                    'subjectsVec': np.array([[1], [1], [2]]), 'videoLengthVec': vidlens}
+            mat_path = os.path.join(tmpdir, 'data.mat')
+            store_path = os.path.join(tmpdir, 'data')
+            save_mat(data, mat_path)
+            convert_mat_to_npy_store(mat_path, store_path)
+
+            store = load_mat_file(store_path)
+            assert isinstance(store['dataMatrix'], np.memmap)
+            assert store['dataMatrix'].dtype == np.float32
+            assert np.allclose(store['dataMatrix'], data['dataMatrix'])
+            for k in ['targetsVec', 'subjectsVec', 'videoLengthVec']:
+                assert np.array_equal(store[k], data[k])
+            assert np.array_equal(store['videoOffsetVec'], [0, 3, 8])
+            # zero-copy float32 view, copy-on-write leaves the store untouched
+            X = store['dataMatrix'].astype('float32', copy=False)
+            X -= 1
+            assert np.allclose(load_npy_store(store_path)['dataMatrix'], data['dataMatrix'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+import numpy as np
+import theano
+import theano.tensor as T
+from lasagne.layers import InputLayer, get_output
+from custom.layers import MajorityVotingLayer
+
+
+class TestLayers(unittest.TestCase):
+    def test_majority_voting_layer(self):
+        num_classes = 5
+        inputs = T.tensor3('inputs', dtype='float32')
+        mask = T.matrix('mask', dtype='uint8')
+        l_in = InputLayer((None, None, num_classes), inputs)
+        l_mask = InputLayer((None, None), mask)
+        hard = theano.function([inputs, mask], get_output(MajorityVotingLayer(l_in, num_classes, l_mask)))
+        soft = theano.function([inputs, mask], get_output(MajorityVotingLayer(l_in, num_classes, l_mask, soft=True)))
+
+        seq_lens = np.array([6, 1, 3, 0])
+        X = np.random.rand(4, 6, num_classes).astype('float32')
+        m = (np.arange(6) < seq_lens[:, None]).astype('uint8')
+        votes = np.zeros((4, num_classes), dtype='float32')
+        for i in range(4):
+            votes[i] = np.bincount(np.argmax(X[i, :seq_lens[i]], axis=-1), minlength=num_classes)
+        expected = np.exp(votes) / np.sum(np.exp(votes), axis=-1, keepdims=True)
+        assert np.allclose(hard(X, m), expected)
+        expected = np.sum(X * m[:, :, None], axis=1) / np.maximum(seq_lens, 1)[:, None]
+        assert np.allclose(soft(X, m), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+import numpy as np
+import theano
+from utils.lcn import *
+
+
+class TestLCN(unittest.TestCase):
+    def test_lcn_numpy_matches_theano(self):
+        images = np.random.rand(5, 12 * 10).astype(theano.config.floatX)
+        lcn = make_lecun_lcn((5, 1, 12, 10), (12, 10), 5, threshold=0.01)
+        assert make_lecun_lcn((1, 1, 12, 10), (12, 10), 5, threshold=0.01) is lcn  # cached
+        expected = lcn(images.reshape((5, 1, 12, 10)))
+        res = lecun_lcn_numpy(images.reshape((5, 12, 10)), 5, threshold=0.01)
+        assert np.allclose(res, expected, atol=1e-4)
+        chunked = lcn_images(images, (12, 10), 5, threshold=0.01, batchsize=2)
+        assert np.allclose(chunked, expected.reshape((5, -1)))
+        assert np.allclose(lcn_images(images, (12, 10), 5, threshold=0.01, use_theano=False), chunked, atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import ConfigParser
+import numpy as np
+import scipy.io as sio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'runners'))
+import nstream
+from utils.preprocessing import multistream_force_align, sequencewise_mean_image_subtraction
+
+
+class TestPreprocessData(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_stream(self, name, lens, features, rng):
+        lens = np.array(lens)
+        data = {'dataMatrix': rng.rand(np.sum(lens), features).astype('float32'),
+                'targetsVec': np.repeat(np.arange(len(lens)) % 2 + 1, lens).reshape((-1, 1)),
+                'subjectsVec': np.array([1, 2, 3]).reshape((-1, 1)),
+                'videoLengthVec': lens.reshape((-1, 1))}
+        path = os.path.join(self.tmpdir, name + '.mat')
+        sio.savemat(path, data)
+        return path, data
+
+    def test_force_align_two_streams(self):
+        rng = np.random.RandomState(0)
+        s1_path, s1 = self._write_stream('s1', [3, 4, 2], 5, rng)
+        s2_path, s2 = self._write_stream('s2', [2, 6, 2], 3, rng)
+        config = ConfigParser.ConfigParser()
+        config.add_section('lstm_classifier')
+        config.set('lstm_classifier', 'matlab_target_offset', 'true')
+        for name, path, features in [('stream1', s1_path, 5), ('stream2', s2_path, 3)]:
+            config.add_section(name)
+            for option, value in [('data', path), ('imagesize', '{},1'.format(features)), ('reorderdata', 'false'),
+                                  ('diffimage', 'false'), ('meanremove', 'true'),
+                                  ('samplewisenormalize', 'false'), ('featurewisenormalize', 'false'),
+                                  ('force_align_data', 'true')]:
+                config.set(name, option, value)
+
+        train_X, train_y, train_vidlens, _, val_X, _, _, _, test_X, _, _, _ = \
+            nstream.preprocess_data(config, ['stream1', 'stream2'], [1], [2], [3])
+
+        aligned = multistream_force_align([(s['dataMatrix'], s['targetsVec'].reshape((-1,)),
+                                            s['videoLengthVec'].reshape((-1,))) for s in [s1, s2]])
+        lens = aligned[0][2]
+        assert np.all(lens == [3, 6, 2])
+        assert np.all(train_vidlens == [3])
+        assert np.all(train_y == aligned[0][1][:3] - 1)
+        for i, (X, _, _) in enumerate(aligned):
+            # each stream is mean removed over the aligned sequences
+            expected = sequencewise_mean_image_subtraction(X, lens)
+            assert np.allclose(train_X[i], expected[:3])
+            assert np.allclose(val_X[i], expected[3:9])
+            assert np.allclose(test_X[i], expected[9:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+import theano
+import theano.tensor as T
+from custom.objectives import *
+
+
+class TestObjectives(unittest.TestCase):
+    def test_temporal_logsoftmax_loss(self):
+        x = T.tensor3('x')
+        y = T.imatrix('y')
+        mask = T.matrix('mask', dtype='uint8')
+        fused = theano.function([x, y, mask], temporal_logsoftmax_loss(x, y, mask), allow_input_downcast=True)
+        softmax = theano.function([x], temporal_softmax(x))
+
+        logits = np.random.randn(4, 7, 5)
+        targets = np.random.randint(0, 5, size=(4, 7))
+        m = (np.arange(7) < np.array([7, 3, 1, 5])[:, None]).astype('uint8')
+        probs = np.exp(logits) / np.sum(np.exp(logits), axis=-1, keepdims=True)
+        assert np.allclose(softmax(logits), probs)
+        log_probs = np.log(probs[np.arange(4)[:, None], np.arange(7), targets])
+        assert np.allclose(fused(logits, targets, m), -np.sum(log_probs * m) / np.sum(m))
+
+        # large logits underflow the probability of the target class
+        logits[0, 0] = [300, -300, 0, 0, 0]
+        targets[0, 0] = 1
+        assert np.isfinite(fused(logits, targets, m))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import imp
+import unittest
+import numpy as np
+
+prepare_data = imp.load_source('oulu_prepare_data', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  '..', 'oulu', 'prepare_data.py'))
+
+
+def segment_frames_loop(pts_times, htk_labels):
+    """
+    the per frame loop segment_frames replaced, it stops at the last frame instead of
+    indexing past it
+    """
+    current_frame = 0
+    idxes = []
+    seq_lens = []
+    labels = []
+    for start, end, label in htk_labels:
+        start = int(start)
+        end = int(end)
+        number = prepare_data.digit_to_int(label)
+        seq_len = 0
+        while current_frame < len(pts_times):
+            pts_time = prepare_data.to_100ns(pts_times[current_frame])
+            if start < pts_time <= end:
+                idxes.append(current_frame)
+                labels.append(number)
+                seq_len += 1
+                current_frame += 1
+            else:
+                if pts_time > end:
+                    break
+                current_frame += 1
+        seq_lens.append(seq_len)
+    return idxes, seq_lens, labels
+
+
+class TestSegmentFrames(unittest.TestCase):
+    def check(self, pts_times, htk_labels):
+        idxes, seq_lens, labels = prepare_data.segment_frames(pts_times, htk_labels)
+        expected = segment_frames_loop(pts_times, htk_labels)
+        assert np.array_equal(idxes, expected[0])
+        assert np.array_equal(seq_lens, expected[1])
+        assert np.array_equal(labels, expected[2])
+        return idxes, seq_lens, labels
+
+    def test_segment_frames(self):
+        pts_times = np.arange(100) / 25.
+        # frame 10 is exactly on the boundary of the first two labels, labels start after the
+        # last frame at 3.96s
+        htk_labels = [('2000000', '4000000', 'zero'), ('4000000', '8000000', 'one'),
+                      ('9000000', '9100000', 'two'), ('12000000', '36000000', 'three'),
+                      ('39000000', '45000000', 'four'), ('50000000', '60000000', 'five')]
+        assert prepare_data.to_100ns(pts_times[10]) == 4000000
+        idxes, seq_lens, labels = self.check(pts_times, htk_labels)
+        assert list(seq_lens) == [5, 10, 0, 60, 2, 0]
+        assert idxes[4] == 10 and labels[4] == 0 and idxes[5] == 11
+
+        rng = np.random.RandomState(0)
+        for _ in range(20):
+            pts_times = np.cumsum(rng.uniform(0.02, 0.05, size=rng.randint(1, 200)))
+            bounds = np.sort(rng.choice(int(pts_times[-1] * 1.2 * 10000000), size=2 * rng.randint(1, 10),
+                                        replace=False))
+            digits = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine']
+            self.check(pts_times, [(str(s), str(e), digits[rng.randint(10)])
+                                   for s, e in zip(bounds[::2], bounds[1::2])])
+
+    def test_no_labels(self):
+        idxes, seq_lens, labels = self.check(np.arange(10) / 25., [])
+        assert len(idxes) == 0 and len(seq_lens) == 0 and len(labels) == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
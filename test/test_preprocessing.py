@@ -1,4 +1,8 @@
+import os
+import shutil
+import tempfile
 import unittest
+import ConfigParser
 from utils.io import *
 from utils.preprocessing import *
 
@@ -67,5 +71,168 @@ class TestPreprocessingMethods(unittest.TestCase):
         assert len(a[0][1]) == len(a[1][1]) == len(a[2][1]) == len(a[3][1])
         assert len(a[0][2]) == len(a[1][2]) == len(a[2][2]) == len(a[3][2])
 
+    def test_force_align_modes(self):
+        s1_lens = np.array([3, 1, 4])
+        s2_lens = np.array([2, 3, 4])
+        s1 = np.arange(np.sum(s1_lens)).reshape((-1, 1)), np.repeat([0, 1, 2], s1_lens), s1_lens
+        s2 = np.arange(np.sum(s2_lens)).reshape((-1, 1)) + 100, np.repeat([0, 1, 2], s2_lens), s2_lens
+
+        (X1, y1, l1), (X2, y2, l2) = force_align(s1, s2)
+        assert np.array_equal(X1.reshape((-1,)), [0, 1, 2, 3, 3, 3, 4, 5, 6, 7])
+        assert np.array_equal(X2.reshape((-1,)), [100, 101, 101, 102, 103, 104, 105, 106, 107, 108])
+        assert np.array_equal(y1, y2)
+        assert np.array_equal(l1, [3, 3, 4]) and np.array_equal(l2, [3, 3, 4])
+        assert np.array_equal(s1_lens, [3, 1, 4])  # inputs are left untouched
+
+        (X1, y1, l1), (X2, y2, l2) = force_align(s1, s2, mode='discard')
+        assert np.array_equal(X1.reshape((-1,)), [0, 1, 3, 4, 5, 6, 7])
+        assert np.array_equal(X2.reshape((-1,)), [100, 101, 102, 105, 106, 107, 108])
+        assert np.array_equal(l1, [2, 1, 4])
+
+    def test_embed_temporal_info(self):
+        X = np.array([1, 2, 3, 4, 5, 6, 10, 20, 30]).reshape((-1, 1))
+        y = np.array([0] * 6 + [1] * 3)
+        lens = np.array([6, 3])
+        res, res_y, res_lens = embed_temporal_info(X, y, lens, 1, 3)
+        assert np.array_equal(res, [[1, 2, 3], [4, 5, 6], [10, 20, 30]])
+        assert np.array_equal(res_y, [0, 0, 1]) and np.array_equal(res_lens, [2, 1])
+        res, res_y, res_lens = embed_temporal_info(X, y, lens, 1, 1)
+        assert np.array_equal(res[:3], [[1, 1, 2], [1, 2, 3], [2, 3, 4]])
+        assert np.array_equal(res[-1], [20, 30, 30])
+        chunks = list(iter_embed_temporal_info(X, y, lens, 1, 1, max_frames=4))
+        assert len(chunks) == 2
+        assert np.array_equal(np.concatenate([c[0] for c in chunks]), res)
+
+    def test_factorize(self):
+        lens = np.array([4, 7, 3, 5])
+        X = np.arange(np.sum(lens))
+        y = np.repeat(np.arange(len(lens)), lens)
+        X_new, y_new, lens_new = factorize(X, y, lens, 3, 0, rng=np.random.RandomState(1))
+        assert np.array_equal(lens_new, [3, 6, 3, 3])
+        assert np.array_equal(np.bincount(y_new), lens_new)
+        assert np.array_equal(X_new.reshape((-1,)), np.sort(X_new.reshape((-1,))))
+        assert np.array_equal(X_new, factorize(X, y, lens, 3, 0, rng=np.random.RandomState(1))[0])
+
+    def test_resize_images_batched(self):
+        X = np.random.rand(6, 60 * 80).astype('float32')
+        rows = bilinear_resize_matrix(60, 30)
+        cols = bilinear_resize_matrix(80, 40)
+        for order in ['C', 'F']:
+            res = resize_images(X, (60, 80), (30, 40), order=order, batched=True)
+            assert res.dtype == np.float32 and res.shape == (6, 30 * 40)
+            for x, r in zip(X, res):
+                expected = rows.dot(x.reshape((60, 80), order=order)).dot(cols.T)
+                assert np.allclose(r.reshape((30, 40)), expected, atol=1e-5)
+            assert np.allclose(resize_images(X, (60, 80), (30, 40), order=order, batched=True, workers=2,
+                                             chunksize=4), res)
+        # constant images stay constant
+        assert np.allclose(resize_images(np.full((2, 20), 3., dtype='float32'), (4, 5), (7, 3), batched=True), 3.)
+
+    def test_concat_first_second_deltas(self):
+        rng = np.random.RandomState(0)
+        vidlens = rng.randint(2, 40, size=50)
+        X = rng.randn(np.sum(vidlens), 20).astype('float32')
+
+        for w in [3, 5, 9]:
+            # per video reference using deltas()
+            expected = np.zeros((X.shape[0], X.shape[1] * 3))
+            start = 0
+            for vidlen in vidlens:
+                end = start + vidlen
+                seq = X[start:end]
+                first_order = deltas(seq.T, w)
+                second_order = deltas(first_order, w)
+                expected[start:end] = np.concatenate((seq, first_order.T, second_order.T), axis=1)
+                start = end
+
+            Y = concat_first_second_deltas(X, vidlens, w)
+            assert Y.dtype == np.float32
+            assert Y.shape == expected.shape
+            assert np.allclose(Y, expected, rtol=1e-4, atol=1e-3)
+
+    def test_split_multistream_seq_data(self):
+        subjects = np.repeat(np.arange(1, 7), 3)
+        vidlens = np.arange(1, len(subjects) + 1)
+        X = np.repeat(subjects, vidlens).reshape((-1, 1)).astype('float32')
+        y = np.repeat(np.arange(len(subjects)), vidlens)
+
+        train_X, train_y, train_vidlens, train_subjects, \
+        val_X, val_y, val_vidlens, val_subjects, \
+        test_X, test_y, test_vidlens, test_subjects = split_multistream_seq_data([X, X * 2], y, subjects, vidlens,
+                                                                                 [1, 4], [2], [3, 5, 6])
+        for Xs, split_subjects, split_vidlens in [(train_X, train_subjects, train_vidlens),
+                                                  (val_X, val_subjects, val_vidlens),
+                                                  (test_X, test_subjects, test_vidlens)]:
+            assert len(Xs[0]) == len(Xs[1]) == np.sum(split_vidlens)
+            assert np.array_equal(Xs[0].reshape((-1,)), np.repeat(split_subjects, split_vidlens))
+            assert np.array_equal(Xs[1], Xs[0] * 2)
+        assert np.array_equal(np.unique(train_subjects), [1, 4])
+        assert np.array_equal(np.unique(val_subjects), [2])
+        assert np.array_equal(np.unique(test_subjects), [3, 5, 6])
+
+        single = split_seq_data(X, y, subjects, vidlens, [1, 4], [2], [3, 5, 6])
+        assert np.array_equal(single[0], train_X[0])
+        assert np.array_equal(single[5], val_y)
+
+    def test_compute_dct_features(self):
+        shape = (6, 8)
+        X = np.random.rand(20, shape[0] * shape[1]).astype('float32')
+        # reference: per frame 2D dct followed by zigzag traversal
+        from scipy import fftpack
+        expected = np.array([zigzag(fftpack.dct(fftpack.dct(x.reshape(shape), axis=1, norm='ortho'),
+                                                axis=0, norm='ortho'))[1:11] for x in X])
+        assert np.allclose(compute_dct_features(X, shape, 10), expected, atol=1e-5)
+        # 1D dct over flattened frames
+        X_dct = fftpack.dct(X, norm='ortho')
+        expected = np.array([zigzag(x.reshape(shape))[1:11] for x in X_dct])
+        assert np.array_equal(compute_dct_features(X, shape, 10, dct_2d=False), expected)
+
+    def test_zca_whitening(self):
+        X = np.random.rand(20, 12).astype('float32')
+        expected = np.array([zca_whiten(x.reshape((1, -1))).reshape((-1,)) for x in X])
+        assert np.allclose(apply_zca_whitening(X.copy()), expected)
+
+        rng = np.random.RandomState(0)
+        X = np.dot(rng.randn(3000, 16), rng.randn(16, 16)).astype('float32')
+        zca = ZCAWhitening(epsilon=1e-6).fit(X)
+        X_white = zca.transform(X)
+        assert X_white.dtype == X.dtype
+        assert np.allclose(np.cov(X_white, rowvar=False, bias=True), np.eye(16), atol=1e-2)
+
+        full = ZCAWhitening(n_components=4).fit(X)
+        randomized = ZCAWhitening(n_components=4, method='randomized', rng=rng).fit(X)
+        assert np.allclose(full.components, randomized.components, atol=1e-3)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'zca.npz')
+            full.save(filename)
+            assert np.array_equal(ZCAWhitening.load(filename).transform(X), full.transform(X))
+            assert load_or_fit_zca(X, 4, filename).n_components == 4
+            # a stored transform that does not match is refitted and replaced
+            zca = load_or_fit_zca(X, None, filename)
+            assert zca.n_components is None and np.allclose(zca.components, ZCAWhitening().fit(X).components)
+            assert ZCAWhitening.load(filename).n_components is None
+            zca = load_or_fit_zca(X[:, :8], None, filename)
+            assert zca.components.shape == (8, 8)
+            # fitted on other data of the same shape, or with another epsilon
+            X_other = X[:, :8] + 1
+            zca = load_or_fit_zca(X_other, None, filename)
+            assert np.allclose(zca.mean, X_other.mean(axis=0))
+            assert load_or_fit_zca(X_other, None, filename).fingerprint == data_fingerprint(X_other)
+            assert load_or_fit_zca(X_other, None, filename, epsilon=1e-3).epsilon == 1e-3
+
+            config = ConfigParser.ConfigParser()
+            config.add_section('stream1')
+            assert zca_from_config(config, 'stream1', X) is None
+            config.set('stream1', 'zca', 'true')
+            config.set('stream1', 'zca_components', '4')
+            config.set('stream1', 'zca_file', os.path.join(tmpdir, 'stream1.npz'))
+            zca = zca_from_config(config, 'stream1', X)
+            assert zca.n_components == 4 and os.path.isfile(os.path.join(tmpdir, 'stream1.npz'))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
 if __name__ == '__main__':
     unittest.main()
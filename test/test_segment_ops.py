@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+from utils.segment_ops import *
+
+
+class TestSegmentOps(unittest.TestCase):
+    def setUp(self):
+        self.lens = np.array([3, 1, 0, 4])
+        self.X = np.random.rand(np.sum(self.lens), 5).astype('float32')
+
+    def test_segment_mean_subtract(self):
+        starts = segment_starts(self.lens)
+        means = segment_mean(self.X, self.lens)
+        assert means.dtype == np.float32
+        for i, (s, l) in enumerate(zip(starts, self.lens)):
+            if l > 0:
+                assert np.allclose(means[i], self.X[s:s + l].mean(axis=0))
+        X = self.X.copy()
+        res = segment_mean_subtract(X, self.lens, out=X)
+        assert res is X
+        assert np.allclose(segment_sum(res, self.lens), 0, atol=1e-5)
+
+    def test_segment_diff(self):
+        res = segment_diff(self.X, self.lens)
+        assert np.array_equal(res[0], self.X[1] - self.X[0])
+        assert np.array_equal(res[1:3], self.X[1:3] - self.X[0:2])
+        assert np.all(res[3] == 0)  # single frame sequence
+        assert np.array_equal(res[4], self.X[5] - self.X[4])
+
+    def test_row_norms(self):
+        res = row_znorm(self.X)
+        assert np.allclose(res.mean(axis=1), 0, atol=1e-5) and np.allclose(res.std(axis=1), 1, atol=1e-5)
+        res = row_minmax(self.X)
+        assert np.allclose(res.min(axis=1), 0) and np.allclose(res.max(axis=1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
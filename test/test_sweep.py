@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+import ConfigParser
+from utils.sweep import expand_grid, sample_random, write_trial_config, parse_epoch, parse_final, \
+    MedianStoppingRule
+
+
+class TestSweep(unittest.TestCase):
+    def test_expand_trials(self):
+        trials = expand_grid({'training.learning_rate': [0.1, 0.01], 'lstm_classifier.lstm_size': [250, 450, 650]})
+        assert len(trials) == 6
+        assert {'training.learning_rate': 0.01, 'lstm_classifier.lstm_size': 450} in trials
+
+        params = {'training.learning_rate': {'loguniform': [1e-4, 1e-2]}, 'training.batchsize': [10, 20]}
+        trials = sample_random(params, 20, seed=1)
+        assert trials == sample_random(params, 20, seed=1)
+        assert all(1e-4 <= t['training.learning_rate'] <= 1e-2 for t in trials)
+        assert all(t['training.batchsize'] in [10, 20] for t in trials)
+
+    def test_write_trial_config(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            base = os.path.join(tmpdir, 'base.ini')
+            with open(base, 'w') as f:
+                f.write('[training]\nlearning_rate = 0.1\nbatchsize = 10\n')
+            path = os.path.join(tmpdir, 'trial.ini')
+            write_trial_config(base, {'training.learning_rate': 0.01}, path, 'cache')
+            config = ConfigParser.ConfigParser()
+            config.read(path)
+            assert config.getfloat('training', 'learning_rate') == 0.01
+            assert config.getint('training', 'batchsize') == 10
+            assert config.get('training', 'cache_dir') == 'cache'
+            assert config.getboolean('training', 'cache_mmap')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse(self):
+        line = 'Epoch 3 train cost = 1.25, val cost = 1.5, GL loss = 0.000, GQ = 0.000, CR = 0.500 (2.0sec)'
+        assert parse_epoch(line) == (3, 1.25, 1.5)
+        assert parse_epoch('Epoch 3 data wait = 0.1sec, compute = 2.0sec') is None
+        assert parse_final('CR: 0.75, val loss: 0.5, Test CR: 0.7') == (0.75, 0.5, 0.7)
+
+    def test_median_stopping_rule(self):
+        rule = MedianStoppingRule(min_epochs=2, min_trials=2)
+        for epoch, costs in enumerate([(1.0, 1.2, 1.5), (0.8, 1.0, 1.6)]):
+            for trial, cost in enumerate(costs):
+                stop = rule.report(trial, epoch + 1, cost)
+                # only the trial worse than the median of the others after min_epochs is stopped
+                assert stop == (epoch + 1 == 2 and trial == 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
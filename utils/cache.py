@@ -0,0 +1,169 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+
+def hash_path(path, h, chunksize=1 << 20):
+    """
+    updates hash h with the contents of a file, or of all files of a directory (e.g. a npy store)
+    :param path: file or directory
+    :param h: hashlib hash object
+    :param chunksize: read size in bytes
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode('utf-8'))
+            hash_path(os.path.join(path, name), h, chunksize)
+        return
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunksize)
+            if not chunk:
+                break
+            h.update(chunk)
+
+
+def _flatten(results):
+    arrays = {}
+    for i, res in enumerate(results):
+        if isinstance(res, (list, tuple)):
+            for j, r in enumerate(res):
+                arrays['{}_{}'.format(i, j)] = r
+        else:
+            arrays[str(i)] = res
+    return arrays
+
+
+def _unflatten(arrays):
+    results = {}
+    for k in arrays:
+        if '_' in k:
+            i, j = [int(n) for n in k.split('_')]
+            results.setdefault(i, {})[j] = arrays[k]
+        else:
+            results[int(k)] = arrays[k]
+    return [[results[i][j] for j in sorted(results[i])] if isinstance(results[i], dict) else results[i]
+            for i in sorted(results)]
+
+
+class PreprocessingCache(object):
+    """
+    content-addressed on-disk cache of preprocessed datasets. Entries are keyed by the hash
+    of the input files and the configuration values that produced them, and evicted in least
+    recently used order once the cache grows beyond max_size_mb. With mmap_mode, entries are
+    stored as directories of .npy files and loaded memory-mapped, so concurrent runs share the
+    same pages instead of holding private copies of the data
+    """
+    def __init__(self, cache_dir, max_size_mb=None, mmap_mode=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self.mmap_mode = mmap_mode
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, files, *items):
+        """
+        computes the cache key
+        :param files: input files (data files, split files), hashed by content
+        :param items: configuration values, e.g. config.items(section), hashed by their repr
+        :return: hex digest
+        """
+        h = hashlib.sha1()
+        for path in files:
+            hash_path(path, h)
+        for item in items:
+            h.update(repr(item).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        if self.mmap_mode:
+            return os.path.join(self.cache_dir, key)
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def load(self, key):
+        """
+        :param key: cache key
+        :return: cached results in the layout they were saved in, None if not cached
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path, None)  # mark as recently used
+        if os.path.isdir(path):
+            arrays = dict((f[:-len('.npy')], np.load(os.path.join(path, f), mmap_mode=self.mmap_mode))
+                          for f in os.listdir(path))
+        else:
+            with np.load(path) as f:
+                arrays = dict((k, f[k]) for k in f.files)
+        return _unflatten(arrays)
+
+    def save(self, key, results):
+        """
+        stores results, a sequence of arrays or lists of arrays (e.g. one per stream)
+        :param key: cache key
+        :param results: results to store
+        """
+        if self.mmap_mode:
+            tmp_path = tempfile.mkdtemp(dir=self.cache_dir, suffix='.tmp')
+            for k, array in _flatten(results).items():
+                np.save(os.path.join(tmp_path, k + '.npy'), array)
+            try:
+                os.rename(tmp_path, self._path(key))
+            except OSError:
+                # stored concurrently by another run, the rename does not replace a non-empty directory
+                shutil.rmtree(tmp_path)
+                if not os.path.isdir(self._path(key)):
+                    raise
+        else:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **_flatten(results))
+            os.rename(tmp_path, self._path(key))
+        self.evict()
+
+    def load_or_compute(self, key, fn, *args, **kwargs):
+        """
+        loads the results for key, computing and storing them with fn(*args, **kwargs) if not cached
+        """
+        results = self.load(key)
+        if results is not None:
+            print('loaded preprocessed data from cache {}'.format(self._path(key)))
+            return results
+        results = fn(*args, **kwargs)
+        self.save(key, results)
+        if self.mmap_mode:
+            return self.load(key)
+        return results
+
+    def _size(self, entry):
+        if os.path.isdir(entry):
+            return sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+        return os.path.getsize(entry)
+
+    def _is_entry(self, path):
+        # .npz entries and the .npy directories of mmap entries, not the temporary files being written
+        if path.endswith('.tmp'):
+            return False
+        return os.path.isdir(path) or (os.path.isfile(path) and path.endswith('.npz'))
+
+    def evict(self):
+        """
+        removes the least recently used entries until the cache fits into max_size
+        """
+        if self.max_size is None:
+            return
+        entries = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)]
+        entries = [e for e in entries if self._is_entry(e)]
+        entries = sorted(entries, key=os.path.getmtime)
+        total = sum(self._size(e) for e in entries)
+        # always keep the most recent entry
+        for entry in entries[:-1]:
+            if total <= self.max_size:
+                break
+            total -= self._size(entry)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            else:
+                os.remove(entry)
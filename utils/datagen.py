@@ -1,4 +1,10 @@
+import time
+import threading
 import numpy as np
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 
 def gen_lstm_seq_random(X, y, seqlen):
@@ -26,66 +32,149 @@ def gen_lstm_seq_random(X, y, seqlen):
             yield seq_X, seq_y
 
 
-def gen_lstm_batch_random(X, y, seqlen, batchsize=30, shuffle=True):
+def gen_lstm_idx_batch_random(y, seqlen, batchsize=30, shuffle=True):
     """
-    randomized data generator for training data
+    randomized generator of the index batches of training data, the batches of gen_lstm_batch_random
+    without their inputs, which are gathered with gather_seq_batches (see BatchPrefetcher)
     creates an infinite loop of mini batches
-    :param X: input
     :param y: target
     :param seqlen: lengths of video
     :param batchsize: number of videos per batch
-    :return: x_train, y_target, input_mask, video idx used
+    :param shuffle: permutate the videos every epoch
+    :return: y_target, input_mask, video idx used
     """
+    seqlen = np.asarray(seqlen, dtype=int).reshape((-1,))
     # find the max len of all videos for creating the mask
     max_timesteps = np.max(seqlen)
-    feature_len = X.shape[1]
     no_videos = len(seqlen)
+    integral_lens = np.cumsum(seqlen) - seqlen
     start_video = 0
     reset = False
 
-    # compute integral lengths of the video for fast offset access for data matrix
-    integral_lens = [0]
-    for i in range(1, len(seqlen)):
-        integral_lens.append(integral_lens[i-1] + seqlen[i - 1])
-
     # permutate the video sequences for each batch
-    if shuffle:
-        randomized = np.random.permutation(len(seqlen))
-    else:
-        randomized = range(len(seqlen))
+    randomized = np.random.permutation(no_videos) if shuffle else np.arange(no_videos)
     while True:
         end_video = start_video + batchsize
         if end_video >= no_videos:  # all videos iterated, reset
             batch_video_idxs = randomized[start_video:]
-            # extract all the video lengths of the video idx
             reset = True
         else:
             batch_video_idxs = randomized[start_video:end_video]
-        bsize = len(batch_video_idxs)
-        X_batch = np.zeros((bsize, max_timesteps, feature_len), dtype=X.dtype)  # returned batch input
-        y_batch = np.zeros((bsize,), dtype='uint8')
-        mask = np.zeros((bsize, max_timesteps), dtype='uint8')
-
-        # populate the batch X and batch y
-        for i, idx in enumerate(batch_video_idxs):
-            start = integral_lens[idx]
-            l = seqlen[idx]
-            end = start + l
-            X_batch[i] = np.concatenate([X[start:end],
-                                         np.zeros((max_timesteps - l, feature_len))])
-            y_batch[i] = y[start]
-            mask[i, :l] = 1  # set 1 for length of video
-            mask[i, l:] = 0  # set 0 for rest of video
+        y_batch = y.take(integral_lens[batch_video_idxs]).astype('uint8')
+        mask = (np.arange(max_timesteps) < seqlen[batch_video_idxs].reshape((-1, 1))).astype('uint8')
         if reset:
             # permutate the new video sequences for each batch
-            if shuffle:
-                randomized = np.random.permutation(len(seqlen))
-            else:
-                randomized = range(len(seqlen))
+            randomized = np.random.permutation(no_videos) if shuffle else np.arange(no_videos)
             start_video = 0
             reset = False
         else:
             start_video = end_video
+        yield y_batch, mask, batch_video_idxs
+
+
+def gen_lstm_batch_random(X, y, seqlen, batchsize=30, shuffle=True):
+    """
+    randomized data generator for training data
+    creates an infinite loop of mini batches
+    :param X: input
+    :param y: target
+    :param seqlen: lengths of video
+    :param batchsize: number of videos per batch
+    :return: x_train, y_target, input_mask, video idx used
+    """
+    integral_lens = compute_integral_len(seqlen)
+    for y_batch, mask, batch_video_idxs in gen_lstm_idx_batch_random(y, seqlen, batchsize, shuffle):
+        X_batch = gather_seq_batches([X], batch_video_idxs, seqlen, integral_lens, mask.shape[-1])[0]
+        yield X_batch, y_batch, mask, batch_video_idxs
+
+
+def _bucketed_batches(seqlen, batchsize, num_buckets, shuffle):
+    """
+    infinite loop of the (bucket, video idxs) batches of videos of similar length
+    :return: bucket index, video idxs of the batch
+    """
+    # split the videos sorted by length into equally populated buckets
+    buckets = [b for b in np.array_split(np.argsort(seqlen, kind='mergesort'), num_buckets) if len(b) > 0]
+    while True:
+        # split each bucket into batches and visit the batches of all buckets in random order
+        batches = []
+        for bucket_id, bucket in enumerate(buckets):
+            if shuffle:
+                bucket = np.random.permutation(bucket)
+            for start in range(0, len(bucket), batchsize):
+                batches.append((bucket_id, bucket[start:start + batchsize]))
+        order = np.random.permutation(len(batches)) if shuffle else range(len(batches))
+        for batch_id in order:
+            yield batches[batch_id]
+
+
+def gen_lstm_idx_batch_bucketed(y, seqlen, batchsize=30, num_buckets=5, shuffle=True):
+    """
+    randomized length-bucketed generator of the index batches of training data, the batches of
+    gen_lstm_batch_bucketed without their inputs, which are gathered with gather_seq_batches
+    (see BatchPrefetcher)
+    creates an infinite loop of mini batches
+    :param y: target
+    :param seqlen: lengths of video
+    :param batchsize: number of videos per batch
+    :param num_buckets: number of length buckets to group the videos into
+    :param shuffle: shuffle the videos within each bucket and the order of the batches
+    :return: y_target, input_mask, video idx used
+    """
+    seqlen = np.asarray(seqlen, dtype=int).reshape((-1,))
+    integral_lens = np.cumsum(seqlen) - seqlen
+    for _, batch_video_idxs in _bucketed_batches(seqlen, batchsize, num_buckets, shuffle):
+        lens = seqlen[batch_video_idxs]
+        mask = (np.arange(np.max(lens)) < lens.reshape((-1, 1))).astype('uint8')
+        y_batch = y.take(integral_lens[batch_video_idxs]).astype('uint8')
+        yield y_batch, mask, batch_video_idxs
+
+
+def gen_lstm_batch_bucketed(X, y, seqlen, batchsize=30, num_buckets=5, shuffle=True, reuse_buffers=True):
+    """
+    randomized length-bucketed data generator for training data
+    creates an infinite loop of mini batches, videos of similar length are grouped into
+    the same batch and each batch is only padded to its longest video
+    :param X: input
+    :param y: target
+    :param seqlen: lengths of video
+    :param batchsize: number of videos per batch
+    :param num_buckets: number of length buckets to group the videos into
+    :param shuffle: shuffle the videos within each bucket and the order of the batches
+    :param reuse_buffers: assemble the batches in preallocated per-bucket buffers. A yielded batch is
+        overwritten by later batches of the same bucket, copy it if it has to outlive the next call
+    :return: x_train, y_target, input_mask, video idx used
+    """
+    seqlen = np.asarray(seqlen, dtype=int).reshape((-1,))
+    feature_len = X.shape[1]
+    integral_lens = np.cumsum(seqlen) - seqlen
+
+    buckets = [b for b in np.array_split(np.argsort(seqlen, kind='mergesort'), num_buckets) if len(b) > 0]
+    bucket_timesteps = [np.max(seqlen[b]) for b in buckets]
+    if reuse_buffers:
+        # flat buffers so every batch view is contiguous
+        X_buffers = [np.zeros((batchsize * t * feature_len,), dtype=X.dtype) for t in bucket_timesteps]
+        mask_buffers = [np.zeros((batchsize * t,), dtype='uint8') for t in bucket_timesteps]
+
+    for bucket_id, batch_video_idxs in _bucketed_batches(seqlen, batchsize, num_buckets, shuffle):
+        bsize = len(batch_video_idxs)
+        lens = seqlen[batch_video_idxs]
+        max_timesteps = np.max(lens)
+        if reuse_buffers:
+            X_batch = X_buffers[bucket_id][:bsize * max_timesteps * feature_len]
+            X_batch = X_batch.reshape((bsize, max_timesteps, feature_len))
+            mask = mask_buffers[bucket_id][:bsize * max_timesteps].reshape((bsize, max_timesteps))
+        else:
+            X_batch = np.empty((bsize, max_timesteps, feature_len), dtype=X.dtype)
+            mask = np.empty((bsize, max_timesteps), dtype='uint8')
+
+        # populate the batch with a single gather of all valid frames
+        valid = np.arange(max_timesteps) < lens.reshape((-1, 1))
+        frame_idxs = (integral_lens[batch_video_idxs].reshape((-1, 1)) + np.arange(max_timesteps))[valid]
+        X_batch[valid] = X.take(frame_idxs, axis=0)
+        X_batch[~valid] = 0
+        mask[:] = valid
+        y_batch = y.take(integral_lens[batch_video_idxs]).astype('uint8')
         yield X_batch, y_batch, mask, batch_video_idxs
 
 
@@ -152,17 +241,43 @@ def compute_integral_len(lengths):
     return integral_lens
 
 
-def gen_seq_batch_from_idx(data, idxs, seqlens, integral_lens, max_timesteps):
-    feature_len = data.shape[-1]
-    X_batch = np.zeros((len(idxs), max_timesteps, feature_len), dtype=data.dtype)
+def seq_batch_index(idxs, seqlens, integral_lens, max_timesteps):
+    """
+    computes the gather index of a batch of sequences, shared by all streams aligned with the sequences
+    :param idxs: sequence indexes of the batch
+    :param seqlens: lengths of the sequences
+    :param integral_lens: integral lengths of the sequences
+    :param max_timesteps: number of time steps of the batch
+    :return: row index of each valid time step, mask of the valid time steps of shape (batch size, max_timesteps)
+    """
+    idxs = np.asarray(idxs, dtype=int)
+    valid = np.arange(int(max_timesteps)) < np.asarray(seqlens)[idxs].reshape((-1, 1))
+    rows = np.asarray(integral_lens, dtype=int)[idxs].reshape((-1, 1)) + np.arange(int(max_timesteps))
+    return rows[valid], valid
 
-    for i, seq_id in enumerate(idxs):
-        l = seqlens[seq_id]
-        start = integral_lens[seq_id]
-        end = start + l
-        X_batch[i] = np.concatenate([data[start:end],
-                                     np.zeros((max_timesteps - l, feature_len), dtype=data.dtype)])
-    return X_batch
+
+def gather_seq_batches(streams, idxs, seqlens, integral_lens, max_timesteps):
+    """
+    assembles the zero padded batches of several streams aligned with the same sequences with one
+    gather per stream
+    :param streams: list of data matrices
+    :param idxs: sequence indexes of the batch
+    :param seqlens: lengths of the sequences
+    :param integral_lens: integral lengths of the sequences
+    :param max_timesteps: number of time steps of the batch
+    :return: list of batches of shape (batch size, max_timesteps, features)
+    """
+    rows, valid = seq_batch_index(idxs, seqlens, integral_lens, max_timesteps)
+    batches = []
+    for data in streams:
+        X_batch = np.zeros(valid.shape + data.shape[1:], dtype=data.dtype)
+        X_batch[valid] = data[rows]
+        batches.append(X_batch)
+    return batches
+
+
+def gen_seq_batch_from_idx(data, idxs, seqlens, integral_lens, max_timesteps):
+    return gather_seq_batches([data], idxs, seqlens, integral_lens, max_timesteps)[0]
 
 
 def sequence_batch_iterator(X, y, seqlen, batchsize=30):
@@ -320,3 +435,84 @@ class SequenceBatchIterator(object):
             else:
                 start_seq = end_seq
             yield X_batch, y_batch, mask, batch_seq_idxs
+
+
+class BatchPrefetcher(object):
+    def __init__(self, datagen, streams, seqlens, integral_lens, depth=2, workers=1):
+        """
+        assembles the batches of all streams aligned with the same sequences ahead of time in
+        background threads, each batch with one gather per stream (see gather_seq_batches)
+        creates an infinite loop of mini batches
+        :param datagen: index batch generator yielding (y, mask, idxs), e.g. gen_lstm_idx_batch_random
+            or gen_lstm_idx_batch_bucketed
+        :param streams: list of data matrices aligned with the sequences
+        :param seqlens: lengths of video of the streams
+        :param integral_lens: integral lengths of the video of the streams
+        :param depth: maximum number of batches assembled ahead, 0 assembles each batch on request
+        :param workers: number of threads assembling batches
+        :return:
+        """
+        self.datagen = datagen
+        self.streams = streams
+        self.seqlens = seqlens
+        self.integral_lens = integral_lens
+        self.depth = depth
+        self.wait_time = 0.  # accumulated time spent waiting for batches
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._threads = []
+        if depth > 0:
+            self._queue = queue.Queue(maxsize=depth)
+            for _ in range(workers):
+                t = threading.Thread(target=self._worker)
+                t.daemon = True
+                t.start()
+                self._threads.append(t)
+
+    def _assemble(self):
+        # generators are not thread safe, only the stream batches are assembled concurrently
+        with self._lock:
+            y, mask, idxs = next(self.datagen)
+        stream_batches = gather_seq_batches(self.streams, idxs, self.seqlens, self.integral_lens, mask.shape[-1])
+        return stream_batches, y, mask, idxs
+
+    def _worker(self):
+        while not self._stopped:
+            try:
+                batch = self._assemble()
+            except Exception as e:
+                batch = e
+            while not self._stopped:
+                try:
+                    self._queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(batch, Exception):
+                break
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.__next__()
+
+    def __next__(self):
+        """
+        get the next batch
+        :return: list of the stream batches, y_target, input_mask, video idx used
+        """
+        time_start = time.time()
+        if self.depth > 0:
+            batch = self._queue.get()
+            if isinstance(batch, Exception):
+                raise batch
+        else:
+            batch = self._assemble()
+        self.wait_time += time.time() - time_start
+        return batch
+
+    def close(self):
+        self._stopped = True
+        for t in self._threads:
+            t.join()
@@ -0,0 +1,88 @@
+"""
+vectorized evaluation of the network outputs, shared by the runners
+"""
+import numpy as np
+
+
+def masked_argmax(output, mask):
+    """
+    frame predictions of a batch of sequences, frames beyond the sequence length are set to -1
+    :param output: network output of shape (batch_size, timesteps, num_classes)
+    :param mask: input mask of shape (batch_size, timesteps)
+    :return: predictions of shape (batch_size, timesteps)
+    """
+    seq_lens = np.sum(mask, axis=-1).astype(int)
+    predictions = np.argmax(output, axis=-1)
+    # only the first seq len frames are considered
+    predictions[np.arange(output.shape[1]) >= seq_lens[:, None]] = -1
+    return predictions
+
+
+def vote_counts(predictions, num_classes):
+    """
+    counts the frame predictions of each sequence with a single bincount on the flattened
+    (sequence, class) offsets
+    :param predictions: frame predictions of shape (batch_size, timesteps), -1 for padded frames
+    :param num_classes: number of classes
+    :return: votes of shape (batch_size, num_classes)
+    """
+    valid = predictions >= 0
+    offsets = np.arange(len(predictions))[:, None] * num_classes + predictions
+    votes = np.bincount(offsets[valid], minlength=len(predictions) * num_classes)
+    return votes.reshape((len(predictions), num_classes))
+
+
+def majority_vote(output, mask):
+    """
+    predicts the label of each sequence by majority voting of the frame predictions, ties are
+    resolved to the lowest class
+    :param output: network output of shape (batch_size, timesteps, num_classes)
+    :param mask: input mask of shape (batch_size, timesteps)
+    :return: predicted labels of shape (batch_size,)
+    """
+    votes = vote_counts(masked_argmax(output, mask), output.shape[-1])
+    return np.argmax(votes, axis=-1)
+
+
+def classification_rate(targets, predictions):
+    """
+    :param targets: true labels
+    :param predictions: predicted labels
+    :return: fraction of correct predictions
+    """
+    return np.sum(predictions == targets) / float(len(targets))
+
+
+def confusion_matrix(targets, predictions, num_classes):
+    """
+    :param targets: true labels
+    :param predictions: predicted labels
+    :param num_classes: number of classes
+    :return: confusion matrix of shape (num_classes, num_classes), rows are the true labels
+    """
+    confusion = np.zeros((num_classes, num_classes), dtype='int')
+    np.add.at(confusion, (targets, predictions), 1)
+    return confusion
+
+
+def evaluate_predictions(output, targets):
+    """
+    evaluates one output per sequence
+    :param output: network output of shape (batch_size, num_classes)
+    :param targets: true labels
+    :return: classification rate, confusion matrix
+    """
+    predictions = np.argmax(output, axis=1)
+    return classification_rate(targets, predictions), confusion_matrix(targets, predictions, output.shape[1])
+
+
+def evaluate_sequences(output, targets, mask):
+    """
+    evaluates the framewise output of a sequence model by majority voting
+    :param output: network output of shape (batch_size, timesteps, num_classes)
+    :param targets: true labels
+    :param mask: input mask of shape (batch_size, timesteps)
+    :return: classification rate, confusion matrix
+    """
+    predictions = majority_vote(output, mask)
+    return classification_rate(targets, predictions), confusion_matrix(targets, predictions, output.shape[-1])
@@ -4,6 +4,7 @@ module containing functions to use ffprobe to parse video frame info
 from __future__ import print_function
 import subprocess
 import cStringIO
+import numpy as np
 
 
 class base_frame(object):
@@ -26,6 +27,10 @@ class base_frame(object):
     ...
     [/FRAME]
     """
+    __slots__ = ('stream_index', 'key_frame', 'pkt_pts', 'pkt_pts_time', 'pkt_dts', 'pkt_dts_time',
+                 'best_effort_timestamp', 'best_effort_timestamp_time', 'pkt_duration', 'pkt_duration_time',
+                 'pkt_pos', 'pkt_size')
+
     def __init__(self, buf, parser):
         """
         Constructs a base ffprobe frame
@@ -57,6 +62,8 @@ class audio_frame(base_frame):
     channel_layout=stereo
     [/FRAME]
     """
+    __slots__ = ('media_type', 'sample_fmt', 'nb_samples', 'channels', 'channel_layout')
+
     def __init__(self, buf, parser):
         """
         Constructs an Audio Frame from FFprobe
@@ -88,6 +95,10 @@ class video_frame(base_frame):
     repeat_pict=0
     [/FRAME]
     """
+    __slots__ = ('media_type', 'width', 'height', 'pix_fmt', 'sample_aspect_ratio', 'pict_type',
+                 'coded_picture_number', 'display_picture_number', 'interlaced_frame', 'top_field_first',
+                 'repeat_pict')
+
     def __init__(self, buf, parser):
         """
         Constructs a Video Frame from ffprobe
@@ -117,6 +128,8 @@ class side_data(object):
     timecode=00:00:00:00
     [/SIDE_DATA]
     """
+    __slots__ = ('side_data_type', 'side_data_size', 'timecode')
+
     def __init__(self, buf, parser):
         """
         Constructs side data frame
@@ -204,9 +217,122 @@ def ffprobe_video(filename):
     return audio_frames, video_frames
 
 
+FRAME_TIME_ENTRIES = ('media_type', 'pts_time', 'pkt_pts_time')
+
+
+def iter_ffprobe_frames(filename, entries=FRAME_TIME_ENTRIES, select_streams=None):
+    """
+    probes a video using an ffprobe subprocess in compact output format, only requesting the given
+    frame entries. The output is parsed while ffprobe is running and the frames are yielded lazily
+    :param filename: video file to probe
+    :param entries: frame entries to request, entries unknown to the ffprobe version are left out of the output
+    :param select_streams: ffprobe stream specifier, e.g. 'v' for the video streams only
+    :return: generator of dicts mapping entry names to their (string) values, raises IOError if ffprobe fails
+    """
+    command = ['ffprobe', '-v', 'error', '-print_format', 'compact', '-show_entries', 'frame=' + ','.join(entries)]
+    if select_streams is not None:
+        command += ['-select_streams', select_streams]
+    command.append(filename)
+    p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    complete = False
+    errors = ''
+    try:
+        for line in p.stdout:
+            # frame|media_type=video|pts_time=0.033367
+            fields = line.rstrip('\r\n').split('|')
+            if fields[0] != 'frame':
+                continue
+            yield dict(field.split('=', 1) for field in fields[1:] if '=' in field)
+        complete = True
+    finally:
+        # the generator may be closed before ffprobe finished
+        if not complete and p.poll() is None:
+            p.kill()
+        p.stdout.close()
+        if complete:
+            errors = p.stderr.read()
+        p.stderr.close()
+        p.wait()
+    if p.returncode != 0:
+        raise IOError('ffprobe failed on {} with exit code {}: {}'.format(filename, p.returncode, errors.strip()))
+
+
+def _to_float(value):
+    return float('nan') if value is None or value == 'N/A' else float(value)
+
+
+def ffprobe_frame_times(filename, media_type='video'):
+    """
+    gets the presentation timestamps of all frames of a given media type, using pts_time
+    or pkt_pts_time depending on which one the installed ffprobe reports
+    :param filename: video file to probe
+    :param media_type: 'video' or 'audio'
+    :return: 1D float64 array of timestamps in seconds, NaN where unavailable
+    """
+    frames = iter_ffprobe_frames(filename, select_streams=media_type[0])
+    times = [_to_float(f.get('pts_time', f.get('pkt_pts_time'))) for f in frames
+             if f.get('media_type', media_type) == media_type]
+    return np.array(times, dtype='float64')
+
+
+# (field, dtype, ffprobe entries in order of preference), older ffprobe versions prefix packet fields with pkt_
+BASE_FRAME_FIELDS = [('stream_index', 'int32', ('stream_index',)),
+                     ('key_frame', 'int8', ('key_frame',)),
+                     ('pts', 'int64', ('pts', 'pkt_pts')),
+                     ('pts_time', 'float64', ('pts_time', 'pkt_pts_time')),
+                     ('dts', 'int64', ('pkt_dts',)),
+                     ('dts_time', 'float64', ('pkt_dts_time',)),
+                     ('duration', 'int64', ('duration', 'pkt_duration')),
+                     ('duration_time', 'float64', ('duration_time', 'pkt_duration_time')),
+                     ('pos', 'int64', ('pkt_pos',)),
+                     ('size', 'int64', ('pkt_size',))]
+VIDEO_FRAME_FIELDS = BASE_FRAME_FIELDS + [('width', 'int32', ('width',)),
+                                          ('height', 'int32', ('height',)),
+                                          ('pict_type', 'S1', ('pict_type',))]
+AUDIO_FRAME_FIELDS = BASE_FRAME_FIELDS + [('nb_samples', 'int32', ('nb_samples',)),
+                                          ('channels', 'int32', ('channels',))]
+VIDEO_FRAME_DTYPE = np.dtype([(name, dtype) for name, dtype, _ in VIDEO_FRAME_FIELDS])
+AUDIO_FRAME_DTYPE = np.dtype([(name, dtype) for name, dtype, _ in AUDIO_FRAME_FIELDS])
+
+
+def _parse_entry(frame, entries, dtype):
+    value = 'N/A'
+    for entry in entries:
+        if entry in frame:
+            value = frame[entry]
+            break
+    kind = np.dtype(dtype).kind
+    if kind == 'f':
+        return _to_float(value)
+    if kind in 'iu':
+        return -1 if value == 'N/A' else int(value)
+    return '' if value == 'N/A' else value
+
+
+def ffprobe_video_table(filename):
+    """
+    probes a video using a streaming ffprobe subprocess and collects the frames in numpy
+    structured arrays, one record per frame, see AUDIO_FRAME_DTYPE and VIDEO_FRAME_DTYPE.
+    Missing integers are -1, missing floats NaN
+    :param filename: video file to probe
+    :return: audio frames, video frames structured arrays
+    """
+    entries = ['media_type'] + sorted(set(e for _, _, names in VIDEO_FRAME_FIELDS + AUDIO_FRAME_FIELDS
+                                          for e in names))
+    audio_rows = []
+    video_rows = []
+    for frame in iter_ffprobe_frames(filename, entries):
+        if frame.get('media_type') == 'video':
+            video_rows.append(tuple(_parse_entry(frame, names, dtype) for _, dtype, names in VIDEO_FRAME_FIELDS))
+        elif frame.get('media_type') == 'audio':
+            audio_rows.append(tuple(_parse_entry(frame, names, dtype) for _, dtype, names in AUDIO_FRAME_FIELDS))
+    return np.array(audio_rows, dtype=AUDIO_FRAME_DTYPE), np.array(video_rows, dtype=VIDEO_FRAME_DTYPE)
+
+
 def main():
     audio_frames, video_frames = ffprobe_video('s01.mpg')
     assert len(video_frames) == 3890
+    assert len(ffprobe_frame_times('s01.mpg')) == 3890
 
 
 if __name__ == '__main__':
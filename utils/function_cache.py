@@ -0,0 +1,148 @@
+from __future__ import print_function
+import os
+import sys
+import time
+import pickle
+import numbers
+import hashlib
+import tempfile
+
+import theano
+import lasagne as las
+
+# theano flags that change the compiled functions
+THEANO_FLAGS_KEYS = ['floatX', 'device', 'mode', 'optimizer', 'linker', 'cxx']
+RECURSION_LIMIT = 50000
+
+
+def _is_option(value):
+    if isinstance(value, (tuple, list)):
+        return all(_is_option(v) for v in value)
+    return value is None or isinstance(value, (numbers.Number, str, type(u'')))
+
+
+def layer_options(layer):
+    """
+    :param layer: lasagne layer
+    :return: sorted scalar attributes of the layer, e.g. dropout p, lstm grad_clipping or delta window
+    """
+    return sorted((k, v) for k, v in vars(layer).items() if _is_option(v))
+
+
+def describe_network(network):
+    """
+    describes the architecture of a network by its layers, output shapes, nonlinearities, parameter
+    shapes and options
+    :param network: output layer
+    :return: list of layer descriptions
+    """
+    description = []
+    for layer in las.layers.get_all_layers(network):
+        nonlinearity = getattr(layer, 'nonlinearity', None)
+        description.append((type(layer).__name__, layer.name, layer.output_shape,
+                            getattr(nonlinearity, '__name__', type(nonlinearity).__name__),
+                            [(p.name, p.get_value(borrow=True).shape) for p in layer.get_params()],
+                            layer_options(layer)))
+    return description
+
+
+def describe_graph(outputs):
+    """
+    describes symbolic graphs by their ops, constants and types, including the inner graphs of scan
+    ops, so any change of the computation (layer options, custom layers, losses, updates) changes
+    the description
+    :param outputs: theano variables, e.g. the cost, the update expressions and the predictions
+    :return: description string
+    """
+    return theano.printing.debugprint(list(outputs), file='str', print_type=True)
+
+
+class CompiledFunctionCache(object):
+    """
+    on-disk cache of compiled theano functions, keyed by the network architecture, the graphs and
+    values the functions were built with (e.g. learning rate, loss) and the theano flags. Functions are
+    pickled right after compilation, loaded functions are relinked to the parameters of the
+    network, so training updates the network parameters as if the functions were compiled
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, network, *items):
+        """
+        computes the cache key
+        :param network: output layer of the network
+        :param items: values the functions are built with, hashed by their repr, e.g. the describe_graph
+            description of the graphs compiled
+        :return: hex digest
+        """
+        h = hashlib.sha1()
+        h.update(repr(describe_network(network)).encode('utf-8'))
+        h.update(repr([(k, str(getattr(theano.config, k))) for k in THEANO_FLAGS_KEYS]).encode('utf-8'))
+        h.update(theano.__version__.encode('utf-8'))
+        for item in items:
+            h.update(repr(item).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def load(self, key, params):
+        """
+        loads the compiled functions and relinks their shared variables to params, the current
+        values of params are kept
+        :param key: cache key
+        :param params: all network parameters, las.layers.get_all_params(network)
+        :return: compiled functions, None if not cached
+        """
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), RECURSION_LIMIT))
+        with open(path, 'rb') as f:
+            functions, cached_params = pickle.load(f)
+        for param, cached_param in zip(params, cached_params):
+            cached_param.set_value(param.get_value(borrow=True))
+            # share the storage, the network parameters now hold the values the functions update
+            param.container = cached_param.container
+        return functions
+
+    def save(self, key, functions, params):
+        """
+        :param key: cache key
+        :param functions: compiled functions, not yet called
+        :param params: all network parameters, las.layers.get_all_params(network)
+        """
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), RECURSION_LIMIT))
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((functions, params), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError) as e:
+            # some ops keep unpicklable objects, e.g. the scipy blas ops used without a c++ compiler
+            os.remove(tmp_path)
+            print('compiled functions not cached: {}'.format(e))
+            return
+        os.rename(tmp_path, self._path(key))
+
+    def load_or_compile(self, key, network, compile_fn, *args, **kwargs):
+        """
+        loads the compiled functions for key, compiling and storing them with compile_fn(*args, **kwargs)
+        if not cached
+        :param key: cache key
+        :param network: output layer of the network
+        :param compile_fn: function returning a tuple of compiled functions
+        :return: compiled functions
+        """
+        params = las.layers.get_all_params(network)
+        time_start = time.time()
+        functions = self.load(key, params)
+        if functions is not None:
+            print('loaded compiled functions from cache {} in {:.2f}s'.format(self._path(key),
+                                                                              time.time() - time_start))
+            return functions
+        functions = compile_fn(*args, **kwargs)
+        print('compiled functions in {:.2f}s'.format(time.time() - time_start))
+        self.save(key, functions, params)
+        return functions
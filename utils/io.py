@@ -1,4 +1,7 @@
+import os
 import sys
+import json
+import numpy as np
 import scipy.io as sio
 import lasagne as las
 sys.path.insert(0, '../')
@@ -15,15 +18,71 @@ def read_data_split_file(path, sep=','):
     return subjects
 
 
+NPY_STORE_INDEX = 'index.json'
+
+
 def load_mat_file(path):
     """
-    Loads .mat file
-    :param path: path to .mat file
+    Loads .mat file. If path is a directory created by convert_mat_to_npy_store,
+    the memory-mapped npy store is loaded instead
+    :param path: path to .mat file or npy store directory
     :return: dictionary containing .mat data
     """
+    if os.path.isdir(path):
+        return load_npy_store(path)
     return sio.loadmat(path)
 
 
+def convert_mat_to_npy_store(mat_path, store_path, fields=None):
+    """
+    converts a .mat file into a memory-mappable store, consisting of one .npy file per field
+    and an index.json describing the fields and the frame offset of every video.
+    dataMatrix is stored as float32
+    :param mat_path: path to .mat file
+    :param store_path: output directory
+    :param fields: fields to convert, all numeric fields if None
+    :return: store index
+    """
+    data = sio.loadmat(mat_path)
+    if fields is None:
+        fields = [k for k in sorted(data.keys()) if not k.startswith('__') and
+                  isinstance(data[k], np.ndarray) and data[k].dtype.kind in 'biuf']
+    if not os.path.isdir(store_path):
+        os.makedirs(store_path)
+
+    index = {'source': os.path.abspath(mat_path), 'fields': {}}
+    for field in fields:
+        arr = data[field].astype('float32') if field == 'dataMatrix' else data[field]
+        arr = np.ascontiguousarray(arr)
+        np.save(os.path.join(store_path, field + '.npy'), arr)
+        index['fields'][field] = {'file': field + '.npy', 'shape': list(arr.shape), 'dtype': arr.dtype.str}
+    if 'videoLengthVec' in data:
+        vidlens = data['videoLengthVec'].reshape((-1,)).astype(int)
+        index['video_offsets'] = (np.cumsum(vidlens) - vidlens).tolist()
+    with open(os.path.join(store_path, NPY_STORE_INDEX), 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+def load_npy_store(store_path, mmap_mode='c'):
+    """
+    loads a store created by convert_mat_to_npy_store. Fields are memory-mapped, so loading
+    is instant and the pages are shared between processes reading the same store.
+    The default copy-on-write mode allows in-place modifications without touching the files
+    :param store_path: store directory
+    :param mmap_mode: numpy memmap mode
+    :return: dictionary containing the stored fields, same layout as load_mat_file
+    """
+    with open(os.path.join(store_path, NPY_STORE_INDEX)) as f:
+        index = json.load(f)
+    data = {}
+    for field, info in index['fields'].items():
+        data[field] = np.load(os.path.join(store_path, info['file']), mmap_mode=mmap_mode)
+    if 'video_offsets' in index:
+        data['videoOffsetVec'] = np.array(index['video_offsets'], dtype=int)
+    return data
+
+
 def save_mat(dict, path):
     print('save matlab file...')
     sio.savemat(path, dict)
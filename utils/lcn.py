@@ -1,9 +1,8 @@
 import theano
 import theano.tensor as T
 import numpy as np
+from scipy import ndimage
 from theano.tensor.nnet import conv
-import matplotlib.pyplot as plt
-import pylab
 
 
 def gaussian_filter(kernel_shape):
@@ -21,29 +20,39 @@ def gaussian_filter(kernel_shape):
     return x / np.sum(x)
 
 
-def lecun_lcn(input, img_shape, kernel_shape, threshold=1e-4):
-    input = input.reshape(input.shape[0], 1, img_shape[0], img_shape[1])
-    X = T.matrix(dtype=theano.config.floatX)
-    X = X.reshape(input.shape)
+_lcn_cache = {}
+
+
+def compile_lecun_lcn(img_shape, kernel_shape, threshold=1e-4):
+    """
+    compiles lecun local contrast normalization for a symbolic batch of images, the compiled
+    function is cached per (image shape, kernel shape, threshold, floatX)
+    :param img_shape: (nb_row, nb_col) image dimensions
+    :param kernel_shape: kernel shape of image eg: 9x9
+    :param threshold: threshold to allow enhance of edges
+    :return: theano function mapping images of shape (batch_size, 1, nb_row, nb_col) to (batch_size, nb_row, nb_col)
+    """
+    key = (tuple(img_shape), kernel_shape, threshold, theano.config.floatX)
+    if key in _lcn_cache:
+        return _lcn_cache[key]
+
+    X = T.tensor4(dtype=theano.config.floatX)
 
     filter_shape = (1, 1, kernel_shape, kernel_shape)
-    filters = gaussian_filter(kernel_shape).reshape(filter_shape)
+    filters = gaussian_filter(kernel_shape).reshape(filter_shape).astype(theano.config.floatX)
 
     convout = conv.conv2d(input=X,
                           filters=filters,
-                          image_shape=(input.shape[0], 1, img_shape[0], img_shape[1]),
                           filter_shape=filter_shape,
                           border_mode='full')
 
     # For each pixel, remove mean of 9x9 neighborhood
     mid = int(np.floor(kernel_shape / 2.))
     centered_X = X - convout[:, :, mid:-mid, mid:-mid]
-    centered_X = X - convout[:, :, mid:-mid, mid:-mid]
 
     # Scale down norm of 9x9 patch if norm is bigger than 1
     sum_sqr_XX = conv.conv2d(input=centered_X ** 2,
                              filters=filters,
-                             image_shape=(input.shape[0], 1, img_shape[0], img_shape[1]),
                              filter_shape=filter_shape,
                              border_mode='full')
 
@@ -57,56 +66,82 @@ def lecun_lcn(input, img_shape, kernel_shape, threshold=1e-4):
     new_X = new_X.flatten(ndim=3)
 
     f = theano.function([X], new_X)
+    _lcn_cache[key] = f
     return f
-    # return f(input)
+
+
+def lecun_lcn(input, img_shape, kernel_shape, threshold=1e-4):
+    """
+    :return: cached theano function that computes the local contrast normalized images, see compile_lecun_lcn
+    """
+    return compile_lecun_lcn(img_shape, kernel_shape, threshold)
 
 
 def make_lecun_lcn(input_shape, img_shape, kernel_shape, threshold=1e-4):
     """
     lecun local contrast normalization
-    :param input_shape: (batch_size, stack_size, nb_row, nb_col)
+    :param input_shape: (batch_size, stack_size, nb_row, nb_col), any batch size is accepted
     :param img_shape: (nb_row, nb_col) image dimensions
     :param kernel_shape: kernel shape of image eg: 9x9
     :param threshold: threshold to allow enhance of edges
     :return: theano function that computes the local contrast normalized image
     """
-    X = T.matrix(dtype=theano.config.floatX)
-    X = X.reshape(input_shape)
+    return compile_lecun_lcn(img_shape, kernel_shape, threshold)
 
-    filter_shape = (1, 1, kernel_shape, kernel_shape)
-    filters = gaussian_filter(kernel_shape).reshape(filter_shape)
-
-    convout = conv.conv2d(input=X,
-                          filters=filters,
-                          image_shape=(input_shape[0], 1, img_shape[0], img_shape[1]),
-                          filter_shape=filter_shape,
-                          border_mode='full')
 
-    # For each pixel, remove mean of 9x9 neighborhood
-    mid = int(np.floor(kernel_shape / 2.))
-    centered_X = X - convout[:, :, mid:-mid, mid:-mid]
+def lecun_lcn_numpy(images, kernel_shape, threshold=1e-4, sigma=2.0):
+    """
+    numpy/scipy lecun local contrast normalization, computes the same result as compile_lecun_lcn
+    with the gaussian filter applied separably along the rows and columns, without theano compilation
+    :param images: images of shape (batch_size, nb_row, nb_col)
+    :param kernel_shape: kernel shape of image eg: 9x9
+    :param threshold: threshold to allow enhance of edges
+    :param sigma: gaussian filter standard deviation, as used by gaussian_filter
+    :return: local contrast normalized images of shape (batch_size, nb_row, nb_col)
+    """
+    mid = np.floor(kernel_shape / 2.)
+    g = np.exp(-(np.arange(kernel_shape) - mid) ** 2 / (2. * sigma ** 2))
+    g = (g / np.sum(g)).astype(images.dtype)
 
-    # Scale down norm of 9x9 patch if norm is bigger than 1
-    sum_sqr_XX = conv.conv2d(input=centered_X ** 2,
-                             filters=filters,
-                             image_shape=(input_shape[0], 1, img_shape[0], img_shape[1]),
-                             filter_shape=filter_shape,
-                             border_mode='full')
+    def blur(X):
+        X = ndimage.correlate1d(X, g, axis=1, mode='constant', cval=0.)
+        return ndimage.correlate1d(X, g, axis=2, mode='constant', cval=0.)
 
-    denom = T.sqrt(sum_sqr_XX[:, :, mid:-mid, mid:-mid])
-    per_img_mean = denom.mean(axis=[1, 2])
-    divisor = T.largest(per_img_mean.dimshuffle(0, 'x', 'x', 1), denom)
-    divisor = T.maximum(divisor, threshold)
+    centered_X = images - blur(images)
+    denom = np.sqrt(blur(centered_X ** 2))
+    # the mean is taken over the rows only, leaving one value per image column
+    per_img_mean = denom.mean(axis=1, keepdims=True)
+    divisor = np.maximum(np.maximum(per_img_mean, denom), threshold)
+    return centered_X / divisor
 
-    new_X = centered_X / divisor
-    new_X = new_X.dimshuffle(0, 2, 3, 1)
-    new_X = new_X.flatten(ndim=3)
 
-    f = theano.function([X], new_X)
-    return f
+def lcn_images(images, img_shape, kernel_shape, threshold=1e-4, batchsize=1000, use_theano=True):
+    """
+    local contrast normalizes a data matrix of flattened images in chunks of batchsize images
+    :param images: images of shape (N, nb_row * nb_col), 'C' order
+    :param img_shape: (nb_row, nb_col) image dimensions
+    :param kernel_shape: kernel shape of image eg: 9x9
+    :param threshold: threshold to allow enhance of edges
+    :param batchsize: number of images normalized at once
+    :param use_theano: use the compiled theano function, otherwise lecun_lcn_numpy
+    :return: normalized images of shape (N, nb_row * nb_col)
+    """
+    dtype = theano.config.floatX if use_theano else np.result_type(images.dtype, np.float32)
+    out = np.empty((len(images), img_shape[0] * img_shape[1]), dtype=dtype)
+    lcn = compile_lecun_lcn(img_shape, kernel_shape, threshold) if use_theano else None
+    for start in range(0, len(images), batchsize):
+        batch = images[start:start + batchsize].astype(dtype, copy=False)
+        if use_theano:
+            res = lcn(batch.reshape((-1, 1) + tuple(img_shape)))
+        else:
+            res = lecun_lcn_numpy(batch.reshape((-1,) + tuple(img_shape)), kernel_shape, threshold)
+        out[start:start + len(batch)] = res.reshape((len(batch), -1))
+    return out
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    import pylab
     theano.config.floatX = 'float32'
     x_img = plt.imread("../avletters/data/diff.png")  # change as needed
 
@@ -1,11 +1,14 @@
 # Preprocessing scripts for AV Letters Dataset
 
+import os
 import math
+import hashlib
 import numpy as np
 import numpy.matlib as matlab
 import scipy.signal as signal
 import scipy.fftpack as fft
 from scipy.misc import imresize
+from utils.segment_ops import segment_mean_subtract, segment_diff, row_znorm, row_minmax, BLOCK_ROWS
 
 
 def test_delta():
@@ -108,6 +111,50 @@ def split_data(data_matrix, split_idx, len_vec=None):
         return split
 
 
+def compute_seq_split_index(subjects, video_lens, train_ids, val_ids, test_ids):
+    """
+    Computes the video and frame masks of the training, validation and testing splits
+    :param subjects: array of video -> subject mapping
+    :param video_lens: array of video lengths for each video
+    :param train_ids: list of subject ids used for training
+    :param val_ids: list of subject ids used for validation
+    :param test_ids: list of subject ids used for testing, videos of subjects not in
+        train_ids or val_ids are always placed in the test split
+    :return: list of (video mask, frame index) for the training, validation and testing splits
+    """
+    subjects = np.asarray(subjects).reshape((-1,))
+    video_lens = np.asarray(video_lens, dtype=int).reshape((-1,))
+    train_videos = np.isin(subjects, train_ids)
+    val_videos = np.isin(subjects, val_ids) & ~train_videos
+    test_videos = ~(train_videos | val_videos)
+    splits = []
+    for video_mask in [train_videos, val_videos, test_videos]:
+        frame_idx = np.flatnonzero(np.repeat(video_mask, video_lens))
+        splits.append((video_mask, frame_idx))
+    return splits
+
+
+def split_multistream_seq_data(Xs, y, subjects, video_lens, train_ids, val_ids, test_ids):
+    """
+    Splits multiple aligned data streams into training and testing sets
+    :param Xs: list of aligned inputs X, all sharing the same targets and video lengths
+    :param y: target y
+    :param subjects: array of video -> subject mapping
+    :param video_lens: array of video lengths for each video
+    :param train_ids: list of subject ids used for training
+    :param val_ids: list of subject ids used for validation
+    :param test_ids: list of subject ids used for testing
+    :return: split data, same layout as split_seq_data with a list of split inputs in place of X
+    """
+    subjects = np.asarray(subjects).reshape((-1,))
+    video_lens = np.asarray(video_lens).reshape((-1,))
+    res = []
+    for video_mask, frame_idx in compute_seq_split_index(subjects, video_lens, train_ids, val_ids, test_ids):
+        res += [[X.take(frame_idx, axis=0) for X in Xs], y.take(frame_idx, axis=0),
+                video_lens[video_mask], subjects[video_mask]]
+    return tuple(res)
+
+
 def split_seq_data(X, y, subjects, video_lens, train_ids, val_ids, test_ids):
     """
     Splits the data into training and testing sets
@@ -120,61 +167,13 @@ def split_seq_data(X, y, subjects, video_lens, train_ids, val_ids, test_ids):
     :param test_ids: list of subject ids used for testing
     :return: split data
     """
-    # construct a subjects data matrix offset
-    X_feature_dim = X.shape[1]
-    train_X = np.empty((0, X_feature_dim), dtype='float32')
-    val_X = np.empty((0, X_feature_dim), dtype='float32')
-    test_X = np.empty((0, X_feature_dim), dtype='float32')
-    train_y = np.empty((0,), dtype='int')
-    val_y = np.empty((0,), dtype='int')
-    test_y = np.empty((0,), dtype='int')
-    train_vidlens = np.empty((0,), dtype='int')
-    val_vidlens = np.empty((0,), dtype='int')
-    test_vidlens = np.empty((0,), dtype='int')
-    train_subjects = np.empty((0,), dtype='int')
-    val_subjects = np.empty((0,), dtype='int')
-    test_subjects = np.empty((0,), dtype='int')
-    previous_subject = 1
-    subject_video_count = 0
-    current_video_idx = 0
-    current_data_idx = 0
-    populate = False
-    for idx, subject in enumerate(subjects):
-        if previous_subject == subject:  # accumulate
-            subject_video_count += 1
-        else:  # populate the previous subject
-            populate = True
-        if idx == len(subjects) - 1:  # check if it is the last entry, if so populate
-            populate = True
-            previous_subject = subject
-        if populate:
-            # slice the data into the respective splits
-            end_video_idx = current_video_idx + subject_video_count
-            subject_data_len = int(np.sum(video_lens[current_video_idx:end_video_idx]))
-            end_data_idx = current_data_idx + subject_data_len
-            if previous_subject in train_ids:
-                train_X = np.concatenate((train_X, X[current_data_idx:end_data_idx]))
-                train_y = np.concatenate((train_y, y[current_data_idx:end_data_idx]))
-                train_vidlens = np.concatenate((train_vidlens, video_lens[current_video_idx:end_video_idx]))
-                train_subjects = np.concatenate((train_subjects, subjects[current_video_idx:end_video_idx]))
-            elif previous_subject in val_ids:
-                val_X = np.concatenate((val_X, X[current_data_idx:end_data_idx]))
-                val_y = np.concatenate((val_y, y[current_data_idx:end_data_idx]))
-                val_vidlens = np.concatenate((val_vidlens, video_lens[current_video_idx:end_video_idx]))
-                val_subjects = np.concatenate((val_subjects, subjects[current_video_idx:end_video_idx]))
-            else:
-                test_X = np.concatenate((test_X, X[current_data_idx:end_data_idx]))
-                test_y = np.concatenate((test_y, y[current_data_idx:end_data_idx]))
-                test_vidlens = np.concatenate((test_vidlens, video_lens[current_video_idx:end_video_idx]))
-                test_subjects = np.concatenate((test_subjects, subjects[current_video_idx:end_video_idx]))
-            previous_subject = subject
-            current_video_idx = end_video_idx
-            current_data_idx = end_data_idx
-            subject_video_count = 1
-            populate = False
-    return train_X, train_y, train_vidlens, train_subjects, \
-           val_X, val_y, val_vidlens, val_subjects, \
-           test_X, test_y, test_vidlens, test_subjects
+    train_X, train_y, train_vidlens, train_subjects, \
+    val_X, val_y, val_vidlens, val_subjects, \
+    test_X, test_y, test_vidlens, test_subjects = split_multistream_seq_data([X], y, subjects, video_lens,
+                                                                             train_ids, val_ids, test_ids)
+    return train_X[0], train_y, train_vidlens, train_subjects, \
+           val_X[0], val_y, val_vidlens, val_subjects, \
+           test_X[0], test_y, test_vidlens, test_subjects
 
 
 def resize_img(img, orig_dim=(60, 80), dim=(30, 40), reshape=True, order='F'):
@@ -192,7 +191,8 @@ def resize_img(img, orig_dim=(60, 80), dim=(30, 40), reshape=True, order='F'):
     return imresize(img, dim)
 
 
-def resize_images(images, orig_dim=(60, 80), dim=(30, 40), reshape=True, order='F'):
+def resize_images(images, orig_dim=(60, 80), dim=(30, 40), reshape=True, order='F', batched=False, workers=None,
+                  chunksize=10000):
     """
     resize a data matrix consisting of multiple images
     :param images: images to resize
@@ -200,8 +200,21 @@ def resize_images(images, orig_dim=(60, 80), dim=(30, 40), reshape=True, order='
     :param dim: new dimension of images
     :param reshape: 1-D to 2-D reshaping required
     :param order: 'C' order or 'F' order
+    :param batched: resize all images at once with bilinear interpolation matrices (see resize_images_batched),
+                    values keep their range. Otherwise resize each image with scipy.misc.imresize, which
+                    rescales the images to 0-255 as the existing features and trained models expect
+    :param workers: batched mode only, resize chunks of chunksize images in a pool of this many processes
+    :param chunksize: number of images per chunk in the process pool
     :return: resized images back in original shape
     """
+    if batched:
+        if not reshape:
+            images = images.reshape((len(images), -1), order=order)
+        if workers is None:
+            resized = resize_images_batched(images, orig_dim, dim, order)
+        else:
+            resized = resize_images_parallel(images, orig_dim, dim, order, workers, chunksize)
+        return resized if reshape else resized.reshape((len(images),) + tuple(dim))
     if reshape:
         resized = np.zeros((images.shape[0], dim[0] * dim[1]))
     else:
@@ -215,6 +228,73 @@ def resize_images(images, orig_dim=(60, 80), dim=(30, 40), reshape=True, order='
     return resized
 
 
+def bilinear_resize_matrix(in_size, out_size, dtype='float32'):
+    """
+    computes the 1D bilinear interpolation matrix used by PIL to resize an axis, including the
+    widened (antialiasing) filter support when downsampling
+    :param in_size: original axis length
+    :param out_size: resized axis length
+    :return: matrix of shape (out_size, in_size)
+    """
+    scale = in_size / float(out_size)
+    filterscale = max(scale, 1.0)
+    support = filterscale  # bilinear filter support 1
+    centers = (np.arange(out_size) + 0.5) * scale
+    x = np.arange(in_size)
+    lo = np.maximum((centers - support + 0.5).astype(int), 0)
+    hi = np.minimum((centers + support + 0.5).astype(int), in_size)
+    weights = np.maximum(1 - np.abs((x[None, :] - centers[:, None] + 0.5) / filterscale), 0)
+    weights[(x[None, :] < lo[:, None]) | (x[None, :] >= hi[:, None])] = 0
+    weights /= weights.sum(axis=1, keepdims=True)
+    return weights.astype(dtype)
+
+
+def resize_images_batched(images, orig_dim=(60, 80), dim=(30, 40), order='F'):
+    """
+    resize a data matrix of flattened images at once with separable bilinear interpolation,
+    two matrix products over all images. Unlike imresize, values are kept in their original range
+    :param images: images of shape (N, orig_dim[0] * orig_dim[1])
+    :param orig_dim: original dimension of images
+    :param dim: new dimension of images
+    :param order: 'C' order or 'F' order of the flattened input images
+    :return: resized images of shape (N, dim[0] * dim[1]), flattened in 'C' order, float32 unless the input is float64
+    """
+    dtype = np.result_type(images.dtype, np.float32)
+    rows = bilinear_resize_matrix(orig_dim[0], dim[0], dtype)
+    cols = bilinear_resize_matrix(orig_dim[1], dim[1], dtype)
+    n = len(images)
+    if order == 'F':
+        # (N, W, H) view, i.e. transposed images
+        imgs = images.reshape((n, orig_dim[1], orig_dim[0])).astype(dtype, copy=False)
+        resized = np.dot(imgs.reshape((-1, orig_dim[0])), rows.T).reshape((n, orig_dim[1], dim[0]))
+        resized = np.matmul(cols, resized).transpose((0, 2, 1))
+    else:
+        imgs = images.reshape((n, orig_dim[0], orig_dim[1])).astype(dtype, copy=False)
+        resized = np.dot(imgs.reshape((-1, orig_dim[1])), cols.T).reshape((n, orig_dim[0], dim[1]))
+        resized = np.matmul(rows, resized)
+    return np.ascontiguousarray(resized).reshape((n, dim[0] * dim[1]))
+
+
+def _resize_images_chunk(args):
+    return resize_images_batched(*args)
+
+
+def resize_images_parallel(images, orig_dim=(60, 80), dim=(30, 40), order='F', workers=None, chunksize=10000):
+    """
+    resize_images_batched over chunks of chunksize images in a process pool, for very large data matrices
+    :param workers: number of processes, number of CPUs if None
+    """
+    import multiprocessing as mp
+    chunks = [(images[i:i + chunksize], orig_dim, dim, order) for i in range(0, len(images), chunksize)]
+    pool = mp.Pool(workers)
+    try:
+        resized = pool.map(_resize_images_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    return np.concatenate(resized)
+
+
 def normalize_input(input, centralize=True, quantize=False):
     """
     samplewise normalize input
@@ -223,22 +303,10 @@ def normalize_input(input, centralize=True, quantize=False):
     :param quantize: rescale values to fall between 0 and 1
     :return: normalized input
     """
-    def center(item):
-        item = item - item.mean()
-        item = item / np.std(item)
-        return item
-
-    def rescale(item):
-        min = np.min(item)
-        max = np.max(item)
-        item = (item - min) / (max - min)
-        return item
-
-    for i, item in enumerate(input):
-        if centralize:
-            input[i] = center(item)
-        if quantize:
-            input[i] = rescale(item)
+    if centralize:
+        row_znorm(input, out=input)
+    if quantize:
+        row_minmax(input, out=input)
     return input
 
 
@@ -265,16 +333,8 @@ def sequencewise_mean_image_subtraction(input, seqlens, axis=0):
     :param axis: axis to apply mean image removal
     :return: mean removed input sequences
     """
-    mean_subtracted = np.zeros(input.shape, input.dtype)
-    start = 0
-    end = 0
-    for len in seqlens:
-        end += len
-        seq = input[start:end, :]
-        mean_image = np.sum(seq, axis, input.dtype) / len
-        mean_subtracted[start:end, :] = seq - mean_image
-        start += len
-    return mean_subtracted
+    assert axis == 0
+    return segment_mean_subtract(input, seqlens)
 
 
 def zigzag(X):
@@ -399,6 +459,23 @@ def fill_zigzag(shape):
     return out
 
 
+_zigzag_index_cache = {}
+
+
+def zigzag_index(shape):
+    """
+    computes the flattened ('c' order) indexes of a 2D array in the zigzag traversal order of
+    fill_zigzag. The index is computed once per shape and cached, so that zigzag(X) is equivalent
+    to X.reshape((-1,))[zigzag_index(X.shape)]
+    :param shape: shape of 2D array
+    :return: 1D index array
+    """
+    shape = tuple(shape)
+    if shape not in _zigzag_index_cache:
+        _zigzag_index_cache[shape] = np.argsort(fill_zigzag(shape).reshape((-1,)))
+    return _zigzag_index_cache[shape]
+
+
 def test_zigzag():
     X = np.array([[1, 2, 6, 7],
                   [3, 5, 8, 11],
@@ -412,9 +489,10 @@ def test_zigzag():
     assert all(res[i] < res[i + 1] for i in range(len(res) - 1))
     res = zigzag(Y)
     assert all(res[i] < res[i + 1] for i in range(len(res) - 1))
+    assert np.array_equal(Y.reshape((-1,))[zigzag_index(Y.shape)], res)
 
 
-def compute_dct_features(X, image_shape, no_coeff=30, method='zigzag'):
+def compute_dct_features(X, image_shape, no_coeff=30, method='zigzag', dct_2d=True):
     """
     compute 2D-dct features of a given image.
     Type 2 DCT and finds the DCT coefficents with the largest mean normalized variance
@@ -422,16 +500,18 @@ def compute_dct_features(X, image_shape, no_coeff=30, method='zigzag'):
     :param image_shape: image shape
     :param no_coeff: number of coefficients to extract
     :param method: method to extract coefficents, zigzag, variance
+    :param dct_2d: apply a separable 2D DCT over the rows and columns of each image,
+        otherwise apply a 1D DCT over each flattened image
     :return: dct features
     """
-    X_dct = fft.dct(X, norm='ortho')
+    if dct_2d:
+        images = X.reshape((-1,) + tuple(image_shape))
+        X_dct = fft.dct(fft.dct(images, axis=-1, norm='ortho'), axis=-2, norm='ortho').reshape((len(X), -1))
+    else:
+        X_dct = fft.dct(X, norm='ortho')
 
     if method == 'zigzag':
-        out = np.zeros((len(X_dct), no_coeff), dtype=X_dct.dtype)
-        for i in xrange(len(X_dct)):
-            image = X_dct[i].reshape(image_shape)
-            out[i] = zigzag(image)[1:no_coeff + 1]
-        return out
+        return X_dct[:, zigzag_index(image_shape)[1:no_coeff + 1]]
     elif method == 'rel_variance':
         X_dct = X_dct[:, 1:]
         # mean coefficient per frequency
@@ -462,30 +542,65 @@ def compute_dct_features(X, image_shape, no_coeff=30, method='zigzag'):
         raise NotImplementedError("method not implemented, use only 'zigzag', 'variance', 'rel_variance")
 
 
+def _delta_pad_index(vidlenvec, hlen):
+    """
+    build the gather index that pads every sequence of a data matrix with hlen frames on each end,
+    replicating the edge frames of the sequence in the same way as deltas()
+    :param vidlenvec: sequence lengths
+    :param hlen: half window size
+    :return: padded gather index, index of the valid (trimmed) rows in the filtered padded matrix
+    """
+    lens = np.asarray(vidlenvec, dtype=int).reshape((-1,))
+    starts = np.cumsum(lens) - lens
+    padded_lens = lens + 2 * hlen
+    padded_starts = np.cumsum(padded_lens) - padded_lens
+    seg = np.repeat(np.arange(len(lens)), padded_lens)
+    # position of each padded row relative to the start of its original sequence
+    pos = np.arange(np.sum(padded_lens)) - padded_starts[seg] - hlen
+    # head is padded with the 2nd frame of the sequence, see deltas()
+    pos[pos < 0] = 1
+    pos = np.minimum(pos, lens[seg] - 1)
+    pad_idx = starts[seg] + pos
+    # lfilter output is delayed by 2 * hlen, the valid rows start there in each padded sequence
+    frame_no = np.arange(np.sum(lens)) - np.repeat(starts, lens)
+    valid_idx = np.repeat(padded_starts + 2 * hlen, lens) + frame_no
+    return pad_idx, valid_idx
+
+
+def batch_deltas(X, vidlenvec, w=9, out=None):
+    """
+    Calculate the deltas of all sequences in a data matrix in a single pass.
+    Equivalent to calling deltas() on the transpose of every sequence, but pads all
+    sequences with one gather and runs a single filter over the whole matrix.
+    :param X: data matrix of shape (frames, features), sequences stacked along the rows
+    :param vidlenvec: sequence lengths of X
+    :param w: window size, defaults to 9
+    :param out: optional float32 array of shape X.shape to write the deltas into
+    :return: deltas of shape (frames, features)
+    """
+    hlen = w // 2
+    win = np.arange(hlen, -hlen - 1, -1, dtype=np.float32)
+    pad_idx, valid_idx = _delta_pad_index(vidlenvec, hlen)
+    d = signal.lfilter(win, 1, X.take(pad_idx, axis=0).astype('float32', copy=False), axis=0)
+    if out is None:
+        out = np.empty(X.shape, dtype='float32')
+    out[:] = d.take(valid_idx, axis=0)
+    return out
+
+
 def concat_first_second_deltas(X, vidlenvec, w=9):
     """
     Compute and concatenate 1st and 2nd order derivatives of input X given a sequence list
     :param X: input feature vector X
     :param vidlenvec: temporal sequence of X
     :param w: window size, defaults to 9
-    :return: A matrix of shape(num rows of intput X, X + 1st order X + 2nd order X)
+    :return: A float32 matrix of shape(num rows of intput X, X + 1st order X + 2nd order X)
     """
-    # construct a new feature matrix
     feature_len = X.shape[1]
-    Y = np.zeros((X.shape[0], feature_len * 3))  # new feature vector with 1st, 2nd delta
-    start = 0
-    for vidlen in vidlenvec:
-        end = start + vidlen
-        seq = X[start: end]  # (vidlen, feature_len)
-        first_order = deltas(seq.T, w)
-        second_order = deltas(first_order, w)
-        assert first_order.shape == (feature_len, vidlen)
-        assert second_order.shape == (feature_len, vidlen)
-        assert len(seq) == vidlen
-        seq = np.concatenate((seq, first_order.T, second_order.T), axis=1)
-        for idx, j in enumerate(range(start, end)):
-            Y[j] = seq[idx]
-        start += vidlen
+    Y = np.empty((X.shape[0], feature_len * 3), dtype='float32')  # new feature vector with 1st, 2nd delta
+    Y[:, :feature_len] = X
+    first_order = batch_deltas(X, vidlenvec, w, out=Y[:, feature_len:feature_len * 2])
+    batch_deltas(first_order, vidlenvec, w, out=Y[:, feature_len * 2:])
     return Y
 
 
@@ -504,17 +619,14 @@ def reorder_data(X, shape, orig_order='f', desired_order='c'):
 
 
 def compute_diff_images(X, vidlenvec):
-
-    diff_X = np.zeros(X.shape, dtype=X.dtype)
-    start = 0
-    for l in vidlenvec:
-        end = start + l
-        seq = X[start:end]
-        diff_seq = np.diff(seq, 1, 0)
-        diff_X[start] = diff_seq[0]  # copy the 1st diff image
-        diff_X[start+1:end] = diff_seq
-        start = end
-    return diff_X
+    """
+    computes the difference images of each sequence, the 1st difference image is repeated
+    to keep the sequence lengths
+    :param X: input sequences
+    :param vidlenvec: sequence lengths
+    :return: difference images
+    """
+    return segment_diff(X, vidlenvec)
 
 
 def zca_whiten(inputs):
@@ -526,36 +638,232 @@ def zca_whiten(inputs):
 
 
 def apply_zca_whitening(X):
-    for i, img in enumerate(X):
-        X[i] = zca_whiten(img.reshape((1, -1)))
+    """
+    per image whitening, zca_whiten of a single (1, D) image reduces to scaling the image by
+    1 / sqrt(mean(img ** 2) + epsilon), computed here for all images at once.
+    use ZCAWhitening for whitening with a whitening matrix fitted on the training data
+    :param X: images of shape (N, D), whitened in place
+    :return: whitened images
+    """
+    epsilon = 0.1
+    for start in range(0, len(X), BLOCK_ROWS):
+        block = X[start:start + BLOCK_ROWS]
+        block /= np.sqrt(np.mean(np.square(block), axis=1, keepdims=True) + epsilon).astype(X.dtype)
     return X
 
 
-def factorize(inputs, targets, input_len, multipleof, axis_to_delete=None):
+class ZCAWhitening(object):
+    """
+    ZCA whitening transform, fitted once on the training data and applied to any data in
+    batches. The whitening matrix is computed from the eigendecomposition of the feature
+    covariance, or from a randomized truncated decomposition of the n_components largest
+    components for high dimensional inputs
+    """
+    def __init__(self, epsilon=0.1, n_components=None, method='full', n_iter=4, batchsize=BLOCK_ROWS, rng=None):
+        """
+        :param epsilon: whitening constant, it prevents division by zero
+        :param n_components: number of principal components kept, None keeps all
+        :param method: 'full' eigendecomposition of the covariance, 'randomized' truncated decomposition
+        :param n_iter: number of power iterations of the randomized decomposition
+        :param batchsize: number of rows processed at once
+        :param rng: random state of the randomized decomposition
+        """
+        if method not in ('full', 'randomized'):
+            raise ValueError('unknown method {}, use full or randomized'.format(method))
+        if method == 'randomized' and n_components is None:
+            raise ValueError('randomized method requires n_components')
+        self.epsilon = epsilon
+        self.n_components = n_components
+        self.method = method
+        self.n_iter = n_iter
+        self.batchsize = batchsize
+        self.rng = rng if rng else np.random.RandomState()
+        self.mean = None
+        self.components = None
+        self.fingerprint = ''  # data_fingerprint of the training data, set by load_or_fit_zca
+
+    def _cov_dot(self, X, M):
+        """
+        computes cov(X) M without forming the covariance matrix
+        """
+        res = np.zeros((X.shape[1], M.shape[1]))
+        for start in range(0, len(X), self.batchsize):
+            block = X[start:start + self.batchsize] - self.mean
+            res += np.dot(block.T, np.dot(block, M))
+        return res / len(X)
+
+    def _covariance(self, X):
+        cov = np.zeros((X.shape[1], X.shape[1]))
+        for start in range(0, len(X), self.batchsize):
+            block = X[start:start + self.batchsize] - self.mean
+            cov += np.dot(block.T, block)
+        return cov / len(X)
+
+    def _randomized_eigh(self, X):
+        Q = self.rng.normal(size=(X.shape[1], min(self.n_components + 10, X.shape[1])))
+        Q, _ = np.linalg.qr(self._cov_dot(X, Q))
+        for _ in range(self.n_iter):
+            Q, _ = np.linalg.qr(self._cov_dot(X, Q))
+        S, V = np.linalg.eigh(np.dot(Q.T, self._cov_dot(X, Q)))
+        return S, np.dot(Q, V)
+
+    def fit(self, X):
+        """
+        fits the whitening matrix
+        :param X: training data of shape (N, D)
+        :return: self
+        """
+        self.mean = X.mean(axis=0, dtype='float64')
+        if self.method == 'full':
+            S, U = np.linalg.eigh(self._covariance(X))
+        else:
+            S, U = self._randomized_eigh(X)
+        # eigh returns the eigenvalues in ascending order
+        order = np.argsort(S)[::-1][:self.n_components]
+        S = np.maximum(S[order], 0)
+        U = U[:, order]
+        self.components = np.dot(U / np.sqrt(S + self.epsilon), U.T)
+        return self
+
+    def transform(self, X, out=None):
+        """
+        whitens X with the fitted whitening matrix
+        :param X: data of shape (N, D)
+        :param out: output array, may be X
+        :return: whitened data, in the dtype of X
+        """
+        if self.components is None:
+            raise ValueError('ZCAWhitening is not fitted')
+        if out is None:
+            out = np.empty_like(X)
+        mean = self.mean.astype(X.dtype)
+        components = self.components.astype(X.dtype)
+        for start in range(0, len(X), self.batchsize):
+            out[start:start + self.batchsize] = np.dot(X[start:start + self.batchsize] - mean, components)
+        return out
+
+    def fit_transform(self, X, out=None):
+        return self.fit(X).transform(X, out)
+
+    def save(self, filename):
+        """
+        saves the fitted transform, so the identical transform can be applied at inference
+        :param filename: .npz file
+        """
+        with open(filename, 'wb') as f:
+            # n_components 0 keeps all components
+            np.savez(f, mean=self.mean, components=self.components, epsilon=self.epsilon,
+                     n_components=self.n_components or 0, fingerprint=self.fingerprint)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        :param filename: .npz file written by save
+        :return: fitted ZCAWhitening
+        """
+        with np.load(filename) as f:
+            n_components = int(f['n_components']) if 'n_components' in f.files else 0
+            zca = cls(epsilon=float(f['epsilon']), n_components=n_components or None)
+            zca.mean = f['mean']
+            zca.components = f['components']
+            zca.fingerprint = str(f['fingerprint']) if 'fingerprint' in f.files else ''
+        return zca
+
+
+def data_fingerprint(X):
+    """
+    :param X: data matrix
+    :return: hex digest of the shape, dtype and contents of X
+    """
+    h = hashlib.sha1(repr((X.shape, str(X.dtype))).encode('utf-8'))
+    for start in range(0, len(X), BLOCK_ROWS):
+        h.update(np.ascontiguousarray(X[start:start + BLOCK_ROWS]).tobytes())
+    return h.hexdigest()
+
+
+def load_or_fit_zca(train_X, n_components=None, filename=None, epsilon=0.1):
+    """
+    loads the whitening transform from filename if it exists and was fitted with the same
+    n_components and epsilon on the same training data, otherwise fits it on the training data
+    and saves it to filename
+    :param train_X: training data of shape (N, D)
+    :param n_components: number of principal components kept, uses the randomized decomposition if set
+    :param filename: .npz file of the transform, None to not persist it
+    :param epsilon: whitening constant
+    :return: fitted ZCAWhitening
+    """
+    fingerprint = data_fingerprint(train_X) if filename else ''
+    if filename and os.path.isfile(filename):
+        zca = ZCAWhitening.load(filename)
+        if zca.n_components == n_components and zca.epsilon == epsilon and zca.fingerprint == fingerprint:
+            return zca
+    zca = ZCAWhitening(epsilon=epsilon, n_components=n_components, method='randomized' if n_components else 'full')
+    zca.fit(train_X)
+    if filename:
+        zca.fingerprint = fingerprint
+        zca.save(filename)
+    return zca
+
+
+def zca_from_config(config, stream_name, train_X):
+    """
+    the whitening transform configured by the zca, zca_components and zca_file options of a stream
+    :param config: config parser
+    :param stream_name: stream section
+    :param train_X: training data of the stream
+    :return: fitted ZCAWhitening, None if zca is not enabled
+    """
+    if not (config.has_option(stream_name, 'zca') and config.getboolean(stream_name, 'zca')):
+        return None
+    zca_components = config.getint(stream_name, 'zca_components') \
+        if config.has_option(stream_name, 'zca_components') else None
+    zca_file = config.get(stream_name, 'zca_file') if config.has_option(stream_name, 'zca_file') else None
+    return load_or_fit_zca(train_X, zca_components, zca_file)
+
+
+def factorize(inputs, targets, input_len, multipleof, axis_to_delete=None, rng=None):
     """
     factorize inputs to a factor of a given multiple
     :param inputs: input data vector arranged as (input size, feature len)
     :param targets: targets data vector
     :param input_len: input data vector original length of shape (1,)
     :param multipleof: given multiple to factorize input
+    :param rng: numpy RandomState used to select the removed items, the global numpy random state if None
     :return: merged samples of shape (input size / merge size, merged features)
     """
+    rng = np.random if rng is None else rng
     # if 1 dimension, reshape to 2 dim array
     if len(inputs.shape) < 2:
         inputs = inputs.reshape((-1, 1))
-    idx_to_remove = []
-    curr_idx = 0
-    for l in input_len:
-        end_idx = curr_idx + l
-        remainder = l % multipleof
-        # randomly remove items if it is not divisible by merge size
-        idx_to_remove += np.random.permutation(range(curr_idx, end_idx))[:remainder].tolist()
-        curr_idx += l
+    input_len = np.asarray(input_len)
+    lens = input_len.reshape((-1,)).astype(int)
+    remainders = lens % multipleof
+    # randomly remove items if it is not divisible by merge size: rank the items of every sequence
+    # by a random key and remove the ones ranked below the sequence remainder
+    seq_ids = np.repeat(np.arange(len(lens)), lens)
+    order = np.lexsort((rng.rand(len(seq_ids)), seq_ids))
+    rank = np.arange(len(seq_ids)) - np.repeat(np.cumsum(lens) - lens, lens)
+    idx_to_remove = np.sort(order[rank < remainders[seq_ids]])
     input_len = input_len - (input_len % multipleof)
     return np.delete(inputs, idx_to_remove, axis=axis_to_delete),\
            np.delete(targets, idx_to_remove, axis=axis_to_delete), input_len
 
 
+def _embed_temporal_index(X_len, window, step):
+    """
+    computes the gather index of embed_temporal_info, row i holds the frames in the window around the
+    i-th step of its sequence, clipped to the sequence boundaries
+    :return: index of shape (sum(X_len / step), window*2 + 1), index of the first frame of each row's sequence
+    """
+    lens = np.asarray(X_len).reshape((-1,)).astype(int)
+    rows = lens // step
+    starts = np.repeat(np.cumsum(lens) - lens, rows)
+    centres = (np.arange(np.sum(rows)) - np.repeat(np.cumsum(rows) - rows, rows)) * step + step // 2
+    offsets = centres[:, None] + np.arange(-window, window + 1)
+    idx = np.clip(offsets, 0, np.repeat(lens - 1, rows)[:, None]) + starts[:, None]
+    return idx, starts
+
+
 def embed_temporal_info(X, targets, X_len, window, step):
     """
     first downsample input to multiple of step
@@ -575,35 +883,31 @@ def embed_temporal_info(X, targets, X_len, window, step):
     :param step: step size to move per temporal feature
     :return:
     """
-    embedsize = X.shape[-1] * (window*2 + 1)
-    res = np.zeros((np.sum(X_len)/step, embedsize), dtype=X.dtype)
-    res_targets = np.zeros((np.sum(X_len)/step,), dtype=targets.dtype)
-    # select the sequence
-    curr_idx = 0
-    res_iter = 0
-    for l in X_len:
-        end_idx = curr_idx + l
-        seq = X[curr_idx:end_idx]
-        seq_target = targets[curr_idx:end_idx]
-        repeats = int(window - step + math.ceil(step/2.0))  # compute the number of elements to repeat
-        # extend the sequence in the head and tail based on the number of repeats
-        seq = np.concatenate((np.repeat(seq[:1, :], repeats, axis=0),
-                              seq,
-                              np.repeat(seq[-1:, :], repeats, axis=0)), axis=0)
-        # compute the starting position of the sequence to embed temporal info
-        startpos = repeats + (step/2)
-        # iterate through the sequence and embed temporal information, stop at the end of the original sequence len
-        while startpos - repeats < l:
-            temporal_feature = seq[startpos - window: startpos + window + 1].reshape((-1,))
-            res[res_iter] = temporal_feature
-            res_targets[res_iter] = seq_target[0]
-            startpos += step
-            res_iter += 1
-        curr_idx += l  # move to next sequence
-    res_len = X_len / step
+    idx, starts = _embed_temporal_index(X_len, window, step)
+    res = X[idx].reshape((len(idx), -1))
+    res_targets = targets[starts]
+    res_len = X_len // step
     return res, res_targets, res_len
 
 
+def iter_embed_temporal_info(X, targets, X_len, window, step, max_frames=100000):
+    """
+    streaming embed_temporal_info, processes groups of whole sequences of about max_frames input frames
+    at a time so that only the current group of X is read, e.g. from a memory-mapped X
+    :param max_frames: approximate number of input frames per group
+    :return: generator of (embedded features, targets, lengths) per group of sequences
+    """
+    lens = np.asarray(X_len).reshape((-1,)).astype(int)
+    ends = np.cumsum(lens)
+    start_seq = 0
+    while start_seq < len(lens):
+        start = ends[start_seq] - lens[start_seq]
+        end_seq = max(int(np.searchsorted(ends, start + max_frames, side='right')), start_seq + 1)
+        end = ends[end_seq - 1]
+        yield embed_temporal_info(X[start:end], targets[start:end], X_len[start_seq:end_seq], window, step)
+        start_seq = end_seq
+
+
 def force_align(x1, x2, mode='fill'):
     """
     Force Align 2 streams of data to equal lengths
@@ -612,53 +916,8 @@ def force_align(x1, x2, mode='fill'):
     :param mode: 'fill', 'discard'
     :return: x1, x2 streams forced aligned
     """
-    x1, x1_targets, x1_lens = x1
-    x2, x2_targets, x2_lens = x2
-    x1_new = []
-    x1_targets_new = []
-    x2_new = []
-    x2_targets_new = []
-    x1_curr_idx = 0
-    x2_curr_idx = 0
-    for i, l1 in enumerate(x1_lens):
-        l2 = x2_lens[i]
-        difference = l1 - l2
-        if mode == 'fill':
-            if difference < 0:
-                '''fill x1 with difference'''
-                difference = abs(difference)
-                for j in range(l1):
-                    x1_new.append(x1[x1_curr_idx + j])
-                    x1_targets_new.append(x1_targets[x1_curr_idx + j])
-                '''[0][1][2][3]'''
-                last_element = x1[x1_curr_idx + l1 - 1]
-                last_element_target = x1_targets[x1_curr_idx + l1 - 1]
-                for j in range(difference):
-                    x1_new.append(np.copy(last_element))
-                    x1_targets_new.append(np.copy(last_element_target))
-                x1_lens[i] = l1 + difference  # update the lens
-                for j in range(l2):
-                    x2_new.append(x2[x2_curr_idx + j])
-                    x2_targets_new.append(x2_targets[x2_curr_idx + j])
-            else:
-                '''fill x2 with difference'''
-                for j in range(l2):
-                    x2_new.append(x2[x2_curr_idx + j])
-                    x2_targets_new.append(x2_targets[x2_curr_idx + j])
-                '''[0][1][2][3]'''
-                last_element = x2[x2_curr_idx + l1 - 1]
-                last_element_target = x2_targets[x2_curr_idx + l2 - 1]
-                for j in range(difference):
-                    x2_new.append(np.copy(last_element))
-                    x2_targets_new.append(np.copy(last_element_target))
-                x2_lens[i] = l2 + difference  # update the lens
-                for j in range(l1):
-                    x1_new.append(x1[x1_curr_idx + j])
-                    x1_targets_new.append(x1_targets[x1_curr_idx + j])
-            x1_curr_idx += l1
-            x2_curr_idx += l2
-        # TODO: discard mode
-    return (np.array(x1_new), np.array(x1_targets_new), x1_lens), (np.array(x2_new), np.array(x2_targets_new), x2_lens)
+    x1_new, x2_new = multistream_force_align([x1, x2], mode)
+    return x1_new, x2_new
 
 
 def extract_stream_elements(streams):
@@ -670,43 +929,38 @@ def extract_stream_elements(streams):
     return tuple([list(tup) for tup in zip(*streams)])
 
 
+def _force_align_index(lens, aligned_lens):
+    """
+    computes the gather index aligning sequences of length lens to aligned_lens, shorter sequences
+    repeat their last frame and longer sequences are truncated
+    :param lens: original sequence lengths
+    :param aligned_lens: aligned sequence lengths
+    :return: 1D index array
+    """
+    starts = np.cumsum(lens) - lens
+    offsets = np.arange(np.sum(aligned_lens)) - np.repeat(np.cumsum(aligned_lens) - aligned_lens, aligned_lens)
+    return np.repeat(starts, aligned_lens) + np.minimum(offsets, np.repeat(lens - 1, aligned_lens))
+
+
 def multistream_force_align(orig_streams, mode='fill'):
     """
     force align multiple streams to be of the same length
     :param orig_streams: original streams in a list of tuple (input, target, input_lens)
-    :param mode: 'fill', 'discard' missing or excess data
+    :param mode: 'fill' shorter sequences by repeating their last frame or
+                 'discard' the excess frames of longer sequences
     :return: list of new streams of tuple (new_input, new_target, new_lens)
     """
-    INPUT_IDX = 0
-    TARGET_IDX = 1
-    LEN_IDX = 2
-    new_streams = [([], [], s[2]) for s in orig_streams]
-    curr_idxs = [0]*len(orig_streams)
     inputs, targets, input_lens = extract_stream_elements(orig_streams)
-    # for each sequence
-    for i, l1 in enumerate(input_lens[0]):
-        # compute the lens, find stream with longest length
-        lens = [input_len_vec[i] for input_len_vec in input_lens]
-        max_idx = np.argmax(lens)
-        # compute the number of copies to generate
-        copies_to_make = [input_lens[max_idx][i] - l[i] for l in input_lens]
-        # for each stream, append the original stream and copies to make to new stream
-        for j in range(len(orig_streams)):
-            input_vec = inputs[j]
-            target_vec = targets[j]
-            l = lens[j]  # length of sequence for current stream
-            for k in range(l):
-                new_streams[j][INPUT_IDX].append(input_vec[curr_idxs[j] + k])
-                new_streams[j][TARGET_IDX].append(target_vec[curr_idxs[j] + k])
-            copies = copies_to_make[j]
-            # make copies to fill shorter streams
-            for k in range(copies):
-                last_element = input_vec[curr_idxs[j] + l - 1]
-                last_element_target = target_vec[curr_idxs[j] + l - 1]
-                new_streams[j][INPUT_IDX].append(np.copy(last_element))
-                new_streams[j][TARGET_IDX].append(np.copy(last_element_target))
-            new_streams[j][LEN_IDX][i] = l + copies
-            curr_idxs[j] += l
-    # convert the lists to numpy arrays
-    new_streams = [(np.array(x[INPUT_IDX]), np.array(x[TARGET_IDX]), x[LEN_IDX]) for x in new_streams]
+    lens = [np.asarray(l).reshape((-1,)).astype(int) for l in input_lens]
+    if mode == 'fill':
+        aligned_lens = np.maximum.reduce(lens)
+    elif mode == 'discard':
+        aligned_lens = np.minimum.reduce(lens)
+    else:
+        raise NotImplementedError("mode not implemented, use only 'fill', 'discard'")
+    new_streams = []
+    for X, y, l, orig_lens in zip(inputs, targets, lens, input_lens):
+        idx = _force_align_index(l, aligned_lens)
+        new_lens = aligned_lens.astype(np.asarray(orig_lens).dtype).reshape(np.shape(orig_lens))
+        new_streams.append((X[idx], y[idx], new_lens))
     return new_streams
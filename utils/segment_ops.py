@@ -0,0 +1,132 @@
+"""
+vectorized operations over the sequences (segments) of a data matrix, where the sequences
+are stored back to back and described by their lengths (videoLengthVec).
+operations process the matrix in blocks of rows, so temporaries stay small and in the
+dtype of the input, and accept out=X to work in place
+"""
+import numpy as np
+
+BLOCK_ROWS = 8192
+
+
+def segment_starts(lens):
+    """
+    :param lens: sequence lengths
+    :return: index of the first row of each sequence
+    """
+    lens = np.asarray(lens).reshape((-1,)).astype(int)
+    return np.cumsum(lens) - lens
+
+
+def segment_ids(lens):
+    """
+    :param lens: sequence lengths
+    :return: sequence index of every row
+    """
+    lens = np.asarray(lens).reshape((-1,)).astype(int)
+    return np.repeat(np.arange(len(lens)), lens)
+
+
+def _blocks(n, block_rows=BLOCK_ROWS):
+    for start in range(0, n, block_rows):
+        yield start, min(start + block_rows, n)
+
+
+def _output(X, out):
+    if out is None:
+        return np.empty_like(X)
+    return out
+
+
+def segment_sum(X, lens):
+    """
+    sum of the rows of each sequence, accumulated in the dtype of X
+    :param X: data matrix of shape (rows, features)
+    :param lens: sequence lengths
+    :return: sums of shape (sequences, features)
+    """
+    lens = np.asarray(lens).reshape((-1,)).astype(int)
+    sums = np.zeros((len(lens),) + X.shape[1:], dtype=X.dtype)
+    nonempty = lens > 0
+    if np.any(nonempty):
+        # reduceat does not support empty segments
+        sums[nonempty] = np.add.reduceat(X, segment_starts(lens)[nonempty], axis=0)
+    return sums
+
+
+def segment_mean(X, lens):
+    """
+    :param X: data matrix of shape (rows, features)
+    :param lens: sequence lengths
+    :return: mean row of each sequence, of shape (sequences, features)
+    """
+    lens = np.asarray(lens).reshape((-1,)).astype(int)
+    means = segment_sum(X, lens)
+    means /= np.maximum(lens, 1).reshape((-1,) + (1,) * (X.ndim - 1)).astype(X.dtype)
+    return means
+
+
+def segment_mean_subtract(X, lens, out=None):
+    """
+    subtracts the mean row of each sequence from its rows
+    :param X: data matrix of shape (rows, features)
+    :param lens: sequence lengths
+    :param out: output array, may be X
+    :return: mean removed data matrix
+    """
+    means = segment_mean(X, lens)
+    ids = segment_ids(lens)
+    out = _output(X, out)
+    for start, end in _blocks(len(X)):
+        np.subtract(X[start:end], means[ids[start:end]], out=out[start:end])
+    return out
+
+
+def segment_diff(X, lens, out=None):
+    """
+    first order difference of the rows within each sequence, the first row of a sequence
+    takes the difference of its first two rows so that the sequence lengths are kept
+    :param X: data matrix of shape (rows, features)
+    :param lens: sequence lengths
+    :param out: output array, must not be X
+    :return: difference data matrix
+    """
+    lens = np.asarray(lens).reshape((-1,)).astype(int)
+    out = _output(X, out)
+    if len(X) > 1:
+        np.subtract(X[1:], X[:-1], out=out[1:])
+    starts = segment_starts(lens)
+    # first row of a sequence, its current value is the difference to the previous sequence
+    out[starts[lens > 1]] = out[starts[lens > 1] + 1]
+    out[starts[lens == 1]] = 0
+    return out
+
+
+def row_znorm(X, out=None):
+    """
+    normalizes each row to 0 mean and unit standard deviation
+    :param X: data matrix of shape (rows, features)
+    :param out: output array, may be X
+    :return: normalized data matrix
+    """
+    out = _output(X, out)
+    for start, end in _blocks(len(X)):
+        block = np.subtract(X[start:end], X[start:end].mean(axis=1, keepdims=True), out=out[start:end])
+        block /= block.std(axis=1, keepdims=True)
+    return out
+
+
+def row_minmax(X, out=None):
+    """
+    rescales each row to the range [0, 1]
+    :param X: data matrix of shape (rows, features)
+    :param out: output array, may be X
+    :return: rescaled data matrix
+    """
+    out = _output(X, out)
+    for start, end in _blocks(len(X)):
+        row_min = X[start:end].min(axis=1, keepdims=True)
+        row_range = X[start:end].max(axis=1, keepdims=True) - row_min
+        block = np.subtract(X[start:end], row_min, out=out[start:end])
+        block /= row_range
+    return out
@@ -80,6 +80,51 @@ def append_delta_coeff(A, theta):
     return res
 
 
+def batch_delta_coeff(X, theta, lens=None):
+    """
+    compute delta coefficients for a batch of sequences without scan.
+    Gathers the 2 * theta + 1 neighbouring frames of every time step (replicating the
+    first and last frames of each sequence) and weights them in a single tensordot,
+    giving the same coefficients as delta_coeff.
+    :param X: input sequences in shape (batch_size, time_step, number_of_features)
+    :param theta: window size
+    :param lens: optional sequence lengths of shape (batch_size,), the last valid frame of each
+        sequence is replicated instead of the padding, defaults to the full time_step
+    :return: delta coefficients in shape (batch_size, time_step, number_of_features)
+    """
+    batchsize, steps, features = X.shape[0], X.shape[1], X.shape[2]
+    if lens is None:
+        lens = T.zeros((batchsize,), dtype='int64') + steps
+    offsets = T.arange(-theta, theta + 1, dtype='int64')
+    # weight of each offset, theta * (Y[t + theta] - Y[t - theta]) / (2 * theta * theta)
+    weights = T.switch(T.eq(offsets, 0), 0, 1. / (2 * offsets)).astype(X.dtype)
+
+    # index of every neighbouring frame (batch_size, time_step, 2 * theta + 1) into the flattened batch
+    idxs = T.arange(steps, dtype='int64').dimshuffle('x', 0, 'x') + offsets.dimshuffle('x', 'x', 0)
+    idxs = T.minimum(T.maximum(idxs, 0), (lens - 1).dimshuffle(0, 'x', 'x'))
+    idxs = idxs + (T.arange(batchsize, dtype='int64') * steps).dimshuffle(0, 'x', 'x')
+
+    frames = X.reshape((batchsize * steps, features))[idxs.flatten()]
+    frames = frames.reshape((batchsize, steps, offsets.shape[0], features))
+    return T.tensordot(frames, weights, axes=[[2], [0]])
+
+
+def batch_append_delta_coeff(X, theta, mask=None):
+    """
+    append delta + acceleration coefficients to a batch of sequences.
+    :param X: input sequences in shape (batch_size, time_step, number_of_features)
+    :param theta: window size
+    :param mask: optional mask of shape (batch_size, time_step) marking the valid frames of each sequence
+    :return: delta + acceleration coefficients in shape (batch_size, time_step, 3 * number_of_features)
+    """
+    lens = None
+    if mask is not None:
+        lens = T.sum(mask, axis=1, dtype='int64')
+    delta = batch_delta_coeff(X, theta, lens)
+    acc = batch_delta_coeff(delta, theta, lens)
+    return T.concatenate([X, delta, acc], axis=2)
+
+
 def main():
     """
     test runner, computes delta for an array of sequences
@@ -101,5 +146,8 @@ def main():
     res = compute_deltas(seqs, 1)
     print(res)
 
+    compute_batch_deltas = theano.function([A, theta], outputs=batch_append_delta_coeff(A, theta))
+    assert np.allclose(compute_batch_deltas(seqs, 1), res)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,315 @@
+"""
+parallel hyperparameter sweeps over the ini configs of the runners. A sweep spec expands into
+trials, each trial is the base config with some options replaced, and runs the runner in its own
+process. Trials share the preprocessed data through the memory mapped preprocessing cache and
+are stopped early when their validation cost falls behind the other trials
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import itertools
+import threading
+import subprocess
+import ConfigParser
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+EPOCH_RE = re.compile(r'^Epoch (\d+) train cost = (\S+), val cost = ([^,\s]+)')
+FINAL_RE = re.compile(r'^CR: (\S+), val loss: (\S+), Test CR: (\S+)')
+# sections whose options do not change the preprocessed data
+TRAINING_SECTIONS = ['training', 'lstm_classifier']
+RESULT_FIELDS = ['trial', 'params', 'status', 'epochs', 'best_val_cost', 'cr', 'test_cr', 'time']
+
+
+def load_spec(path):
+    """
+    loads a sweep spec, a json file of the form
+        {"config": "config/bimodal.ini", "runner": "nstream.py", "search": "grid" | "random",
+         "num_trials": 20, "seed": 0,
+         "params": {"training.learning_rate": {"loguniform": [1e-4, 1e-2]},
+                    "lstm_classifier.lstm_size": [250, 450]}}
+    params are keyed by section.option, with a list of values or, for random search, a
+    uniform or loguniform range
+    :param path: spec file
+    :return: spec dict
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    spec.setdefault('runner', 'nstream.py')
+    spec.setdefault('search', 'grid')
+    return spec
+
+
+def expand_grid(params):
+    """
+    :param params: dict of section.option to list of values
+    :return: list of trial params, one per combination of values
+    """
+    keys = sorted(params)
+    for k in keys:
+        if not isinstance(params[k], list):
+            raise ValueError('grid search needs a list of values for {}'.format(k))
+    return [dict(zip(keys, values)) for values in itertools.product(*[params[k] for k in keys])]
+
+
+def sample_random(params, num_trials, seed=None):
+    """
+    :param params: dict of section.option to list of values or {"uniform": [low, high]} or
+        {"loguniform": [low, high]}
+    :param num_trials: number of trials
+    :param seed: random seed
+    :return: list of trial params
+    """
+    rng = random.Random(seed)
+    keys = sorted(params)
+    trials = []
+    for _ in range(num_trials):
+        trial = {}
+        for k in keys:
+            p = params[k]
+            if isinstance(p, list):
+                trial[k] = rng.choice(p)
+            elif 'uniform' in p:
+                trial[k] = rng.uniform(*p['uniform'])
+            elif 'loguniform' in p:
+                low, high = p['loguniform']
+                trial[k] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                raise ValueError('unknown distribution for {}: {}'.format(k, p))
+        trials.append(trial)
+    return trials
+
+
+def expand_trials(spec):
+    """
+    :param spec: sweep spec
+    :return: list of trial params
+    """
+    if spec['search'] == 'grid':
+        return expand_grid(spec['params'])
+    if spec['search'] == 'random':
+        return sample_random(spec['params'], spec['num_trials'], spec.get('seed'))
+    raise ValueError('unknown search {}'.format(spec['search']))
+
+
+def format_params(params):
+    return ' '.join('{}={}'.format(k, params[k]) for k in sorted(params))
+
+
+def write_trial_config(base_config, params, path, cache_dir):
+    """
+    writes the config of a trial, the base config with params replaced and the preprocessing
+    cache set up to be shared between the trials
+    :param base_config: base config file
+    :param params: dict of section.option to value
+    :param path: trial config file
+    :param cache_dir: shared preprocessing cache dir, used if the base config sets none
+    """
+    config = ConfigParser.ConfigParser()
+    config.read(base_config)
+    for k, v in params.items():
+        section, option = k.split('.', 1)
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, str(v))
+    if not config.has_option('training', 'cache_dir'):
+        config.set('training', 'cache_dir', cache_dir)
+    config.set('training', 'cache_mmap', 'true')
+    with open(path, 'w') as f:
+        config.write(f)
+
+
+def parse_epoch(line):
+    """
+    :param line: output line of a runner
+    :return: epoch, train cost, val cost or None if the line is no epoch summary
+    """
+    m = EPOCH_RE.match(line)
+    if m is None:
+        return None
+    return int(m.group(1)), float(m.group(2)), float(m.group(3))
+
+
+def parse_final(line):
+    """
+    :param line: output line of a runner
+    :return: classification rate, val loss, test classification rate or None if the line is no
+        final model summary
+    """
+    m = FINAL_RE.match(line)
+    if m is None:
+        return None
+    return float(m.group(1)), float(m.group(2)), float(m.group(3))
+
+
+class MedianStoppingRule(object):
+    """
+    stops a trial whose best validation cost after an epoch is worse than the median of the best
+    validation costs of the other trials after the same epoch. Thread safe, trials report from
+    the threads that run them
+    """
+    def __init__(self, min_epochs=5, min_trials=2):
+        """
+        :param min_epochs: epochs a trial runs before it can be stopped
+        :param min_trials: number of other trials that must have reached the epoch
+        """
+        self.min_epochs = min_epochs
+        self.min_trials = min_trials
+        self.best = {}  # trial -> best val cost after each epoch
+        self.lock = threading.Lock()
+
+    def report(self, trial, epoch, val_cost):
+        """
+        :param trial: trial id
+        :param epoch: epoch, starting at 1
+        :param val_cost: validation cost of the epoch
+        :return: True if the trial should be stopped
+        """
+        with self.lock:
+            history = self.best.setdefault(trial, [])
+            history.append(min(val_cost, history[-1]) if history else val_cost)
+            if epoch < self.min_epochs:
+                return False
+            others = [h[epoch - 1] for t, h in self.best.items() if t != trial and len(h) >= epoch]
+            if len(others) < self.min_trials:
+                return False
+            return history[epoch - 1] > np.median(others)
+
+
+def run_trial(trial, cmd, cwd, log_path, threads, stopping_rule=None):
+    """
+    runs a trial process and follows its output
+    :param trial: trial id
+    :param cmd: command line of the runner
+    :param cwd: working directory of the runner
+    :param log_path: file receiving the output of the runner
+    :param threads: OMP_NUM_THREADS of the process
+    :param stopping_rule: MedianStoppingRule or None
+    :return: result dict with the RESULT_FIELDS except trial and params
+    """
+    env = dict(os.environ)
+    env['OMP_NUM_THREADS'] = str(threads)
+    env['PYTHONUNBUFFERED'] = '1'
+    result = {'status': 'done', 'epochs': 0, 'best_val_cost': None, 'cr': None, 'test_cr': None}
+    time_start = time.time()
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+        for line in iter(proc.stdout.readline, ''):
+            log.write(line)
+            epoch = parse_epoch(line)
+            if epoch is not None:
+                result['epochs'] = epoch[0]
+                if result['best_val_cost'] is None or epoch[2] < result['best_val_cost']:
+                    result['best_val_cost'] = epoch[2]
+                if stopping_rule is not None and stopping_rule.report(trial, epoch[0], epoch[2]):
+                    log.write('stopped by median stopping rule\n')
+                    result['status'] = 'stopped'
+                    proc.terminate()
+                    break
+            final = parse_final(line)
+            if final is not None:
+                result['cr'], result['best_val_cost'], result['test_cr'] = final
+        proc.stdout.close()
+        if proc.wait() != 0 and result['status'] == 'done':
+            result['status'] = 'failed'
+    result['time'] = time.time() - time_start
+    return result
+
+
+def write_results(results, path):
+    """
+    :param results: list of result dicts with the RESULT_FIELDS
+    :param path: csv file
+    """
+    with open(path, 'wb' if sys.version_info[0] < 3 else 'w') as f:
+        writer = csv.DictWriter(f, RESULT_FIELDS)
+        writer.writeheader()
+        for r in results:
+            writer.writerow(r)
+
+
+def format_results(results):
+    """
+    :param results: list of result dicts with the RESULT_FIELDS
+    :return: table of the results, best validation cost first
+    """
+    def sort_key(r):
+        return (r['status'] == 'failed', r['best_val_cost'] is None, r['best_val_cost'])
+
+    def fmt(v):
+        if v is None:
+            return '-'
+        if isinstance(v, float):
+            return '{:.4f}'.format(v)
+        return str(v)
+
+    rows = [RESULT_FIELDS] + [[fmt(r[k]) for k in RESULT_FIELDS] for r in sorted(results, key=sort_key)]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(RESULT_FIELDS))]
+    return '\n'.join('  '.join(v.ljust(w) for v, w in zip(row, widths)) for row in rows)
+
+
+def run_sweep(spec, out_dir, workers, threads=1, min_epochs=5):
+    """
+    runs all trials of a sweep, writes the trial configs and logs and the results table
+    results.csv to out_dir
+    :param spec: sweep spec, see load_spec
+    :param out_dir: output dir
+    :param workers: number of trials run in parallel
+    :param threads: OMP_NUM_THREADS of each trial
+    :param min_epochs: epochs a trial runs before it can be stopped, 0 disables early stopping
+    :return: list of result dicts
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    out_dir = os.path.abspath(out_dir)
+    base_config = os.path.abspath(spec['config'])
+    runner = os.path.abspath(spec['runner'])
+    trials = expand_trials(spec)
+    cache_dir = os.path.join(out_dir, 'cache')
+
+    configs = []
+    for i, params in enumerate(trials):
+        path = os.path.join(out_dir, 'trial{}.ini'.format(i))
+        write_trial_config(base_config, params, path, cache_dir)
+        configs.append(path)
+
+    def command(config, *args):
+        return [sys.executable, runner, '--config', config] + list(args)
+
+    pool = ThreadPool(workers)
+
+    # fill the cache once for every distinct preprocessing, so trials load it instead of racing to compute it
+    warmup = {}
+    for i, params in enumerate(trials):
+        key = tuple(sorted((k, params[k]) for k in params if k.split('.', 1)[0] not in TRAINING_SECTIONS))
+        warmup.setdefault(key, i)
+    print('preprocessing data for {} trials...'.format(len(warmup)))
+    pool.map(lambda i: run_trial(i, command(configs[i], '--preprocess_only'), os.path.dirname(runner),
+                                 os.path.join(out_dir, 'trial{}.preprocess.log'.format(i)), threads),
+             sorted(warmup.values()))
+
+    stopping_rule = MedianStoppingRule(min_epochs) if min_epochs > 0 else None
+
+    def run(i):
+        result = run_trial(i, command(configs[i]), os.path.dirname(runner),
+                           os.path.join(out_dir, 'trial{}.log'.format(i)), threads, stopping_rule)
+        result['trial'] = i
+        result['params'] = format_params(trials[i])
+        print('trial {} {} after {} epochs: {}'.format(i, result['status'], result['epochs'], result['params']))
+        return result
+
+    print('running {} trials with {} workers...'.format(len(trials), workers))
+    results = sorted(pool.map(run, range(len(trials))), key=lambda r: r['trial'])
+    pool.close()
+    pool.join()
+
+    write_results(results, os.path.join(out_dir, 'results.csv'))
+    print(format_results(results))
+    return results